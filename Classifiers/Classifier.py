@@ -1,9 +1,13 @@
 """
 Base class for classifiers
 """
-import sys, os, copy, types, subprocess, atexit, shutil
+import sys, os, copy, types, subprocess, atexit, shutil, tempfile
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
 import Utils.Parameters as Parameters
+import Core.ExampleUtils as ExampleUtils
+
+SVMLIGHT_TEMP_SUFFIX = "-svmlight-temp"
+_svmLightUsers = {} # converted example file:number of users in this process
 
 def removeTempUnzipped(filename):
     if os.path.exists(filename):
@@ -11,6 +15,10 @@ def removeTempUnzipped(filename):
         if count == 0:
             os.remove(filename)
 
+def removeTempSVMLight(filename):
+    if Classifier.isOwnSVMLight(filename) and os.path.exists(filename):
+        os.remove(filename)
+
 class Classifier():
     # Public interface ##########################################################################
     def __init__(self, connection=None):
@@ -66,6 +74,52 @@ class Classifier():
             atexit.register(removeTempUnzipped, tempfilename) # mark for deletion
         return tempfilename
     
+    @classmethod
+    def getSVMLight(cls, filename):
+        """
+        Temporarily convert a binary example file into the SVM-light text format used by
+        the external classifier programs, adding a user to the converted file. As with 
+        getUnzipped, the converted file appears in the same location as the original file.
+        Each process makes its own converted file, which is reused until the original changes
+        and deleted by releaseFile when it has no more users.
+        """
+        if not ExampleUtils.isBinaryExampleFile(filename):
+            return filename
+        tempfilename = filename + SVMLIGHT_TEMP_SUFFIX + "-" + str(os.getpid())
+        if (not os.path.exists(tempfilename)) or os.path.getmtime(filename) > os.path.getmtime(tempfilename):
+            handle, partial = tempfile.mkstemp(prefix=os.path.basename(tempfilename) + "-", dir=os.path.dirname(tempfilename))
+            os.close(handle)
+            ExampleUtils.convertExamples(filename, partial)
+            os.rename(partial, tempfilename) # the converted file is never seen half-written
+            if tempfilename not in _svmLightUsers:
+                atexit.register(removeTempSVMLight, tempfilename) # mark for deletion
+        _svmLightUsers[tempfilename] = _svmLightUsers.get(tempfilename, 0) + 1
+        return tempfilename
+    
+    @classmethod
+    def isOwnSVMLight(cls, filename):
+        """
+        Is the file converted by getSVMLight in the current process (and not e.g. in the parent of a forked process)
+        """
+        return filename.endswith(SVMLIGHT_TEMP_SUFFIX + "-" + str(os.getpid()))
+    
+    @classmethod
+    def releaseFile(cls, filename):
+        """
+        Remove a user from a temporary file. A converted example file is deleted when
+        it has no more users, as it can be large and is cheap to make again.
+        """
+        if filename == None:
+            return None
+        if filename in _svmLightUsers and cls.isOwnSVMLight(filename):
+            _svmLightUsers[filename] -= 1
+            count = _svmLightUsers[filename]
+            if count <= 0:
+                del _svmLightUsers[filename]
+                removeTempSVMLight(filename)
+            return count
+        return cls.getFileCounter(filename, add=-1, createIfNotExist=False)
+    
     @classmethod
     def getFileCounter(cls, filename, add=0, createIfNotExist=False, removeIfZero=False):
         """
@@ -104,9 +158,13 @@ class Classifier():
         else:
             examplesPath = os.path.normpath(os.path.abspath(examples))
        
+        if ExampleUtils.isBinaryExampleFile(examplesPath): # external programs need the SVM-light format
+            examplesPath = Classifier.getSVMLight(examplesPath) # adds a user to the converted file
         localPath = examplesPath
         if upload:
             examplesPath = self.connection.upload(examplesPath, uncompress=True, replace=replaceRemote)
+            if examplesPath != localPath and Classifier.isOwnSVMLight(localPath): # the converted file was only needed for the upload
+                Classifier.releaseFile(localPath)
         if examplesPath == localPath and examplesPath.endswith(".gz"): # no upload happened
             examplesPath = Classifier.getUnzipped(examplesPath) # uncompress if not yet uncompressed
             Classifier.getFileCounter(examplesPath, 1, createIfNotExist=True) # increase user counter in any case
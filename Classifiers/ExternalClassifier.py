@@ -58,7 +58,7 @@ class ExternalClassifier(Classifier):
             self.state = None
             self._job = None
             for filename in self._filesToRelease:
-                ExternalClassifier.getFileCounter(filename, add=-1, createIfNotExist=False)
+                ExternalClassifier.releaseFile(filename)
             self._filesToRelease = []
         if self._prevJobStatus == None:
             return "FINISHED"
@@ -78,6 +78,7 @@ class KerasClassifier(Classifier):
         numFeatures = self.kerasModel.layers[0].get_input_shape_at(0)[1]
         
         features, classes = datasets.load_svmlight_file(examples, numFeatures)
+        classifier.releaseFiles()
         #features = features.toarray()
         #predictions = self.kerasModel.predict(features, 128, 1)
         predictions = self.kerasModel.predict_generator(predict_batch_generator(features, 1), features.shape[0] / 1)
@@ -88,6 +89,14 @@ class KerasClassifier(Classifier):
             for i in range(predictions.shape[0]):
                 f.write(str(predClasses[i] + 1) + " " + " ".join([str(x) for x in  predictions[i]]) + "\n")                
     
+    def releaseFiles(self):
+        """
+        Release the example files once they have been loaded into memory
+        """
+        for filename in self._filesToRelease:
+            Classifier.releaseFile(filename)
+        self._filesToRelease = []
+    
     def optimize(self, examples, outDir, parameters, classifyExamples, classIds, step="BOTH", evaluator=None, determineThreshold=False, timeout=None, downloadAllModels=False):
         assert step in ["BOTH", "SUBMIT", "RESULTS"], step
         if step == "RESULTS": # Return already
@@ -114,6 +123,7 @@ class KerasClassifier(Classifier):
         trainFeatures, trainClasses = datasets.load_svmlight_file(examples)
         if classifyExamples != None:
             develFeatures, develClasses = datasets.load_svmlight_file(classifyExamples, trainFeatures.shape[1])
+        classifier.releaseFiles()
         binarizer = preprocessing.LabelBinarizer()
         binarizer.fit(trainClasses)
         trainClasses = binarizer.transform(trainClasses)
@@ -0,0 +1,45 @@
+import sys,os
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
+import copy
+import shutil
+from ExternalClassifier import ExternalClassifier
+from SVMMultiClassClassifier import SVMMultiClassClassifier
+import ResidentPredictor
+
+class ResidentClassification:
+    """
+    Classification in the current process for ExternalClassifier subclasses. Models are
+    trained with the external program, but classification uses the models cached by
+    ResidentPredictor, which picks the predictor from the type of the model file.
+    """
+    def classify(self, examples, output, model=None, finishBeforeReturn=False, replaceRemoteFiles=True):
+        if not self.connection.isLocal(): # the model and examples are on a remote machine
+            return ExternalClassifier.classify(self, examples, output, model, finishBeforeReturn, replaceRemoteFiles)
+        output = os.path.abspath(output)
+        # Return a new classifier instance for following the classification, as in ExternalClassifier
+        classifier = copy.copy(self)
+        classifier.setState("CLASSIFY")
+        if model == None:
+            classifier.model = model = self.model
+        model = os.path.abspath(model)
+        classifier.predictions = output
+        print >> sys.stderr, "Classifying", examples, "in-process with model", model
+        ResidentPredictor.classify(examples, model, output)
+        return classifier
+
+class ResidentClassifier(ResidentClassification, SVMMultiClassClassifier):
+    """
+    An SVM-multiclass classifier that classifies in the current process. Models are
+    trained with svm_multiclass_learn, but classification uses models cached by
+    ResidentPredictor instead of launching svm_multiclass_classify for every call.
+    The sparse weight matrix of a linear model is saved into the TEES model next to 
+    the classifier model. For scikit-learn models use ResidentScikitClassifier.
+    """
+    
+    def saveModel(self, teesModel, tag=""):
+        SVMMultiClassClassifier.saveModel(self, teesModel, tag)
+        if hasattr(self, "model") and self.model != None and os.path.exists(self.model) and ResidentPredictor.scipyAvailable and ResidentPredictor.isSVMMultiClassModel(self.model):
+            weightsPath = self.model + ResidentPredictor.WEIGHTS_SUFFIX
+            ResidentPredictor.getPredictor(self.model) # builds the weights file if it doesn't exist
+            if os.path.exists(weightsPath):
+                shutil.copy2(weightsPath, teesModel.get(tag+"classifier-model"+ResidentPredictor.WEIGHTS_SUFFIX, True))
@@ -0,0 +1,282 @@
+"""
+In-process prediction with classifier models that are loaded only once.
+
+Linear SVM-multiclass models and pickled scikit-learn models are kept in a cache
+keyed by the model path, so repeated classifications with the same model (e.g.
+during a parameter grid search) don't relaunch an external program or reload
+the model. The predictions are written in the same format as the external
+classifier programs produce.
+
+When SciPy is available, a linear SVM-multiclass model is converted once into a
+sparse feature-by-class weight matrix, which is stored next to the model file
+(WEIGHTS_SUFFIX) and examples are scored in batches by sparse matrix products.
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
+import gzip
+import itertools
+import types
+import hashlib
+from array import array
+import Core.ExampleUtils as ExampleUtils
+try:
+    import numpy
+    from scipy.sparse import csr_matrix
+    scipyAvailable = True
+except:
+    scipyAvailable = False
+
+_predictors = {} # model path -> (modification time, predictor)
+WEIGHTS_SUFFIX = ".weights"
+BATCH_SIZE = 10000 # examples per sparse matrix product
+
+def _float32(values):
+    # SVM-light stores weights and feature values as single precision floats
+    return array("f", values).tolist()
+
+class SVMMultiClassPredictor():
+    """
+    Scores examples with a linear kernel SVM-multiclass model the same way
+    svm_multiclass_classify does.
+    """
+    def __init__(self, modelPath):
+        self.numClasses = None
+        self.numFeatures = None
+        self.threshold = 0.0
+        self.weights = {} # feature id -> list of (class index, weight) tuples
+        self.matrix = None # sparse (feature id, class index) weight matrix
+        if scipyAvailable:
+            weightsPath = modelPath + WEIGHTS_SUFFIX
+            modelKey = getModelKey(modelPath)
+            if not self.loadWeights(weightsPath, modelKey):
+                self.load(modelPath)
+                self.buildMatrix()
+                try:
+                    self.saveWeights(weightsPath, modelKey)
+                except IOError: # e.g. a read-only model location
+                    print >> sys.stderr, "Could not save linear weights to", weightsPath
+        else:
+            self.load(modelPath)
+
+    def load(self, modelPath):
+        if modelPath.endswith(".gz"):
+            f = gzip.open(modelPath, "rt")
+        else:
+            f = open(modelPath, "rt")
+        linearWeights = {}
+        supportVectors = False
+        for line in f:
+            if not supportVectors:
+                if line.find("kernel type") != -1:
+                    assert int(line.split("#")[0]) == 0, "Only linear SVM-multiclass models can be used in-process"
+                elif line.find("number of classes") != -1:
+                    self.numClasses = int(line.split("#")[0])
+                elif line.find("number of base features") != -1:
+                    self.numFeatures = int(line.split("#")[0])
+                elif line.find("threshold b") != -1:
+                    self.threshold = float(line.split("#")[0])
+                    supportVectors = True
+                continue
+            # Sum the support vectors into the linear weight vector
+            tokens = line.rsplit("#",1)[0].split()
+            if len(tokens) == 0:
+                continue
+            alpha = float(tokens[0])
+            pairs = [x.split(":") for x in tokens[1:] if not x.startswith("qid:")]
+            values = _float32([float(x[1]) for x in pairs])
+            for pair, value in zip(pairs, values):
+                index = int(pair[0])
+                linearWeights[index] = linearWeights.get(index, 0.0) + alpha * value
+        f.close()
+        assert self.numClasses != None and self.numFeatures != None, modelPath
+        # Split the joint weight vector into the per-class blocks
+        for index in sorted(linearWeights.keys()):
+            classIndex, featureId = divmod(index - 1, self.numFeatures)
+            if featureId + 1 not in self.weights:
+                self.weights[featureId + 1] = []
+            self.weights[featureId + 1].append( (classIndex, linearWeights[index]) )
+
+    def buildMatrix(self):
+        """
+        Convert the per-feature weight lists into a sparse matrix with one row per feature id
+        """
+        data, indices, indptr = [], [], [0]
+        for featureId in range(self.numFeatures + 1):
+            if featureId in self.weights:
+                for classIndex, weight in self.weights[featureId]:
+                    indices.append(classIndex)
+                    data.append(weight)
+            indptr.append(len(indices))
+        self.matrix = csr_matrix((numpy.array(data, dtype=numpy.float64), indices, indptr), shape=(self.numFeatures + 1, self.numClasses))
+        self.weights = {}
+    
+    def saveWeights(self, path, modelKey):
+        f = open(path, "wb")
+        numpy.savez(f, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr, 
+                    header=numpy.array([self.numClasses, self.numFeatures]), threshold=numpy.array([self.threshold]), 
+                    key=numpy.array([modelKey]))
+        f.close()
+    
+    def loadWeights(self, path, modelKey):
+        """
+        Load the weight matrix saved for a model, if it exists and was built from the same model file
+        """
+        if not os.path.exists(path):
+            return False
+        f = open(path, "rb")
+        arrays = numpy.load(f)
+        if str(arrays["key"][0]) != modelKey:
+            f.close()
+            return False
+        self.numClasses, self.numFeatures = [int(x) for x in arrays["header"]]
+        self.threshold = float(arrays["threshold"][0])
+        self.matrix = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=(self.numFeatures + 1, self.numClasses))
+        f.close()
+        return True
+    
+    def scoreBatch(self, examples):
+        """
+        Return the class scores of examples as a matrix with one row per example
+        """
+        indices, values, indptr = array("i"), array("f"), array("i", [0]) # SVM-light feature values are single precision floats
+        for example in examples:
+            indices.extend(example[2].iterkeys())
+            values.extend(example[2].itervalues())
+            indptr.append(len(indices))
+        indices = numpy.frombuffer(indices, dtype=numpy.int32)
+        values = numpy.frombuffer(values, dtype=numpy.float32).astype(numpy.float64)
+        # Features not seen in training have no weights, row 0 of the weight matrix is empty
+        unseen = indices > self.numFeatures
+        if unseen.any():
+            indices = numpy.where(unseen, 0, indices)
+        X = csr_matrix((values, indices, numpy.frombuffer(indptr, dtype=numpy.int32)), shape=(len(indptr) - 1, self.numFeatures + 1))
+        X.sort_indices() # rows are summed in feature order, as in the per-feature loop
+        return (X * self.matrix).toarray() - self.threshold
+    
+    def score(self, features):
+        if self.matrix is not None:
+            return self.scoreBatch([(None, None, features)])[0].tolist()
+        scores = [0.0] * self.numClasses
+        weights = self.weights
+        keys = sorted(features.keys())
+        values = _float32([features[x] for x in keys])
+        for featureId, value in zip(keys, values):
+            if featureId in weights: # features not seen in training have no weights
+                for classIndex, weight in weights[featureId]:
+                    scores[classIndex] += weight * value
+        return [x - self.threshold for x in scores]
+
+    def predict(self, examples):
+        if self.matrix is not None:
+            for line in self.predictBatches(examples):
+                yield line
+            return
+        for example in examples:
+            scores = self.score(example[2])
+            best = 0
+            for i in range(1, len(scores)):
+                if scores[i] > scores[best]:
+                    best = i
+            yield str(best + 1) + "".join([" %f" % x for x in scores])
+    
+    def predictBatches(self, examples, batchSize=BATCH_SIZE):
+        examples = iter(examples)
+        while True:
+            batch = list(itertools.islice(examples, batchSize))
+            if len(batch) == 0:
+                break
+            scores = self.scoreBatch(batch)
+            for best, row in zip(numpy.argmax(scores, axis=1).tolist(), scores.tolist()):
+                yield str(best + 1) + "".join([" %f" % x for x in row])
+
+class ScikitPredictor():
+    """
+    Scores examples with a scikit-learn model trained by ScikitWrapper.
+    """
+    def __init__(self, modelPath):
+        import ScikitWrapper
+        self.clf = ScikitWrapper.loadClf(modelPath)
+
+    def predict(self, examples):
+        from scipy.sparse import csr_matrix
+        import ScikitWrapper
+        numFeatures = self.clf.teesFeatureCount
+        data, indices, indptr = [], [], [0]
+        for example in examples:
+            for featureId in sorted(example[2].keys()):
+                if featureId <= numFeatures: # as in load_svmlight_file, ids are one-based
+                    indices.append(featureId - 1)
+                    data.append(example[2][featureId])
+            indptr.append(len(indices))
+        X = csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, numFeatures))
+        for line in ScikitWrapper.predict(self.clf, X):
+            yield line
+
+def getModelKey(modelPath):
+    """
+    Identify a model file by its content, since extracting it from a model archive changes its modification time
+    """
+    md5 = hashlib.md5()
+    f = open(modelPath, "rb")
+    for chunk in iter(lambda: f.read(1 << 20), ""):
+        md5.update(chunk)
+    f.close()
+    return md5.hexdigest()
+
+def isSVMMultiClassModel(modelPath):
+    if modelPath.endswith(".gz"):
+        f = gzip.open(modelPath, "rt")
+    else:
+        f = open(modelPath, "rb")
+    header = f.read(14)
+    f.close()
+    return header == "SVM-multiclass"
+
+def getPredictor(modelPath):
+    """
+    Return the predictor for a model file, loading it only if it is not already
+    cached or if the file has changed since it was loaded.
+    """
+    modelPath = os.path.abspath(modelPath)
+    mtime = os.path.getmtime(modelPath)
+    if modelPath in _predictors and _predictors[modelPath][0] == mtime:
+        return _predictors[modelPath][1]
+    print >> sys.stderr, "Loading classifier model", modelPath
+    if isSVMMultiClassModel(modelPath):
+        predictor = SVMMultiClassPredictor(modelPath)
+    else:
+        predictor = ScikitPredictor(modelPath)
+    _predictors[modelPath] = (mtime, predictor)
+    return predictor
+
+def clearCache():
+    _predictors.clear()
+
+def classify(examples, modelPath, output):
+    """
+    Classify examples (an example file or a list of examples) and write the
+    predictions to the output file.
+    """
+    predictor = getPredictor(modelPath)
+    if type(examples) in types.StringTypes:
+        examples = ExampleUtils.readExamples(examples)
+    if output.endswith(".gz"):
+        f = gzip.open(output, "wt")
+    else:
+        f = open(output, "wt")
+    count = 0
+    for line in predictor.predict(examples):
+        f.write(line + "\n")
+        count += 1
+    f.close()
+    return count
+
+if __name__=="__main__":
+    from optparse import OptionParser
+    optparser = OptionParser(description="In-process classification with SVM-multiclass or scikit-learn models")
+    optparser.add_option("-e", "--examples", default=None, dest="examples", help="Example file")
+    optparser.add_option("-m", "--model", default=None, dest="model", help="Model file")
+    optparser.add_option("-o", "--output", default=None, dest="output", help="Predictions file")
+    (options, args) = optparser.parse_args()
+
+    print >> sys.stderr, "Classified", classify(options.examples, options.model, options.output), "examples"
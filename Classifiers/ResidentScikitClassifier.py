@@ -0,0 +1,12 @@
+import sys,os
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
+from ScikitClassifier import ScikitClassifier
+from ResidentClassifier import ResidentClassification
+
+class ResidentScikitClassifier(ResidentClassification, ScikitClassifier):
+    """
+    A scikit-learn classifier that classifies in the current process. Models are trained
+    with ScikitWrapper, but classification uses the unpickled models cached by 
+    ResidentPredictor instead of launching ScikitWrapper for every call.
+    """
+    pass
@@ -59,20 +59,24 @@ def classify():
     print >> sys.stderr, "Classifying files", files
     X_train, y_train = load_svmlight_file(files["examples"], clf.teesFeatureCount)
     out = open(files["predictions"], "wt")
+    for line in predict(clf, X_train):
+        out.write(line + "\n")
+    out.close()
+
+def predict(clf, X):
     if clf.teesProba or hasattr(clf, "decision_function"):
         if clf.teesProba:
-            predictions = clf.predict_proba(X_train)
+            predictions = clf.predict_proba(X)
         else:
-            predictions = clf.decision_function(X_train)
+            predictions = clf.decision_function(X)
         for prediction in predictions:
             classMax = prediction.argmax() + 1
-            out.write(str(classMax) + " " + str(" ".join([str(x) for x in prediction])) + "\n")
+            yield str(classMax) + " " + str(" ".join([str(x) for x in prediction]))
             #except: # single value
             #    out.write(str(classMax) + " " + str(-prediction) + " " + str(prediction) + "\n")
     else:
-        for prediction in clf.predict(X_train):
-            out.write(str(int(prediction)) + "\n")        
-    out.close()
+        for prediction in clf.predict(X):
+            yield str(int(prediction))
 
 def getParameters(requireWrapperParams=None):
     params = {}
@@ -8,6 +8,12 @@ class is an int (-1 or +1 for binary) and features is a dictionary of int:float
 the int is the feature id and the float is the feature value.
 Extra is a dictionary of String:String pairs, for additional information about the 
 examples.
+
+Example files are by default in the gzip-compressed SVM-light text format. Optionally,
+examples can be stored in a binary block format (files ending in BINARY_SUFFIX), where
+each block holds compressed columnar arrays (classes, CSR feature indices and values
+and a string table for the ids and extra attributes). readExamples detects the format
+automatically.
 """
 
 import sys, os, itertools
@@ -26,6 +32,22 @@ import gzip
 #    import cElementTree as ET
 #import Utils.ElementTreeUtils as ETUtils
 import RecallAdjust
+import struct
+import zlib
+import time
+import warnings
+from array import array
+try:
+    import numpy
+    numpy.array([])
+    numpyAvailable = True
+except:
+    numpyAvailable = False
+
+BINARY_MAGIC = "TEESEXB1"
+BINARY_SUFFIX = ".bin"
+BINARY_BLOCK_SIZE = 10000
+PREDICTION_BLOCK_SIZE = 100000 # lines per NumPy prediction block
 
 def gen2iterable(genfunc):
     """
@@ -78,6 +100,8 @@ def copyExamples(examples):
     return examplesCopy
 
 def appendExamples(examples, file):
+    if isinstance(file, BinaryExampleWriter):
+        return file.append(examples)
     noneClassCount = 0
     for example in examples:
         # None-value as a class indicates a class that did not match an existing id,
@@ -126,7 +150,200 @@ def appendExamplesBinary(examples, file):
         #        file.write( " " + str(extraKey) + ":" + extraValue)
         #file.write("\n")
 
+def getExampleComment(example):
+    """
+    The id and string-valued extra attributes in the comment format of the example files
+    """
+    comment = "id:" + example[0]
+    for extraKey, extraValue in example[3].iteritems():
+        assert(extraKey != "id") # id must be defined as example[0]
+        if type(extraValue) in types.StringTypes:
+            comment += " " + str(extraKey) + ":" + extraValue
+    return comment
+
+def parseExampleComment(comment):
+    id = None
+    extra = {}
+    for commentSplit in comment.split():
+        key, value = commentSplit.split(":", 1)
+        if key == "id":
+            id = value
+        else:
+            extra[key] = value
+    return id, extra
+
+def _arrayToString(a):
+    if sys.byteorder != "little": # the binary format is little-endian
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tostring()
+
+def _arrayFromString(typecode, s):
+    a = array(typecode)
+    a.fromstring(s)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+class BinaryExampleWriter():
+    """
+    Writes examples into the binary block format. Examples are buffered and written in
+    compressed blocks of columnar arrays. The block index (file offset, byte length and 
+    example count for each block) is written at the end of the file when the writer is
+    closed, followed by the index offset and the format identifier. In append mode new
+    blocks replace the block index of an existing file.
+    """
+    def __init__(self, filename, append=False, blockSize=BINARY_BLOCK_SIZE):
+        self.blockSize = blockSize
+        self.blocks = []
+        self._buffer = []
+        self.noneClassCount = 0
+        if append and os.path.exists(filename):
+            self.blocks = readBinaryBlockIndex(filename)
+            self.file = open(filename, "r+b")
+            self.file.seek(readBinaryFooter(filename)[0])
+            self.file.truncate()
+        else:
+            self.file = open(filename, "wb")
+            self.file.write(BINARY_MAGIC)
+    
+    def append(self, examples):
+        for example in examples:
+            # See appendExamples for examples with a None class
+            if example[1] == None:
+                self.noneClassCount += 1
+                continue
+            self._buffer.append(example)
+            if len(self._buffer) >= self.blockSize:
+                self.flush()
+    
+    def flush(self):
+        if len(self._buffer) == 0:
+            return
+        classes = array("i")
+        indptr = array("i", [0])
+        indices = array("i")
+        values = array("d")
+        strings = []
+        for example in self._buffer:
+            classes.append(example[1])
+            keys = sorted([x for x in example[2].keys() if x != None])
+            for key in keys:
+                indices.append(key)
+                values.append(example[2][key])
+            indptr.append(len(indices))
+            strings.append(getExampleComment(example))
+        columns = [_arrayToString(classes), _arrayToString(indptr), _arrayToString(indices), 
+                   _arrayToString(values), "\n".join(strings)]
+        data = zlib.compress(struct.pack("<5I", *[len(x) for x in columns]) + "".join(columns))
+        self.blocks.append( (self.file.tell(), len(data), len(self._buffer)) )
+        self.file.write(data)
+        self._buffer = []
+    
+    def close(self):
+        self.flush()
+        indexOffset = self.file.tell()
+        self.file.write(struct.pack("<I", len(self.blocks)))
+        for block in self.blocks:
+            self.file.write(struct.pack("<QII", *block))
+        self.file.write(struct.pack("<Q", indexOffset) + BINARY_MAGIC)
+        self.file.close()
+        if self.noneClassCount != 0:
+            print >> sys.stderr, "Warning,", self.noneClassCount, "examples had an undefined class."
+
+def isBinaryExampleFile(filename):
+    if not os.path.isfile(filename):
+        return False
+    f = open(filename, "rb")
+    magic = f.read(len(BINARY_MAGIC))
+    f.close()
+    return magic == BINARY_MAGIC
+
+def openExampleFile(filename, append=False):
+    """
+    Open an example file for appendExamples. The format is determined by the filename.
+    """
+    if filename.endswith(BINARY_SUFFIX):
+        return BinaryExampleWriter(filename, append)
+    openStyle = "at" if append else "wt"
+    if filename.endswith(".gz"):
+        return gzip.open(filename, openStyle)
+    else:
+        return open(filename, openStyle)
+
+def readBinaryFooter(filename):
+    f = open(filename, "rb")
+    f.seek(-(8 + len(BINARY_MAGIC)), 2)
+    footer = f.read()
+    f.close()
+    assert footer[8:] == BINARY_MAGIC, "Incomplete binary example file " + filename
+    return struct.unpack("<Q", footer[:8])
+
+def readBinaryBlockIndex(filename):
+    """
+    Returns a list of (offset, length, example count) tuples for the blocks of a binary example file
+    """
+    f = open(filename, "rb")
+    f.seek(readBinaryFooter(filename)[0])
+    numBlocks = struct.unpack("<I", f.read(4))[0]
+    blocks = [struct.unpack("<QII", f.read(16)) for i in range(numBlocks)]
+    f.close()
+    return blocks
+
+def readBinaryBlock(f, block, readFeatures=True):
+    f.seek(block[0])
+    data = zlib.decompress(f.read(block[1]))
+    lengths = struct.unpack("<5I", data[:20])
+    columns = []
+    pos = 20
+    for length in lengths:
+        columns.append(data[pos:pos+length])
+        pos += length
+    classes = _arrayFromString("i", columns[0])
+    strings = columns[4].split("\n")
+    if readFeatures:
+        indptr = _arrayFromString("i", columns[1])
+        indices = _arrayFromString("i", columns[2])
+        values = _arrayFromString("d", columns[3])
+    examples = []
+    for i in range(block[2]):
+        id, extra = parseExampleComment(strings[i])
+        features = {}
+        if readFeatures:
+            features = dict(itertools.izip(indices[indptr[i]:indptr[i+1]], values[indptr[i]:indptr[i+1]]))
+        examples.append([id, classes[i], features, extra])
+    return examples
+
+@gen2iterable
+def readExamplesBinary(filename, readFeatures=True):
+    blocks = readBinaryBlockIndex(filename)
+    f = open(filename, "rb")
+    for block in blocks:
+        for example in readBinaryBlock(f, block, readFeatures):
+            yield example
+    f.close()
+
+def convertExamples(input, output):
+    """
+    Convert an example file between the SVM-light text and binary formats. The
+    output format is determined by the output filename.
+    """
+    print >> sys.stderr, "Converting examples", input, "to", output
+    outfile = openExampleFile(output)
+    count = 0
+    for example in readExamples(input):
+        appendExamples([example], outfile)
+        count += 1
+    outfile.close()
+    print >> sys.stderr, "Converted", count, "examples"
+    return output
+
 def writeExamples(examples, filename, commentLines=None):
+    if filename.endswith(BINARY_SUFFIX):
+        f = BinaryExampleWriter(filename)
+        appendExamples(examples, f)
+        f.close()
+        return
     if filename.endswith(".gz"):
         f = gzip.open(filename,"wt")
     else:
@@ -151,6 +368,8 @@ def writePredictions(predictions, exampleFileName):
             pass
 
 def getIdsFromFile(filename):
+    if isBinaryExampleFile(filename):
+        return [getExampleComment(x) for x in readExamplesBinary(filename, False)]
     if filename.endswith(".gz"):
         f = gzip.open(filename,"rt")
     else:
@@ -165,6 +384,10 @@ def getIdsFromFile(filename):
 
 @gen2iterable
 def readExamples(filename, readFeatures=True):
+    if isBinaryExampleFile(filename):
+        for example in readExamplesBinary(filename, readFeatures):
+            yield example
+        return
     if filename.endswith(".gz"):
         f = gzip.open(filename,"rt")
     else:
@@ -291,19 +514,241 @@ def divideExampleFile(exampleFileName, division, outputDir):
 #    #finally:
 #    f.close()
 
-@gen2iterable        
-def loadPredictions(predictionsFile, recallAdjust=None, classRanges=None, threshold=None):
+def _adjustPrediction(pred, recallAdjust=None, classRanges=None, threshold=None):
+    # Recall adjust
+    if recallAdjust != None and recallAdjust != 1.0:
+        if classRanges == None:
+            pred[1] = RecallAdjust.scaleVal(pred[1], recallAdjust)
+        else: # SVM multiclass two class "binary" classification 
+            pred[1] = RecallAdjust.scaleRange(pred[1], recallAdjust, classRanges[1])
+        #if pred[0] == 1:
+        maxStrength = pred[1]
+        pred[0] = 1
+        for i in range(2, len(pred)):
+            if pred[i] > maxStrength:
+                maxStrength = pred[i]
+                pred[0] = i
+    # Thresholding
+    if threshold != None:
+        if pred[1] > threshold:
+            pred[0] = 1
+        else:
+            maxStrength = pred[2]
+            pred[0] = 2
+            for i in range(2, len(pred)):
+                if pred[i] > maxStrength:
+                    maxStrength = pred[i]
+                    pred[0] = i
+
+def adjustPredictionMatrix(matrix, recallAdjust=None, classRanges=None, threshold=None):
+    """
+    Apply recall adjustment and thresholding in place to a NumPy prediction matrix, 
+    with the same result as calling _adjustPrediction for each of its rows.
+    
+    @param matrix: a float matrix with the predicted class in the first column and the class scores in the rest
+    """
+    if recallAdjust != None and recallAdjust != 1.0:
+        scores = matrix[:,1]
+        if classRanges == None: # RecallAdjust.scaleVal
+            negative = scores < 0
+            scores[~negative] *= recallAdjust
+            absolute = numpy.abs(scores[negative])
+            scores[negative] += absolute * recallAdjust - absolute
+        elif recallAdjust < 1.0: # RecallAdjust.scaleRange for SVM multiclass two class "binary" classification
+            mask = (scores > 0) & (scores < (1.0 - recallAdjust) * classRanges[1][1])
+            scores[mask] = -scores[mask] - 1
+        matrix[:,0] = numpy.argmax(matrix[:,1:], axis=1) + 1
+    if threshold != None:
+        matrix[:,0] = numpy.where(matrix[:,1] > threshold, 1, numpy.argmax(matrix[:,2:], axis=1) + 2)
+    return matrix
+
+def adjustPredictions(predictions, recallAdjust=None, threshold=None):
+    """
+    Apply recall adjustment and thresholding to predictions that were loaded without them, 
+    with the same result as calling loadPredictions with these settings. This way the predictions
+    can be loaded once and reused for several recall adjustment values.
+    
+    @param predictions: a matrix from loadPredictionMatrix(predictionsFile) (left unchanged) or a list of predictions from loadPredictions(predictionsFile)
+    @return: a list of predictions as from loadPredictions
+    """
+    if numpyAvailable and isinstance(predictions, numpy.ndarray):
+        if predictions.size == 0:
+            return []
+        matrix = predictions.copy()
+    elif numpyAvailable and len(predictions) > 0 and len(predictions[0]) > 1:
+        matrix = _toPredictionMatrix(predictions)
+    else:
+        matrix = None
+    classRanges = None
+    if matrix is not None:
+        if matrix.shape[1] == 3 and (recallAdjust != None and recallAdjust != 1.0): # SVM multiclass two class "binary" classification
+            classRanges = _getMatrixClassRanges(matrix)
+            threshold = None # loadPredictions doesn't threshold range-adjusted predictions
+        return _fromPredictionMatrix(adjustPredictionMatrix(matrix, recallAdjust, classRanges, threshold))
+    if len(predictions) > 0 and len(predictions[0]) == 3 and (recallAdjust != None and recallAdjust != 1.0): # SVM multiclass two class "binary" classification
+        classRanges = RecallAdjust.getClassRangesFromPredictions(predictions)
+        threshold = None # loadPredictions doesn't threshold range-adjusted predictions
+    adjusted = []
+    for prediction in predictions:
+        if len(prediction) == 1: # true binary
+            assert recallAdjust == None or recallAdjust == 1.0 # not implemented for binary classification
+            adjusted.append(prediction)
+        else:
+            pred = prediction[:]
+            _adjustPrediction(pred, recallAdjust, classRanges, threshold)
+            adjusted.append(pred)
+    return adjusted
+
+def _toPredictionMatrix(predictions):
+    # Multilabel predictions, N/A values and rows of different length can't be stored in a float matrix
+    try:
+        matrix = numpy.array(predictions, dtype=float)
+    except (ValueError, TypeError):
+        return None
+    if matrix.ndim != 2 or matrix.shape[1] < 2:
+        return None
+    return matrix
+
+def _fromPredictionMatrix(matrix):
+    predictions = matrix.tolist()
+    for pred in predictions:
+        pred[0] = int(pred[0])
+    return predictions
+
+def _openPredictions(predictionsFile):
     if predictionsFile.endswith(".gz"):
-        f = gzip.open(predictionsFile,"rt")
+        return gzip.open(predictionsFile,"rt")
     else:
-        f = open(predictionsFile,"rt")
+        return open(predictionsFile,"rt")
+
+def _parsePrediction(splits, recallAdjust=None, classRanges=None, threshold=None):
+    if len(splits) == 1: # true binary
+        assert recallAdjust == None or recallAdjust == 1.0 # not implemented for binary classification
+        return [float(splits[0])]
+    if "," in splits[0]: # multilabel
+        pred = [[]]
+        for value in splits[0].split(","):
+            pred[0].append(int(value))
+    else:
+        pred = [int(splits[0])]
+    for split in splits[1:]:
+        if split != "N/A":
+            split = float(split)
+        pred.append(split)
+    _adjustPrediction(pred, recallAdjust, classRanges, threshold)
+    return pred
+
+def parsePredictionMatrix(lines):
+    """
+    Parse a block of prediction file lines into a NumPy matrix with the predicted class in the 
+    first column and the class scores in the rest. Returns None if the lines are not multiclass
+    predictions of equal length (true binary, multilabel or N/A values, or rows with a different
+    number of columns).
+    """
+    if len(lines) == 0:
+        return None
+    numColumns = len(lines[0].split())
+    text = "".join(lines)
+    if numColumns < 2 or "," in text or "N/A" in text:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # a malformed block is detected from the number of values
+        values = numpy.fromstring(text, sep=" ")
+    if values.size != numColumns * len(lines):
+        return None
+    # Rows of different length can still add up to the expected number of values
+    chars = numpy.frombuffer(text, dtype=numpy.uint8)
+    isSpace = (chars == ord(" ")) | (chars == ord("\t")) | (chars == ord("\n")) | (chars == ord("\r"))
+    valueStarts = ~isSpace & numpy.concatenate(([True], isSpace[:-1]))
+    lineIndices = numpy.cumsum(chars == ord("\n"))
+    if (numpy.bincount(lineIndices[valueStarts], minlength=len(lines)) != numColumns).any():
+        return None
+    return values.reshape((len(lines), numColumns))
+
+def _readPredictionLines(predictionsFile, blockSize):
+    f = _openPredictions(predictionsFile)
+    while True:
+        lines = list(itertools.islice(f, blockSize))
+        if len(lines) == 0:
+            break
+        yield lines
+    f.close()
+
+def _getMatrixClassRanges(matrix):
+    return dict([(cls, [matrix[:,cls].min(), matrix[:,cls].max()]) for cls in (1, 2)])
+
+def _getPredictionClassRanges(predictionsFile, blockSize):
+    classRanges = {1:[sys.maxint,-sys.maxint], 2:[sys.maxint,-sys.maxint]}
+    for lines in _readPredictionLines(predictionsFile, blockSize):
+        matrix = parsePredictionMatrix(lines)
+        if matrix is None:
+            blockRanges = RecallAdjust.getClassRangesFromPredictions([line.split() for line in lines])
+        else:
+            blockRanges = _getMatrixClassRanges(matrix)
+        for cls in (1, 2):
+            classRanges[cls][0] = min(float(blockRanges[cls][0]), classRanges[cls][0])
+            classRanges[cls][1] = max(float(blockRanges[cls][1]), classRanges[cls][1])
+    return classRanges
+
+def _loadPredictionBlocks(predictionsFile, recallAdjust, classRanges, threshold, blockSize):
+    """
+    Yield (matrix, predictions) pairs for each block of lines. Blocks that can't be stored 
+    as a matrix are parsed line by line into the predictions list.
+    """
+    if (recallAdjust != None and recallAdjust != 1.0) and classRanges == None:
+        f = _openPredictions(predictionsFile)
+        firstLine = f.readline()
+        f.close()
+        if len(firstLine.split()) == 3: # SVM multiclass two class "binary" classification
+            classRanges = _getPredictionClassRanges(predictionsFile, blockSize)
+            threshold = None # range-adjusted predictions are not thresholded
+    for lines in _readPredictionLines(predictionsFile, blockSize):
+        matrix = parsePredictionMatrix(lines)
+        if matrix is None:
+            yield None, [_parsePrediction(line.split(), recallAdjust, classRanges, threshold) for line in lines]
+        else:
+            yield adjustPredictionMatrix(matrix, recallAdjust, classRanges, threshold), None
+
+def loadPredictionBlocks(predictionsFile, recallAdjust=None, classRanges=None, threshold=None, blockSize=PREDICTION_BLOCK_SIZE):
+    """
+    Load a predictions file as NumPy matrices of at most blockSize rows, with the predicted 
+    class in the first column and the class scores in the rest. Recall adjustment and 
+    thresholding are applied as in loadPredictions. Raises ValueError for predictions that can't 
+    be stored as a matrix (true binary, multilabel or N/A values).
+    """
+    for matrix, predictions in _loadPredictionBlocks(predictionsFile, recallAdjust, classRanges, threshold, blockSize):
+        if matrix is None:
+            raise ValueError("Predictions in " + str(predictionsFile) + " can't be loaded as a matrix")
+        yield matrix
+
+def loadPredictionMatrix(predictionsFile, recallAdjust=None, classRanges=None, threshold=None):
+    """
+    Load a whole predictions file into a single NumPy matrix. See loadPredictionBlocks.
+    """
+    blocks = list(loadPredictionBlocks(predictionsFile, recallAdjust, classRanges, threshold))
+    if len(blocks) == 0:
+        return numpy.zeros((0, 0))
+    return numpy.vstack(blocks)
+
+@gen2iterable        
+def loadPredictions(predictionsFile, recallAdjust=None, classRanges=None, threshold=None):
+    """
+    Iterate over the predictions in a classifier output file, one list per prediction. If NumPy 
+    is available the file is parsed in blocks, with recall adjustment and thresholding applied 
+    as array operations.
+    """
+    if numpyAvailable:
+        for matrix, predictions in _loadPredictionBlocks(predictionsFile, recallAdjust, classRanges, threshold, PREDICTION_BLOCK_SIZE):
+            if matrix is not None:
+                predictions = _fromPredictionMatrix(matrix)
+            for pred in predictions:
+                yield pred
+        return
+    f = _openPredictions(predictionsFile)
     #try:
     for line in f:
         splits = line.split()
-        if len(splits) == 1: # true binary
-            assert recallAdjust == None or recallAdjust == 1.0 # not implemented for binary classification
-            yield [float(splits[0])]
-        elif len(splits) == 3 and (recallAdjust != None and recallAdjust != 1.0) and classRanges == None: # SVM multiclass two class "binary" classification
+        if len(splits) == 3 and (recallAdjust != None and recallAdjust != 1.0) and classRanges == None: # SVM multiclass two class "binary" classification
             # Go through all the predictions to get the ranges
             predictions = [splits]
             for line in f:
@@ -314,42 +759,45 @@ def loadPredictions(predictionsFile, recallAdjust=None, classRanges=None, thresh
             for yieldedValue in loadPredictions(predictionsFile, recallAdjust, classRanges):
                 yield yieldedValue
             break
-        else: # multiclass
-            if "," in splits[0]: # multilabel
-                pred = [[]]
-                for value in splits[0].split(","):
-                    pred[0].append(int(value))
-            else:
-                pred = [int(splits[0])]
-            for split in splits[1:]:
-                if split != "N/A":
-                    split = float(split)
-                pred.append(split)
-            # Recall adjust
-            if recallAdjust != None and recallAdjust != 1.0:
-                if classRanges == None:
-                    pred[1] = RecallAdjust.scaleVal(pred[1], recallAdjust)
-                else: # SVM multiclass two class "binary" classification 
-                    pred[1] = RecallAdjust.scaleRange(pred[1], recallAdjust, classRanges[1])
-                #if pred[0] == 1:
-                maxStrength = pred[1]
-                pred[0] = 1
-                for i in range(2, len(pred)):
-                    if pred[i] > maxStrength:
-                        maxStrength = pred[i]
-                        pred[0] = i
-            # Thresholding
-            if threshold != None:
-                if pred[1] > threshold:
-                    pred[0] = 1
-                else:
-                    maxStrength = pred[2]
-                    pred[0] = 2
-                    for i in range(2, len(pred)):
-                        if pred[i] > maxStrength:
-                            maxStrength = pred[i]
-                            pred[0] = i       
-            # Return the prediction
-            yield pred
+        else:
+            yield _parsePrediction(splits, recallAdjust, classRanges, threshold)
     #finally:
-    f.close()
\ No newline at end of file
+    f.close()
+
+def benchmarkPredictions(predictionsFile, recallAdjust=None, threshold=None):
+    """
+    Compare the time taken to load a predictions file line by line and in NumPy blocks
+    """
+    global numpyAvailable
+    assert numpyAvailable, "NumPy is required for block loading"
+    results = {}
+    for name, useNumPy in [("lines", False), ("blocks", True)]:
+        numpyAvailable = useNumPy
+        try:
+            startTime = time.time()
+            count = 0
+            for pred in loadPredictions(predictionsFile, recallAdjust, threshold=threshold):
+                count += 1
+            results[name] = time.time() - startTime
+        finally:
+            numpyAvailable = True
+        print >> sys.stderr, "Loaded", count, "predictions by", name, "in", "%.2f" % results[name], "s"
+    startTime = time.time()
+    rows = sum([len(x) for x in loadPredictionBlocks(predictionsFile, recallAdjust, threshold=threshold)])
+    results["matrices"] = time.time() - startTime
+    print >> sys.stderr, "Loaded", rows, "predictions as matrices in", "%.2f" % results["matrices"], "s"
+    return results
+
+if __name__=="__main__":
+    from optparse import OptionParser
+    optparser = OptionParser(usage="%prog [options]\nConvert example files between the SVM-light text and binary formats, or benchmark loading a predictions file.")
+    optparser.add_option("-i", "--input", default=None, help="Input example file", metavar="FILE")
+    optparser.add_option("-o", "--output", default=None, help="Output example file (binary if ending in " + BINARY_SUFFIX + ")", metavar="FILE")
+    optparser.add_option("-p", "--predictions", default=None, help="Predictions file to benchmark", metavar="FILE")
+    optparser.add_option("-r", "--recallAdjust", default=None, type="float", help="Recall adjustment for the benchmark")
+    optparser.add_option("-t", "--threshold", default=None, type="float", help="Threshold for the benchmark")
+    (options, args) = optparser.parse_args()
+    if options.predictions != None:
+        benchmarkPredictions(options.predictions, options.recallAdjust, options.threshold)
+    else:
+        convertExamples(options.input, options.output)
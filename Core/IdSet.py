@@ -1,10 +1,24 @@
 """
 Manages classification class and feature ids.
+
+IdSets can be written as text files with one "name: id" pair per line, or in a binary 
+table format, which is memory-mapped when loaded so that large feature sets don't have to be 
+parsed before use. An IdSet can also use the hashing trick (setHashing), in which case the 
+ids are calculated from the names and no names need to be stored.
 """
 __version__ = "$Revision: 1.20 $"
 
+import sys
 import codecs
 import gzip
+import mmap
+import zlib
+import struct
+from array import array
+
+BINARY_MAGIC = "TEESIDS1"
+BINARY_SUFFIX = ".bin"
+BINARY_HEADER = "<qqqqq" # name count, next free id, first number, hash bits (-1 for none), bucket count
 
 class IdSet:
     """
@@ -30,9 +44,14 @@ class IdSet:
         @param filename: load name/id pairs from a file
         @type filename: str
         """
-        self.Ids = {}
+        self._ids = {}
         self.nextFreeId = firstNumber
+        self.firstNumber = firstNumber
         self._namesById = {}
+        self._table = None # memory-mapped IdTable of names loaded from a binary file
+        self.hashBits = None # number of bits in the hashed ids, or None if names are stored
+        self._hashed = {} # name -> (hashed id, sign) cache
+        self.binary = False # write the binary table format
         self.allowNewIds = allowNewIds # allow new ids when calling getId without specifying "createIfNotExist"
         
         if idDict != None:
@@ -40,12 +59,77 @@ class IdSet:
             self.nextFreeId = 999999999
             for name,id in idDict.iteritems():
                 self.defineId(name, id)
-            self.nextFreeId = max(self.Ids.values())+1
+            self.nextFreeId = max(self._ids.values())+1
         self.locked = locked
         
         if filename != None:
             self.load(filename)
     
+    def __getattr__(self, name):
+        # The name/id dictionary is built from a memory-mapped table only when it is needed
+        if name == "Ids":
+            self._materialize()
+            return self._ids
+        raise AttributeError(name)
+    
+    def _materialize(self):
+        if self._table != None:
+            for key, id in self._table.items():
+                self._ids[key] = id
+                self._namesById[id] = key
+            self._table.close()
+            self._table = None
+    
+    def setHashing(self, hashBits):
+        """
+        Use the hashing trick: each name is mapped to one of 2^hashBits ids calculated from
+        the name, starting from the first number of the set. No names are stored, and different
+        names can share an id. Use getSign for signed feature values.
+        
+        @param hashBits: number of bits in the hashed ids
+        @type hashBits: int
+        """
+        assert len(self._ids) == 0 and self._table == None, "Hashing can only be set for an empty IdSet"
+        assert hashBits > 0 and hashBits <= 31, hashBits
+        self.hashBits = hashBits
+    
+    def getSign(self, key):
+        """
+        Returns the sign (1 or -1) of a feature value for a hashed name. The sign is calculated
+        with a different hash function than the id, so collisions tend to cancel each other out.
+        """
+        if self.hashBits == None:
+            return 1
+        return self._getHashed(key)[1]
+    
+    def setHashedFeature(self, features, key, value, namedValues):
+        """
+        Sets a feature value in a vector of hashed ids. The value is multiplied with the sign of the
+        name and added to the values of the other names sharing its id. Setting the same name again
+        replaces its earlier value, as with named ids.
+        
+        @type features: dictionary
+        @param features: the feature vector
+        @type key: str
+        @param key: name
+        @type value: float
+        @param value: the unsigned feature value
+        @type namedValues: dictionary
+        @param namedValues: the signed values of the names already set in this feature vector
+        """
+        value *= self.getSign(key)
+        id = self.getId(key)
+        features[id] = features.get(id, 0) - namedValues.get(key, 0) + value
+        namedValues[key] = value
+    
+    def _getHashed(self, key):
+        if key not in self._hashed:
+            keyBytes = _toBytes(key)
+            id = self.firstNumber + (zlib.crc32(keyBytes) & ((1 << self.hashBits) - 1))
+            sign = 1 if zlib.crc32(keyBytes, 0x5bd1e995) & 1 else -1
+            self._hashed[key] = (id, sign)
+        return self._hashed[key]
+    
     def getId(self, key, createIfNotExist=None):
         """
         Returns the id number for a name. If the name doesn't already have an id, a new id is defined,
@@ -58,9 +142,17 @@ class IdSet:
         @rtype: int or None
         @return: an identifier
         """
+        if self.hashBits != None:
+            return self._getHashed(key)[0]
         if createIfNotExist == None: # no local override to object level setting
             createIfNotExist = self.allowNewIds
-        if not self.Ids.has_key(key):
+        if not self._ids.has_key(key):
+            if self._table != None:
+                id = self._table.getId(key)
+                if id != None: # keep the names in use in the dictionaries
+                    self._ids[key] = id
+                    self._namesById[id] = key
+                    return id
             if self.locked or createIfNotExist == False:
                 return None
             if key.strip() == "":
@@ -69,10 +161,9 @@ class IdSet:
                 raise Exception("Cannot define id for key with newline '" + key + "'")
             id = self.nextFreeId
             self.nextFreeId += 1
-            #assert(not id in self.Ids.values())
-            self.Ids[key] = id
+            self._ids[key] = id
             self._namesById[id] = key
-        return self.Ids[key]
+        return self._ids[key]
     
     def __getitem__( self, name ):
         """
@@ -87,12 +178,13 @@ class IdSet:
         is used only when inserting name/id pairs from an existing source.
         """
         assert not self.locked, (name, id)
-        assert not id in self.Ids.values(), (name, id)
-        assert not name in self.Ids.keys(), (name, id)
+        assert self.hashBits == None, (name, id)
+        assert self.getName(id) == None, (name, id)
+        assert not name in self._ids and (self._table == None or self._table.getId(name) == None), (name, id)
         assert id < self.nextFreeId, (name, id, self.nextFreeId)
         if name.strip() == "":
             raise Exception("Cannot define id for empty key")
-        self.Ids[name] = id
+        self._ids[name] = id
         self._namesById[id] = name
     
     def getName(self, id):
@@ -106,6 +198,8 @@ class IdSet:
         """
         if self._namesById.has_key(id):
             return self._namesById[id]
+        elif self._table != None:
+            return self._table.getName(id)
         else:
             return None
     
@@ -125,10 +219,19 @@ class IdSet:
         values.sort()
         return values
     
-    def write(self, filename):
+    def write(self, filename, binary=None):
         """
-        Writes the name/id pairs to a file, one pair per line, in the format "name: id".
+        Writes the name/id pairs to a file, one pair per line, in the format "name: id",
+        or in the binary table format. Hashed sets are always written in the binary format.
+        
+        @param binary: use the binary format. If None, the format is determined by the
+        binary-attribute of the set or a filename ending in BINARY_SUFFIX.
         """
+        if binary == None:
+            binary = self.binary or filename.endswith(BINARY_SUFFIX)
+        if binary or self.hashBits != None:
+            self.writeBinary(filename)
+            return
         #f = codecs.open(filename, "wt", "utf-8")
         if filename.endswith(".gz"):
             f = gzip.open(filename, 'wt')
@@ -137,23 +240,71 @@ class IdSet:
             writer = codecs.open(filename, "wt", "utf-8")
             f = writer
         
-        keys = self.Ids.keys()
+        ids = self.Ids
+        keys = ids.keys()
         keys.sort()
         for key in keys:
             # key is assumed to be a string
-            writer.write( key + ": " + str(self.Ids[key]) + "\n" )
+            writer.write( key + ": " + str(ids[key]) + "\n" )
             #f.write( (str(key)+": "+str(self.Ids[key])+"\n") ) # this causes unicode problems
             #f.write( (str(key)+": "+str(self.Ids[key])+"\n") )
             #f.write( (str(key)+": "+str(self.Ids[key])+"\n").encode("utf-8") )
         f.close()
     
+    def writeBinary(self, filename):
+        """
+        Writes the set in the binary table format. The names are sorted and stored in a
+        single utf-8 blob, with an open addressing hash index for looking up ids by name and
+        a list sorted by id for looking up names by id. All numbers are little-endian.
+        """
+        pairs = sorted([(_toBytes(key), id) for key, id in self.Ids.iteritems()])
+        names = [x[0] for x in pairs]
+        nameIds = array("i", [x[1] for x in pairs])
+        byId = array("i", sorted(range(len(names)), key=lambda i: nameIds[i]))
+        offsets = array("I", [0])
+        for name in names:
+            offsets.append(offsets[-1] + len(name))
+        bucketCount = 1
+        while bucketCount < 2 * len(names):
+            bucketCount *= 2
+        buckets = array("i", [-1]) * bucketCount
+        for i in range(len(names)):
+            pos = (zlib.crc32(names[i]) & 0xffffffff) & (bucketCount - 1)
+            while buckets[pos] != -1:
+                pos = (pos + 1) & (bucketCount - 1)
+            buckets[pos] = i
+        hashBits = self.hashBits if self.hashBits != None else -1
+        f = open(filename, "wb")
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack(BINARY_HEADER, len(names), self.nextFreeId, self.firstNumber, hashBits, bucketCount))
+        for values in (nameIds, byId, offsets, buckets):
+            assert values.itemsize == 4
+            if sys.byteorder != "little":
+                values.byteswap()
+            values.tofile(f)
+        f.write("".join(names))
+        f.close()
+    
     def load(self, filename):
         """
         Loads name/id pairs from a file. The IdSet is cleared of all existing ids before
-        loading the ones from the file.
+        loading the ones from the file. Files in the binary table format are memory-mapped.
         """
-        self.Ids = {}
+        self._ids = {}
         self._namesById = {}
+        if self._table != None:
+            self._table.close()
+            self._table = None
+        self.hashBits = None
+        self._hashed = {}
+        
+        if isBinaryIdFile(filename):
+            self._table = IdTable(filename)
+            self.nextFreeId = self._table.nextFreeId
+            self.firstNumber = self._table.firstNumber
+            self.hashBits = self._table.hashBits
+            self.binary = True
+            return
         self.nextFreeId = -999999999999999999
         
         #f = codecs.open(filename, "rt", "utf-8")
@@ -172,5 +323,88 @@ class IdSet:
             value = int(value.strip())
             if value >= self.nextFreeId:
                 self.nextFreeId = value + 1
-            self.Ids[key] = value
+            self._ids[key] = value
             self._namesById[value] = key
+
+class IdTable:
+    """
+    Read-only access to an IdSet file in the binary table format. The file is memory-mapped
+    and the ids and names are looked up without loading the whole table.
+    """
+    def __init__(self, filename):
+        f = open(filename, "rb")
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        assert self.mm[:len(BINARY_MAGIC)] == BINARY_MAGIC, filename
+        pos = len(BINARY_MAGIC)
+        self.count, self.nextFreeId, self.firstNumber, hashBits, self.bucketCount = struct.unpack_from(BINARY_HEADER, self.mm, pos)
+        self.hashBits = hashBits if hashBits != -1 else None
+        pos += struct.calcsize(BINARY_HEADER)
+        self.idsPos = pos
+        self.byIdPos = self.idsPos + 4 * self.count
+        self.offsetsPos = self.byIdPos + 4 * self.count
+        self.bucketsPos = self.offsetsPos + 4 * (self.count + 1)
+        self.namesPos = self.bucketsPos + 4 * self.bucketCount
+    
+    def close(self):
+        self.mm.close()
+    
+    def _getNameBytes(self, index):
+        start, end = struct.unpack_from("<II", self.mm, self.offsetsPos + 4 * index)
+        return self.mm[self.namesPos + start:self.namesPos + end]
+    
+    def _getIdAt(self, index):
+        return struct.unpack_from("<i", self.mm, self.idsPos + 4 * index)[0]
+    
+    def getId(self, name):
+        if self.count == 0:
+            return None
+        name = _toBytes(name)
+        pos = (zlib.crc32(name) & 0xffffffff) & (self.bucketCount - 1)
+        while True:
+            index = struct.unpack_from("<i", self.mm, self.bucketsPos + 4 * pos)[0]
+            if index == -1:
+                return None
+            if self._getNameBytes(index) == name:
+                return self._getIdAt(index)
+            pos = (pos + 1) & (self.bucketCount - 1)
+    
+    def getName(self, id):
+        # Binary search in the indices sorted by id
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            index = struct.unpack_from("<i", self.mm, self.byIdPos + 4 * middle)[0]
+            middleId = self._getIdAt(index)
+            if middleId < id:
+                low = middle + 1
+            elif middleId > id:
+                high = middle
+            else:
+                return self._getNameBytes(index).decode("utf-8")
+        return None
+    
+    def items(self):
+        """
+        Returns all (name, id) pairs in name order
+        """
+        ids = array("i", self.mm[self.idsPos:self.byIdPos])
+        offsets = array("I", self.mm[self.offsetsPos:self.bucketsPos])
+        if sys.byteorder != "little":
+            ids.byteswap()
+            offsets.byteswap()
+        names = self.mm[self.namesPos:self.namesPos + offsets[-1]]
+        return [(names[offsets[i]:offsets[i+1]].decode("utf-8"), ids[i]) for i in range(self.count)]
+
+def _toBytes(key):
+    if isinstance(key, unicode):
+        return key.encode("utf-8")
+    return key
+
+def isBinaryIdFile(filename):
+    if filename.endswith(".gz"):
+        return False
+    f = open(filename, "rb")
+    magic = f.read(len(BINARY_MAGIC))
+    f.close()
+    return magic == BINARY_MAGIC
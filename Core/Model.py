@@ -1,13 +1,35 @@
 """
 For storing the results of TEES training.
 """
-import sys, os, shutil
-import filecmp
+import sys, os, shutil, stat
 import zipfile
 import tempfile
+import zlib
+from cStringIO import StringIO
 
 NOTHING = object()
 
+def getCRC(filename):
+    """
+    The CRC-32 of a file, as stored for zip-archive members
+    """
+    crc = 0
+    f = open(filename, "rb")
+    for chunk in iter(lambda: f.read(1 << 20), ""):
+        crc = zlib.crc32(chunk, crc)
+    f.close()
+    return crc & 0xffffffff
+
+def getFileMode(filename):
+    """
+    The permission bits of an existing file, or those of a new file under the current umask
+    """
+    if os.path.exists(filename):
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0666 & ~umask
+
 class Model():
     """ 
     The Model object is an interface to a model file on the disk. The model file
@@ -18,7 +40,8 @@ class Model():
     When a member of a model is accessed, it is copied to a temporary cache directory.
     When a model is saved, files that have changed in the cache are copied to the model
     directory/archive. Note that for both files and strings that are added to the model,
-    are saved to it only when Model.save is called.
+    are saved to it only when Model.save is called. The named strings are read once and
+    kept in memory, and members can be read without caching them with openMember.
     """    
     def __init__(self, path, mode="r", verbose=True, compression=zipfile.ZIP_DEFLATED):
         """
@@ -30,6 +53,9 @@ class Model():
         @param compression: The compression method if a the model is a zip-archive.
         """
         self.members = {} # path_inside_model:path_to_cache_file (path_to_cache_file == None for members not yet requested)
+        self.cacheStats = {} # path_inside_model:(size, mtime) of the cache file when it was last identical to the member
+        self.values = None # the named strings, loaded when first needed
+        self.valuesChanged = False
         self.valueFileName = "TEES_MODEL_VALUES.tsv"
         self.compression = compression
         self.workdir = None
@@ -101,10 +127,12 @@ class Model():
                 assert c not in value, (c, name, value)
         values = self._getValues()
         if value != None: # add the parameter to the model
-            values[name] = value
+            if values.get(name) != value:
+                values[name] = value
+                self.valuesChanged = True
         elif name in values: # remove the parameter
             del values[name]
-        self._setValues(values)
+            self.valuesChanged = True
     
     def getStr(self, name, defaultIfNotExist=NOTHING, asType=None):
         """
@@ -133,38 +161,46 @@ class Model():
         """
         if self.mode == "r":
             raise IOError("Model not open for writing")
+        if self.valuesChanged:
+            self._setValues(self.values)
+            self.valuesChanged = False
         if self.isPackage:
             package = zipfile.ZipFile(self.path, "r", self.compression)
-            packageNames = package.namelist()
+            packageNames = set(package.namelist())
         # Check which files have changed in the cache
         changed = []
         for name in sorted(self.members.keys()):
             cached = self.members[name]
             if cached != None and os.path.exists(cached): # cache file exists
+                cachedInfo = os.stat(cached)
+                if self.cacheStats.get(name) == (cachedInfo.st_size, cachedInfo.st_mtime):
+                    continue # not modified since it was identical to the member
+                # Compare the content hashes
                 if self.isPackage:
-                    cachedInfo = os.stat(cached)
-                    packageFileInfo = None
-                    if name in packageNames:
-                        packageFileInfo = package.getinfo(name)
-                    if packageFileInfo == None or cachedInfo.st_size != packageFileInfo.file_size:
-                        changed.append(name)
+                    identical = name in packageNames and package.getinfo(name).file_size == cachedInfo.st_size and package.getinfo(name).CRC == getCRC(cached)
                 else:
                     modelFilename = os.path.join(self.path, name)
-                    if not os.path.exists(modelFilename) or not filecmp.cmp(modelFilename, cached):
-                        changed.append(name)
+                    identical = os.path.exists(modelFilename) and os.path.getsize(modelFilename) == cachedInfo.st_size and getCRC(modelFilename) == getCRC(cached)
+                if not identical:
+                    changed.append(name)
+                self.cacheStats[name] = (cachedInfo.st_size, cachedInfo.st_mtime)
         # Copy changed files from the cache to the model
         if len(changed) > 0:
             if self.verbose: print >> sys.stderr, "Saving model \"" + self.path + "\" (cache:" + self.workdir + ", changed:" + ",".join(changed) + ")"
             if self.isPackage:
-                tempdir = tempfile.mkdtemp() # place to unpack existing model
-                package.extractall(tempdir) # unpack model
-                package.close() # close model
+                # Recreate the model next to the existing one, copying the unchanged members directly
+                tempHandle, tempPackagePath = tempfile.mkstemp(suffix=".zip", dir=os.path.dirname(os.path.abspath(self.path)))
+                os.close(tempHandle)
+                newPackage = zipfile.ZipFile(tempPackagePath, "w", self.compression)
+                for name in package.namelist():
+                    if name not in changed:
+                        newPackage.writestr(name, package.read(name))
                 for name in changed: # add changed files from cache
-                    shutil.copy2(self.members[name], os.path.join(tempdir, name)) # from cache to unpacked model
-                package = zipfile.ZipFile(self.path, "w", self.compression) # recreate the model
-                for name in os.listdir(tempdir): # add all files to model
-                    package.write(os.path.join(tempdir, name), name) # add file from tempdir
-                shutil.rmtree(tempdir) # remove temporary directory
+                    newPackage.write(self.members[name], name)
+                newPackage.close()
+                package.close()
+                os.chmod(tempPackagePath, getFileMode(self.path)) # mkstemp creates the file as 0600
+                os.rename(tempPackagePath, self.path)
             else:
                 for name in changed:
                     shutil.copy2(self.members[name], os.path.join(self.path, name))
@@ -176,6 +212,9 @@ class Model():
         Save a model with a different name.
         """
         print >> sys.stderr, "Saving model \"" + self.path, "as", outPath
+        if self.valuesChanged:
+            self._setValues(self.values)
+            self.valuesChanged = False
         if os.path.exists(outPath):
             print >> sys.stderr, outPath, "exists, removing"
             if os.path.isdir(outPath):
@@ -200,6 +239,29 @@ class Model():
     def hasMember(self, name):
         return name in self.members
     
+    def openMember(self, name):
+        """
+        Open a file member for reading without adding it to the cache. A cached member
+        is read from the cache, otherwise directly from the model directory or archive.
+        
+        @param name : the path to the file inside the model
+        """
+        if name not in self.members:
+            raise IOError("Model has no member \"" + name + "\"")
+        cached = self.members[name]
+        if cached != None and os.path.exists(cached):
+            return open(cached, "rt")
+        if self.isPackage:
+            package = zipfile.ZipFile(self.path, "r")
+            try:
+                data = package.read(name)
+            except KeyError: # member has been added but not yet saved
+                raise IOError("Model has no saved member \"" + name + "\"")
+            finally:
+                package.close()
+            return StringIO(data)
+        return open(os.path.join(self.path, name), "rt")
+    
     def get(self, name, addIfNotExist=False, defaultIfNotExist=NOTHING):
         """
         Return a file member from the model. The member is extracted to a cached directory
@@ -230,6 +292,9 @@ class Model():
             elif os.path.exists(os.path.join(self.path, name)): # member already exists inside the model directory
                 if self.verbose: print >> sys.stderr, "Caching model \"" + self.path + "\" member \"" + name + "\" to \"" + cacheFilename + "\""
                 shutil.copy2(os.path.join(self.path, name), cacheFilename)
+            if os.path.exists(cacheFilename): # identical to the member until modified
+                cacheInfo = os.stat(cacheFilename)
+                self.cacheStats[name] = (cacheInfo.st_size, cacheInfo.st_mtime)
             self.members[name] = cacheFilename
         return self.members[name]
     
@@ -237,6 +302,8 @@ class Model():
         assert mode in ["r", "w", "a"]
         self.mode = mode
         self.path = path
+        self.values = None
+        self.valuesChanged = False
         if self.path.endswith('.zip'):
             self._openPackage(path, mode)
         else:
@@ -273,17 +340,21 @@ class Model():
     
     # Value file
     def _getValues(self):
-        values = {}
-        settingsFileName = self.get(self.valueFileName, True)
-        if os.path.exists(settingsFileName):            
-            f = open(settingsFileName, "rt")
-            for line in f:
-                key, value = line.split("\t", 1)
-                key = key.strip()
-                value = value.strip()
-                values[key] = value
-            f.close()
-        return values
+        if self.values == None:
+            values = {}
+            try:
+                f = self.openMember(self.valueFileName)
+            except IOError: # no value file yet
+                f = None
+            if f != None:
+                for line in f:
+                    key, value = line.split("\t", 1)
+                    key = key.strip()
+                    value = value.strip()
+                    values[key] = value
+                f.close()
+            self.values = values
+        return self.values
     
     def _setValues(self, values):
         f = open(self.get(self.valueFileName, True), "wt")
@@ -11,6 +11,7 @@ import Utils.Range as Range
 import types
 import copy
 import re
+import bisect
 
 #multiedges = True
 
@@ -164,6 +165,35 @@ class SentenceGraph:
             t2 = self.tokensById.get(dependency.get("t2"))
             assert t1 != None and t2 != None, (t1, t2, self.tokensById.keys())
             self.dependencyGraph.addEdge(t1, t2, dependency)
+        self._indexTokenOffsets()
+    
+    def _indexTokenOffsets(self):
+        """
+        Parse the token character offsets once and sort them by their begin offset,
+        so that the tokens overlapping a character range can be found with a binary
+        search instead of re-parsing all token offsets for every entity.
+        """
+        self.tokenOffsets = [Range.charOffsetToSingleTuple(x.get("charOffset")) for x in self.tokens]
+        self._tokenOffsetOrder = sorted(range(len(self.tokens)), key=lambda i: self.tokenOffsets[i][0])
+        self._tokenOffsetBegins = [self.tokenOffsets[i][0] for i in self._tokenOffsetOrder]
+        self._maxTokenLength = max([0] + [x[1] - x[0] for x in self.tokenOffsets])
+    
+    def getOverlappingTokenIndices(self, offset):
+        """
+        Return the indices of the tokens that overlap (as defined by Range.overlap)
+        the character range, in the order of self.tokens.
+        
+        @param offset: a character range
+        @type offset: a tuple of two integers
+        """
+        begin, end = offset
+        # An overlapping token must begin before the range ends, and it can't begin
+        # further before the range than the length of the longest token
+        first = bisect.bisect_right(self._tokenOffsetBegins, begin - self._maxTokenLength)
+        last = bisect.bisect_left(self._tokenOffsetBegins, end)
+        indices = [i for i in self._tokenOffsetOrder[first:last] if self.tokenOffsets[i][1] > begin]
+        indices.sort()
+        return indices
     
 #    def getUndirectedDependencyGraph(self):
 #        """
@@ -367,20 +397,20 @@ class SentenceGraph:
         # Each entity can consist of multiple syntactic tokens, covered by its
         # charOffset-range. One of these must be chosen as the head token.
         headTokens = [] # potential head tokens
-        for token in self.tokens:
-            #print token.attrib["id"], token.attrib["charOffset"]
-            tokenOffset = Range.charOffsetToSingleTuple(token.get("charOffset"))
-            if headOffset != None and entityElement.get("type") != "Binding":
-                # A head token can already be defined in the headOffset-attribute.
-                # However, depending on the tokenization, even this range may
-                # contain multiple tokens. Still, it can always be assumed that
-                # if headOffset is defined, the corret head token is in this range.
-                if Range.overlap(headOffset,tokenOffset):
-                    headTokens.append(token)
-            else:
-                for offset in charOffsets:
-                    if Range.overlap(offset,tokenOffset):
-                        headTokens.append(token)
+        if headOffset != None and entityElement.get("type") != "Binding":
+            # A head token can already be defined in the headOffset-attribute.
+            # However, depending on the tokenization, even this range may
+            # contain multiple tokens. Still, it can always be assumed that
+            # if headOffset is defined, the corret head token is in this range.
+            for i in self.getOverlappingTokenIndices(headOffset):
+                headTokens.append(self.tokens[i])
+        else:
+            # A token is added once for each of the entity's offsets it overlaps
+            overlapping = [set(self.getOverlappingTokenIndices(offset)) for offset in charOffsets]
+            for i in sorted(set().union(*overlapping)):
+                for tokenIndices in overlapping:
+                    if i in tokenIndices:
+                        headTokens.append(self.tokens[i])
         if len(headTokens)==1: # An unambiguous head token was found
             token = headTokens[0]
         else: # One head token must be chosen from the candidates
@@ -629,21 +659,13 @@ class SentenceGraph:
         for entity in self.entities:
             entityOffsets = Range.charOffsetToTuples(entity.get("charOffset"))
             entityHeadOffset = Range.charOffsetToSingleTuple(entity.get("headOffset"))
-            for token in self.tokens:
-                tokenOffset = Range.charOffsetToSingleTuple(token.get("charOffset"))
-                for entityOffset in entityOffsets:
-                    if Range.overlap(entityOffset, tokenOffset):
-                        self.tokenIsEntity[token] = True
-                        if entity.get("given") == "True":
-                            self.tokenIsName[token] = True
-#                        if entity.get("given") != None:
-#                            if entity.get("given") == "True":
-#                                self.tokenIsName[token] = True
-#                        else:
-#                            entity.set("given", "True")
-#                            self.tokenIsName[token] = True
-                if Range.overlap(entityHeadOffset, tokenOffset):
-                    self.tokenIsEntityHead[token].append(entity)
+            for entityOffset in entityOffsets:
+                for i in self.getOverlappingTokenIndices(entityOffset):
+                    self.tokenIsEntity[self.tokens[i]] = True
+                    if entity.get("given") == "True":
+                        self.tokenIsName[self.tokens[i]] = True
+            for i in self.getOverlappingTokenIndices(entityHeadOffset):
+                self.tokenIsEntityHead[self.tokens[i]].append(entity)
                                                           
     def getTokenText(self, token):
         """
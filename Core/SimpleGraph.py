@@ -12,11 +12,15 @@ class Graph:
         self.nodes = []
         self.edges = []
         self.__matrix = {}
+        self.__inEdges = {} # incoming edges per node, in self.edges order
+        self.__outEdges = {} # outgoing edges per node, in self.edges order
         self.__resetAnalyses()
     
     def __resetAnalyses(self):
         self.__distances = None
         self.__nextInPath = None
+        self.__pathIndex = None
+        self.__pathDistances = None
     
     def isDirected(self):
         return self.__directed
@@ -33,6 +37,8 @@ class Graph:
         self.__resetAnalyses()
         self.nodes.append(node)
         self.__matrix[node] = {}
+        self.__inEdges[node] = []
+        self.__outEdges[node] = []
         return True
     
     def addNodes(self, nodes):
@@ -43,6 +49,8 @@ class Graph:
                 nodesAdded = True
                 self.nodes.append(node)
                 self.__matrix[node] = {}
+                self.__inEdges[node] = []
+                self.__outEdges[node] = []
         return nodesAdded
     
     def addEdge(self, node1, node2, data=None):
@@ -72,6 +80,8 @@ class Graph:
             if not edge[1] in self.__matrix[edge[0]]:
                 self.__matrix[edge[0]][edge[1]] = []
             self.__matrix[edge[0]][edge[1]].append(edge)
+            self.__outEdges[edge[0]].append(edge)
+            self.__inEdges[edge[1]].append(edge)
         # add reverse edge
         reverse = False
         if not self.isDirected():
@@ -93,6 +103,8 @@ class Graph:
         if not node2 in self.__matrix[node1]:
             self.__matrix[node1][node2] = []
         self.__matrix[node1][node2].append(edge)
+        self.__outEdges[node1].append(edge)
+        self.__inEdges[node2].append(edge)
     
     def hasEdges(self, node1, node2):
         assert node1 in self.__matrix, "Missing node 1: " + str(node1)
@@ -143,20 +155,83 @@ class Graph:
     def getInEdges(self, node):
         assert node in self.__matrix, "Missing node: " + str(node)
         assert self.__directed
-        inEdges = []
-        for edge in self.edges:
-            if edge[1] == node:
-                inEdges.append(edge)
-        return inEdges
+        return self.__inEdges[node][:] # copied so that the caller can't modify the index
 
     def getOutEdges(self, node):
         assert node in self.__matrix, "Missing node: " + str(node)
         assert self.__directed
-        outEdges = []
-        for edge in self.edges:
-            if edge[0] == node:
-                outEdges.append(edge)
-        return outEdges
+        return self.__outEdges[node][:] # copied so that the caller can't modify the index
+    
+    def initPaths(self, filterCallback=None, callbackArgs={}):
+        """
+        Build the integer-indexed adjacency lists used by the breadth-first
+        shortest path search of getPaths. Edges for which filterCallback returns
+        True are not traversed (the DDI hack of FloydWarshall). Distances to a
+        target node are calculated lazily, once per target, when paths to it
+        are requested.
+        """
+        nodeIndex = {}
+        for i in range(len(self.nodes)):
+            nodeIndex[self.nodes[i]] = i
+        successors = [[] for node in self.nodes]
+        predecessors = [[] for node in self.nodes]
+        for n1 in self.nodes:
+            i = nodeIndex[n1]
+            for n2, edges in self.__matrix[n1].iteritems():
+                if n1 == n2 or len(edges) == 0:
+                    continue
+                if filterCallback != None: # permanent implementation of the DDI hack
+                    edgeCount = 0
+                    for edge in edges:
+                        if not filterCallback(edge, **callbackArgs):
+                            edgeCount += 1
+                    if edgeCount == 0:
+                        continue
+                j = nodeIndex[n2]
+                successors[i].append(j)
+                predecessors[j].append(i)
+        # Sort the neighbours so that paths are returned in node order, as with FloydWarshall
+        for i in range(len(self.nodes)):
+            successors[i].sort()
+            predecessors[i].sort()
+        self.__pathIndex = (nodeIndex, successors, predecessors)
+        self.__pathDistances = {}
+    
+    def __getDistancesTo(self, target):
+        """
+        Breadth-first search backwards from the target node. Returns a list
+        of distances to the target indexed by node index (None for no path).
+        """
+        if target in self.__pathDistances:
+            return self.__pathDistances[target]
+        predecessors = self.__pathIndex[2]
+        distances = [None] * len(self.nodes)
+        distances[target] = 0
+        frontier = [target]
+        distance = 0
+        while len(frontier) > 0:
+            distance += 1
+            nextFrontier = []
+            for node in frontier:
+                for predecessor in predecessors[node]:
+                    if distances[predecessor] == None:
+                        distances[predecessor] = distance
+                        nextFrontier.append(predecessor)
+            frontier = nextFrontier
+        self.__pathDistances[target] = distances
+        return distances
+    
+    def __buildPaths(self, i, j, distances):
+        distance = distances[i]
+        if distance == None: # no path
+            return []
+        if distance <= 1:
+            return [[self.nodes[i], self.nodes[j]]] # there is an edge from i to j, with no vertices between
+        segments = []
+        for intermediate in self.__pathIndex[1][i]:
+            if distances[intermediate] == distance - 1:
+                segments.extend( self.__buildPaths(intermediate, j, distances) )
+        return [[self.nodes[i]] + segment for segment in segments]
     
     def FloydWarshall(self, filterCallback=None, callbackArgs={}):
         """
@@ -231,6 +306,8 @@ class Graph:
         self.__nextInPath = None
         self.__distances = None
         self.__nextInPath = None
+        self.__pathIndex = None
+        self.__pathDistances = None
     
     def showAnalyses(self):
         if self.__nextInPath == None:
@@ -242,7 +319,21 @@ class Graph:
         for k in sorted(self.__nextInPath.keys()):
             print ">", k, self.__nextInPath[k]
 
-    def getPaths(self, i, j, depth=0):
+    def getPaths(self, i, j):
+        """
+        Return all shortest paths from node i to node j as lists of nodes.
+        """
+        if self.__pathIndex == None:
+            self.initPaths()
+        nodeIndex = self.__pathIndex[0]
+        j = nodeIndex[j]
+        return self.__buildPaths(nodeIndex[i], j, self.__getDistancesTo(j))
+    
+    def getPathsFloydWarshall(self, i, j, depth=0):
+        """
+        The original all-pairs implementation of getPaths, kept for reference
+        and benchmarking.
+        """
         if self.__nextInPath == None:
             self.FloydWarshall()
         if self.__distances[i][j] == sys.maxint: # no path
@@ -253,7 +344,7 @@ class Graph:
         else:
             segments = []
             for intermediate in intermediates:
-                segments.extend( self.getPaths(intermediate,j, depth+1) )
+                segments.extend( self.getPathsFloydWarshall(intermediate,j, depth+1) )
             rvs = []
             for segment in segments:
                 rvs.append( [i] + segment )
@@ -326,6 +417,90 @@ def evaluate(code, repeats):
         tSum += t
     return tSum / repeats
 
+def benchmarkPaths(input, parse, filterTypes=None):
+    """
+    Compare the breadth-first getPaths with the original FloydWarshall implementation
+    on the undirected dependency graphs of a corpus (e.g. GE11-devel.xml). Paths are
+    calculated between the head tokens of all entity pairs, as in EdgeExampleBuilder.
+    """
+    import time
+    from SentenceGraph import getCorpusIterator
+    filterCallback = None
+    callbackArgs = {}
+    if filterTypes != None:
+        filterCallback = lambda edge, edgeTypes: edge[2].get("type") in edgeTypes
+        callbackArgs = {"edgeTypes":filterTypes.split(",")}
+    tFloydWarshall = 0.0
+    tBreadthFirst = 0.0
+    numSentences = 0
+    numPairs = 0
+    maxTokens = 0
+    for sentences in getCorpusIterator(input, None, parse):
+        for sentence in sentences:
+            graph = sentence.sentenceGraph
+            if graph == None:
+                continue
+            numSentences += 1
+            maxTokens = max(maxTokens, len(graph.tokens))
+            heads = []
+            for entity in graph.entities:
+                if graph.entityHeadTokenByEntity[entity] not in heads:
+                    heads.append(graph.entityHeadTokenByEntity[entity])
+            pairs = [(heads[i], heads[j]) for i in range(len(heads)-1) for j in range(i+1, len(heads))]
+            numPairs += len(pairs)
+            # Original all-pairs implementation
+            undirected = graph.dependencyGraph.toUndirected()
+            t0 = time.time()
+            undirected.FloydWarshall(filterCallback, callbackArgs)
+            fwPaths = [undirected.getPathsFloydWarshall(t1, t2) for t1, t2 in pairs]
+            tFloydWarshall += time.time() - t0
+            # Breadth-first implementation
+            undirected = graph.dependencyGraph.toUndirected()
+            t0 = time.time()
+            undirected.initPaths(filterCallback, callbackArgs)
+            bfPaths = [undirected.getPaths(t1, t2) for t1, t2 in pairs]
+            tBreadthFirst += time.time() - t0
+            assert fwPaths == bfPaths, (graph.getSentenceId(), fwPaths, bfPaths)
+    print >> sys.stderr, numSentences, "sentences,", numPairs, "entity pairs, longest sentence", maxTokens, "tokens"
+    print >> sys.stderr, "FloydWarshall: %.4f s" % tFloydWarshall
+    print >> sys.stderr, "Breadth-first: %.4f s" % tBreadthFirst
+
+def speedChains(numTokens=100, depth=3):
+    """
+    Micro-benchmark for EntityExampleBuilder.buildChains style traversal of in- and
+    out-edges on a 100-token sentence, comparing the adjacency indexes with a scan
+    of the edge list (the previous implementation of getInEdges/getOutEdges).
+    """
+    import time
+    import random
+    random.seed(1)
+    g = Graph()
+    g.addNodes(range(numTokens))
+    for node in range(1, numTokens):
+        g.addEdge(random.randrange(node), node, "dep_" + str(node))
+    def scanIn(node):
+        return [x for x in g.edges if x[1] == node]
+    def scanOut(node):
+        return [x for x in g.edges if x[0] == node]
+    def chains(node, getIn, getOut, depthLeft, visited):
+        if depthLeft == 0:
+            return 0
+        count = 0
+        inEdges = getIn(node)
+        outEdges = getOut(node)
+        edgeSet = visited.union(inEdges + outEdges)
+        for edge in inEdges:
+            if not edge in visited:
+                count += 1 + chains(edge[0], getIn, getOut, depthLeft - 1, edgeSet)
+        for edge in outEdges:
+            if not edge in visited:
+                count += 1 + chains(edge[1], getIn, getOut, depthLeft - 1, edgeSet)
+        return count
+    for name, getIn, getOut in (("Edge list scan", scanIn, scanOut), ("Adjacency index", g.getInEdges, g.getOutEdges)):
+        t0 = time.time()
+        count = sum([chains(node, getIn, getOut, depth, set()) for node in g.nodes])
+        print >> sys.stderr, "%s: %.4f s (%d chain edges)" % (name, time.time() - t0, count)
+
 def speedSimple():
     edges = [('st_2', 'st_1', 'split_1'), ('st_4', 'st_2', 'split_2'), ('st_4', 'st_3', 'split_3'), ('st_78', 'st_4', 'split_4'), ('st_10', 'st_7', 'split_5'), ('st_10', 'st_9', 'split_6'), ('st_13', 'st_10', 'split_7'), ('st_13', 'st_11', 'split_8'), ('st_13', 'st_12', 'split_9'), ('st_4', 'st_13', 'split_10'), ('st_15', 'st_14', 'split_11'), ('st_13', 'st_15', 'split_12'), ('st_20', 'st_17', 'split_13'), ('st_20', 'st_18', 'split_14'), ('st_20', 'st_19', 'split_15'), ('st_13', 'st_20', 'split_16'), ('st_27', 'st_24', 'split_17'), ('st_27', 'st_25', 'split_18'), ('st_27', 'st_26', 'split_19'), ('st_13', 'st_27', 'split_20'), ('st_27', 'st_28', 'split_21'), ('st_30', 'st_29', 'split_22'), ('st_28', 'st_30', 'split_23'), ('st_34', 'st_32', 'split_24'), ('st_34', 'st_33', 'split_25'), ('st_44', 'st_34', 'split_26'), ('st_34', 'st_36', 'split_27'), ('st_40', 'st_39', 'split_28'), ('st_34', 'st_40', 'split_29'), ('st_44', 'st_40', 'split_30'), ('st_40', 'st_42', 'split_31'), ('st_30', 'st_44', 'split_32'), ('st_66', 'st_47', 'split_33'), ('st_66', 'st_50', 'split_34'), ('st_57', 'st_54', 'split_35'), ('st_57', 'st_55', 'split_36'), ('st_57', 'st_56', 'split_37'), ('st_50', 'st_57', 'split_38'), ('st_63', 'st_61', 'split_39'), ('st_63', 'st_62', 'split_40'), ('st_66', 'st_63', 'split_41'), ('st_66', 'st_64', 'split_42'), ('st_66', 'st_65', 'split_43'), ('st_13', 'st_66', 'split_44'), ('st_66', 'st_67', 'split_45'), ('st_72', 'st_68', 'split_46'), ('st_72', 'st_69', 'split_47'), ('st_72', 'st_70', 'split_48'), ('st_72', 'st_71', 'split_49'), ('st_67', 'st_72', 'split_50'), ('st_13', 'st_75', 'split_51'), ('st_4', 'st_77', 'split_52'), ('st_82', 'st_80', 'split_53'), ('st_82', 'st_81', 'split_54'), ('st_78', 'st_82', 'split_55'), ('st_87', 'st_86', 'split_56'), ('st_82', 'st_87', 'split_57'), ('st_87', 'st_89', 'split_58'), ('st_95', 'st_92', 'split_59'), ('st_95', 'st_94', 'split_60'), ('st_100', 'st_95', 'split_61'), ('st_95', 'st_97', 'split_62'), ('st_95', 'st_99', 'split_63'), ('st_97', 'st_99', 'split_64'), ('st_78', 'st_100', 'split_65'), ('st_105', 'st_101', 'split_66'), ('st_105', 'st_102', 'split_67'), ('st_105', 'st_103', 'split_68'), ('st_105', 'st_104', 'split_69'), ('st_100', 'st_105', 'split_70'), ('st_108', 'st_107', 'split_71'), ('st_105', 'st_108', 'split_72'), ('st_114', 'st_111', 'split_73'), ('st_114', 'st_112', 'split_74'), ('st_114', 'st_113', 'split_75'), ('st_100', 'st_114', 'split_76'), ('st_105', 'st_114', 'split_77'), ('st_114', 'st_116', 'split_78'), ('st_120', 'st_116', 'split_79'), ('st_120', 'st_118', 'split_80'), ('st_120', 'st_119', 'split_81'), ('st_116', 'st_120', 'split_82'), ('st_126', 'st_122', 'split_83'), ('st_126', 'st_123', 'split_84'), ('st_126', 'st_124', 'split_85'), ('st_126', 'st_125', 'split_86'), ('st_120', 'st_126', 'split_87'), ('st_132', 'st_129', 'split_88'), ('st_132', 'st_131', 'split_89'), ('st_136', 'st_132', 'split_90'), ('st_135', 'st_134', 'split_91'), ('st_132', 'st_135', 'split_92'), ('st_78', 'st_136', 'split_93'), ('st_141', 'st_137', 'split_94'), ('st_141', 'st_138', 'split_95'), ('st_141', 'st_139', 'split_96'), ('st_141', 'st_140', 'split_97'), ('st_136', 'st_141', 'split_98'), ('st_144', 'st_141', 'split_99'), ('st_144', 'st_143', 'split_100'), ('st_141', 'st_144', 'split_101'), ('st_146', 'st_145', 'split_102'), ('st_144', 'st_146', 'split_103'), ('st_144', 'st_148', 'split_104'), ('st_78', 'st_152', 'split_105'), ('st_78', 'st_154', 'split_106'), ('st_164', 'st_155', 'split_107'), ('st_160', 'st_157', 'split_108'), ('st_160', 'st_158', 'split_109'), ('st_160', 'st_159', 'split_110'), ('st_155', 'st_160', 'split_111'), ('st_163', 'st_162', 'split_112'), ('st_164', 'st_163', 'split_113'), ('st_78', 'st_164', 'split_114'), ('st_166', 'st_165', 'split_115'), ('st_164', 'st_166', 'split_116'), ('st_169', 'st_168', 'split_117'), ('st_164', 'st_169', 'split_118'), ('st_166', 'st_169', 'split_119'), ('st_54', 'st_52', None), ('st_61', 'st_59', None), ('st_86', 'st_84', None)]
     g = Graph()
@@ -339,6 +514,19 @@ def speedNX():
         
 if __name__=="__main__":
     from optparse import OptionParser
+    optparser = OptionParser(usage="%prog [options]\nBenchmark the shortest path implementations on a corpus.")
+    optparser.add_option("-i", "--input", default=None, help="Corpus in interaction xml format (e.g. GE11-devel.xml)", metavar="FILE")
+    optparser.add_option("-p", "--parse", default="McCC", help="Parse element name")
+    optparser.add_option("-f", "--filter", default=None, help="Comma-separated dependency types to exclude from paths (filter_shortest_path)")
+    optparser.add_option("-c", "--chains", default=False, action="store_true", help="Benchmark in/out edge lookups for chain features")
+    (options, args) = optparser.parse_args()
+    if options.input != None:
+        benchmarkPaths(options.input, options.parse, options.filter)
+        sys.exit()
+    if options.chains:
+        speedChains()
+        sys.exit()
+    
     # Import Psyco if available
     try:
         import psyco
@@ -11,9 +11,13 @@ from Core.Model import Model
 from StepSelector import StepSelector
 from StructureAnalyzer import StructureAnalyzer
 import Utils.Parameters as Parameters
+import Core.ExampleUtils as ExampleUtils
 import Evaluators.BioNLP11GeniaTools
 import types
 import time, datetime
+import hashlib
+
+_predictedRanges = {} # predicted value ranges of corpus files calculated in this process
 
 class Detector():
     """
@@ -57,6 +61,8 @@ class Detector():
         self.modelsToClose = []
         self.variablesToRemove = set()
         self.debug=False
+        self.workers = 1 # number of processes for example building and the parameter grid
+        self.binaryExamples = False # write example files in the binary format of Core.ExampleUtils
     
     def __del__(self):
         if not self.debug:
@@ -108,6 +114,24 @@ class Detector():
         self.connection.debug = self.debug
         return connection
     
+    def setWorkers(self, workers):
+        self.workers = workers
+        return workers
+    
+    def setBinaryExamples(self, binaryExamples):
+        self.binaryExamples = binaryExamples
+        return binaryExamples
+    
+    def getExampleFileName(self, filename):
+        """
+        Return the name of an example file in the example file format of this detector
+        """
+        if not self.binaryExamples or filename == None or filename.endswith(ExampleUtils.BINARY_SUFFIX):
+            return filename
+        if filename.endswith(".gz"):
+            filename = filename[:-3]
+        return filename + ExampleUtils.BINARY_SUFFIX
+    
     def setEvaluator(self, evaluator):
         self.evaluator = evaluator
     
@@ -175,6 +199,15 @@ class Detector():
             model.addStr(self.tag+"threshold", str(threshold))
         return classifierModel
     
+    def getClassifierModel(self, model):
+        """
+        Return the path of the classifier model member, also caching the linear weight matrix 
+        stored next to it by ResidentClassifier
+        """
+        if model.hasMember(self.tag+"classifier-model.weights"):
+            model.get(self.tag+"classifier-model.weights")
+        return model.get(self.tag+"classifier-model", defaultIfNotExist=None)
+    
     def openModel(self, model, mode="r"):
         if type(model) in types.StringTypes:
             model = Model(model, mode)
@@ -199,6 +232,8 @@ class Detector():
             parse = self.getStr(self.tag+"parse", model)
         self.structureAnalyzer.load(model)
         self.exampleBuilder.structureAnalyzer = self.structureAnalyzer
+        outputs = [self.getExampleFileName(x) for x in outputs]
+        trainingRanges = {} # ranges of the training corpora, stored in the model
         for data, output, gold in itertools.izip_longest(datas, outputs, golds, fillvalue=[]):
             print >> sys.stderr, "Example generation for", output
             if not isinstance(data, (list, tuple)): data = [data]
@@ -206,10 +241,18 @@ class Detector():
             append = False
             for dataSet, goldSet in itertools.izip_longest(data, gold, fillvalue=None):
                 if dataSet != None:
-                    self.exampleBuilder.run(dataSet, output, parse, None, exampleStyle, model.get(self.tag+"ids.classes", 
+                    predictedRange = self.getPredictedRange(model, dataSet)
+                    builder = self.exampleBuilder.run(dataSet, output, parse, None, exampleStyle, model.get(self.tag+"ids.classes", 
                         True), model.get(self.tag+"ids.features", True), goldSet, append, saveIdsToModel,
-                        structureAnalyzer=self.structureAnalyzer)
+                        structureAnalyzer=self.structureAnalyzer, workers=self.workers, predictedRange=predictedRange)
+                    if predictedRange == None:
+                        predictedRange = builder.getPredictedValueRange()
+                        self.savePredictedRange(dataSet, predictedRange)
+                    if saveIdsToModel and predictedRange != None and self.getCorpusKey(dataSet) != None:
+                        trainingRanges[self.getCorpusKey(dataSet)] = predictedRange
                 append = True
+        if len(trainingRanges) > 0 and model.mode != "r":
+            self.saveTrainingRanges(model, trainingRanges)
         if hasattr(self.structureAnalyzer, "typeMap") and model.mode != "r":
             print >> sys.stderr, "Saving StructureAnalyzer.typeMap"
             self.structureAnalyzer.save(model)
@@ -217,6 +260,51 @@ class Detector():
         if saveIdsToModel:
             model.save()
     
+    def getCorpusKey(self, data):
+        """
+        Identify a corpus file by its path, size, modification time, inode and status change time.
+        A file replaced by a rename gets a new inode, and a file rewritten in place gets a new status
+        change time, which unlike the modification time can't be restored by tools copying a file.
+        """
+        if type(data) not in types.StringTypes or not os.path.exists(data):
+            return None
+        stat = os.stat(data)
+        return hashlib.md5(":".join([os.path.abspath(data), str(stat.st_size), repr(stat.st_mtime), str(stat.st_ino), repr(stat.st_ctime)])).hexdigest()
+    
+    def getPredictedRange(self, model, data):
+        """
+        Return the predicted value range of a corpus file if it has already been calculated
+        in this process, or if it is one of the training corpora stored in the model
+        """
+        key = self.getCorpusKey(data)
+        if key == None or not self.exampleBuilder.usesPredictedRange:
+            return None
+        if self.tag + key in _predictedRanges:
+            return _predictedRanges[self.tag + key]
+        value = model.getStr(self.tag + "training-predicted-ranges", defaultIfNotExist=None)
+        if value != None:
+            for item in value.split(";"):
+                itemKey, itemRange = item.split("=")
+                if itemKey == key:
+                    return [None if x == "None" else float(x) for x in itemRange.split(",")]
+        return None
+    
+    def savePredictedRange(self, data, predictedRange):
+        """
+        Cache the predicted value range of a corpus file in memory
+        """
+        key = self.getCorpusKey(data)
+        if key == None or predictedRange == None:
+            return
+        _predictedRanges[self.tag + key] = list(predictedRange)
+    
+    def saveTrainingRanges(self, model, ranges):
+        """
+        Store the predicted value ranges of the training corpora in the model, replacing the 
+        ranges of earlier training runs
+        """
+        model.addStr(self.tag + "training-predicted-ranges", ";".join([key + "=" + ",".join([repr(x) for x in ranges[key]]) for key in sorted(ranges.keys())]))
+    
     def enterState(self, state, steps=None, fromStep=None, toStep=None, omitSteps=None):      
         if self.state == None:
             assert self.select == None
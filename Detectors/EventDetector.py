@@ -2,12 +2,16 @@ import sys, os
 import shutil
 import types
 import copy
+import time, datetime
+import multiprocessing
 from Detector import Detector
 from EntityDetector import EntityDetector
 from EdgeDetector import EdgeDetector
 from UnmergingDetector import UnmergingDetector
 from ModifierDetector import ModifierDetector
 #from Core.RecallAdjust import RecallAdjust
+import Core.ExampleUtils as ExampleUtils
+from Classifiers.Classifier import Classifier
 import Utils.Parameters as Parameters
 from Utils.Libraries.combine import combine
 import Utils.InteractionXML as InteractionXML
@@ -17,6 +21,12 @@ import Utils.STFormat.Compare
 import Evaluators.BioNLP11GeniaTools
 from Evaluators.AveragingMultiClassEvaluator import AveragingMultiClassEvaluator
 
+_gridDetector = None # the EventDetector whose parameter grid is run in worker processes
+
+def _runGridTask(args):
+    index, methodName, taskArgs = args
+    return index, getattr(_gridDetector, methodName)(*taskArgs)
+
 class EventDetector(Detector):
     """
     A multi-stage detector used for the BioNLP Shared Task type events.
@@ -41,6 +51,18 @@ class EventDetector(Detector):
         self.modifierDetector.setConnection(connection)
         return connection
     
+    def setWorkers(self, workers):
+        Detector.setWorkers(self, workers)
+        for detector in [self.triggerDetector, self.edgeDetector, self.unmergingDetector, self.modifierDetector]:
+            detector.setWorkers(workers)
+        return workers
+    
+    def setBinaryExamples(self, binaryExamples):
+        Detector.setBinaryExamples(self, binaryExamples)
+        for detector in [self.triggerDetector, self.edgeDetector, self.unmergingDetector, self.modifierDetector]:
+            detector.setBinaryExamples(binaryExamples)
+        return binaryExamples
+    
     def setWorkDir(self, workDir):
         Detector.setWorkDir(self, workDir) # for EventDetector
         # setup components
@@ -200,22 +222,29 @@ class EventDetector(Detector):
         TRIGGER_MODEL_STEM = os.path.join(self.triggerDetector.workDir, os.path.normpath(self.model.path)+"-trigger-models/model")
         self.structureAnalyzer.load(self.model)
         bestResults = None
-        for i in range(len(paramCombinations)):
-            params = paramCombinations[i]
-            print >> sys.stderr, "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
-            print >> sys.stderr, "Processing params", str(i+1) + "/" + str(len(paramCombinations)), params
-            print >> sys.stderr, "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
-            # Triggers and Boost (the trigger predictions are recalculated only when the relevant parameters change)
-            if (prevParams == None) or (prevParams["trigger"] != params["trigger"]) or (prevParams["booster"] != params["booster"]):
-                print >> sys.stderr, "Classifying trigger examples for parameters", "trigger:" + str(params["trigger"]), "booster:" + str(params["booster"])
-                xml = self.triggerDetector.classifyToXML(self.optData, self.model, self.workDir+"grid-trigger-examples", self.workDir+"grid-", classifierModel=TRIGGER_MODEL_STEM + Parameters.toId(params["trigger"]), recallAdjust=params["booster"], useExistingExamples=True)
-            prevParams = params
-            ## Build edge examples
-            #self.edgeDetector.buildExamples(self.model, [xml], [self.workDir+"grid-edge-examples"], [self.optData])
-            # Classify with pre-defined model
-            edgeClassifierModel = EDGE_MODEL_STEM + Parameters.toId(params["edge"])
-            xml = self.edgeDetector.classifyToXML(xml, self.model, self.workDir+"grid-edge-examples", self.workDir+"grid-", classifierModel=edgeClassifierModel, goldData=self.optData)
-            bestResults = self.evaluateGrid(xml, params, bestResults)
+        if self.workers > 1:
+            bestResults = self.doGridParallel(paramCombinations, TRIGGER_MODEL_STEM, EDGE_MODEL_STEM)
+        else:
+            for i in range(len(paramCombinations)):
+                params = paramCombinations[i]
+                print >> sys.stderr, "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
+                print >> sys.stderr, "Processing params", str(i+1) + "/" + str(len(paramCombinations)), params
+                print >> sys.stderr, "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
+                # Triggers and Boost (the trigger examples are classified only when the trigger parameters change, 
+                # and the trigger predictions are recalculated only when the relevant parameters change)
+                if (prevParams == None) or (prevParams["trigger"] != params["trigger"]):
+                    print >> sys.stderr, "Classifying trigger examples for parameters", "trigger:" + str(params["trigger"])
+                    triggerPredictions = self.triggerDetector.classifyExamples(self.model, self.workDir+"grid-trigger-examples", self.workDir+"grid-", TRIGGER_MODEL_STEM + Parameters.toId(params["trigger"]))
+                if (prevParams == None) or (prevParams["trigger"] != params["trigger"]) or (prevParams["booster"] != params["booster"]):
+                    print >> sys.stderr, "Making trigger predictions for parameters", "trigger:" + str(params["trigger"]), "booster:" + str(params["booster"])
+                    xml = self.triggerDetector.classifyToXML(self.optData, self.model, self.workDir+"grid-trigger-examples", self.workDir+"grid-", recallAdjust=params["booster"], useExistingExamples=True, predictions=triggerPredictions)
+                prevParams = params
+                ## Build edge examples
+                #self.edgeDetector.buildExamples(self.model, [xml], [self.workDir+"grid-edge-examples"], [self.optData])
+                # Classify with pre-defined model
+                edgeClassifierModel = EDGE_MODEL_STEM + Parameters.toId(params["edge"])
+                xml = self.edgeDetector.classifyToXML(xml, self.model, self.workDir+"grid-edge-examples", self.workDir+"grid-", classifierModel=edgeClassifierModel, goldData=self.optData)
+                bestResults = self.evaluateGrid(xml, params, bestResults)
         # Remove remaining intermediate grid files
         for tag1 in ["edge", "trigger", "unmerging"]:
             for tag2 in ["examples", "pred.xml.gz"]:
@@ -233,41 +262,137 @@ class EventDetector(Detector):
             self.edgeDetector.addClassifierModel(self.model, EDGE_MODEL_STEM+str(bestResults[0]["edge"]), bestResults[0]["edge"])
         # Remove work files
         for stepTag in [self.workDir+"grid-trigger", self.workDir+"grid-edge", self.workDir+"grid-unmerging"]:
-            for fileStem in ["-classifications", "-classifications.log", "examples.gz", "pred.xml.gz"]:
+            for fileStem in ["-classifications", "-classifications.log", "examples.gz", "-examples" + ExampleUtils.BINARY_SUFFIX, "pred.xml.gz"]:
                 if os.path.exists(stepTag+fileStem):
                     os.remove(stepTag+fileStem)
     
-    def evaluateGrid(self, xml, params, bestResults):
+    def doGridParallel(self, paramCombinations, triggerModelStem, edgeModelStem):
+        """
+        Run the parameter grid in a pool of worker processes. The trigger examples are classified
+        once for each trigger parameter and the predictions are made for all booster values from
+        these classifications, after which the edge combinations are evaluated
+        in their own work directories. The best result is selected in the original
+        combination order, so the outcome is the same as for the sequential grid.
+        """
+        global _gridDetector
+        gridDir = os.path.abspath(self.workDir+"grid-parallel")
+        if os.path.exists(gridDir):
+            shutil.rmtree(gridDir)
+        os.makedirs(gridDir)
+        # Cache all model members so that the workers don't extract them concurrently
+        for member in self.model.members.keys():
+            self.model.get(member)
+        # The shared trigger examples are converted for the classifier programs once, and only read by the workers
+        triggerExamples = self.triggerDetector.getExampleFileName(self.workDir+"grid-trigger-examples")
+        classifierExamples = Classifier.getSVMLight(triggerExamples)
+        _gridDetector = self
+        pool = multiprocessing.Pool(self.workers)
+        # Classify the triggers once for each trigger parameter, and make the predictions for all boosters
+        triggerParams = []
+        boosters = []
+        for params in paramCombinations:
+            if params["trigger"] not in triggerParams:
+                triggerParams.append(params["trigger"])
+            if params["booster"] not in boosters:
+                boosters.append(params["booster"])
+        tasks = []
+        for i in range(len(triggerParams)):
+            tasks.append((triggerParams[i], boosters, triggerModelStem + Parameters.toId(triggerParams[i]), os.path.join(gridDir, "trigger-" + str(i)), classifierExamples))
+        triggerFiles = {}
+        for trigger, files in zip(triggerParams, self._runGridTasks(pool, "classifyGridTriggers", tasks, "trigger classifications")):
+            for booster, filename in zip(boosters, files):
+                triggerFiles[(trigger, booster)] = filename
+        Classifier.releaseFile(classifierExamples) # a converted file is no longer needed
+        # Classify and evaluate the edges for each parameter combination
+        tasks = []
+        for i in range(len(paramCombinations)):
+            params = paramCombinations[i]
+            tasks.append((params, triggerFiles[(params["trigger"], params["booster"])], edgeModelStem + Parameters.toId(params["edge"]), os.path.join(gridDir, "combination-" + str(i))))
+        results = self._runGridTasks(pool, "evaluateGridCombination", tasks, "combinations")
+        pool.close()
+        pool.join()
+        _gridDetector = None
+        if not self.debug:
+            shutil.rmtree(gridDir)
+        # Select the best result as in evaluateGrid
+        bestResults = None
+        for result in results:
+            if result != None and (bestResults == None or result[2] > bestResults[2]):
+                bestResults = result
+        return bestResults
+    
+    def _runGridTasks(self, pool, methodName, tasks, title):
+        results = [None] * len(tasks)
+        startTime = time.time()
+        count = 0
+        for index, result in pool.imap_unordered(_runGridTask, [(i, methodName, tasks[i]) for i in range(len(tasks))]):
+            results[index] = result
+            count += 1
+            elapsed = time.time() - startTime
+            eta = elapsed / count * (len(tasks) - count)
+            print >> sys.stderr, "Grid", title, str(count) + "/" + str(len(tasks)), "complete, elapsed", \
+                datetime.timedelta(seconds=int(elapsed)), "ETA", datetime.timedelta(seconds=int(eta))
+        return results
+    
+    def _initGridWorker(self, workDir):
+        if not os.path.exists(workDir):
+            os.makedirs(workDir)
+        self.setWorkers(1) # no nested process pools in a worker process
+        self.model.mode = "r" # the model is saved only by the parent process
+        return os.path.join(workDir, "grid-")
+    
+    def classifyGridTriggers(self, triggerParams, boosters, classifierModel, workDir, classifierExamples=None):
+        print >> sys.stderr, "Classifying trigger examples for parameters", "trigger:" + str(triggerParams)
+        gridTag = self._initGridWorker(workDir)
+        if classifierExamples == None: # the examples in a format the classifier can use without converting them
+            classifierExamples = self.workDir+"grid-trigger-examples"
+        predictions = self.triggerDetector.classifyExamples(self.model, classifierExamples, gridTag, classifierModel)
+        triggerFiles = []
+        for i in range(len(boosters)):
+            print >> sys.stderr, "Making trigger predictions for parameters", "trigger:" + str(triggerParams), "booster:" + str(boosters[i])
+            boosterTag = gridTag + "booster" + str(i) + "-"
+            xml = self.triggerDetector.classifyToXML(self.optData, self.model, self.workDir+"grid-trigger-examples", boosterTag, recallAdjust=boosters[i], useExistingExamples=True, predictions=predictions)
+            triggerFiles.append(boosterTag + self.triggerDetector.tag + "pred.xml.gz" if xml != None else None)
+        return triggerFiles
+    
+    def evaluateGridCombination(self, params, triggerXML, classifierModel, workDir):
+        print >> sys.stderr, "Processing params", params
+        gridTag = self._initGridWorker(workDir)
+        xml = None
+        if triggerXML != None:
+            xml = self.edgeDetector.classifyToXML(triggerXML, self.model, gridTag+"edge-examples", gridTag, classifierModel=classifierModel, goldData=self.optData)
+        results = self.evaluateGrid(xml, params, None, gridTag)
+        if not self.debug:
+            shutil.rmtree(workDir)
+        if results == None:
+            return None
+        return (results[0], None, results[2]) # the evaluation objects stay in the worker
+    
+    def evaluateGrid(self, xml, params, bestResults, gridTag=None):
+        if gridTag == None:
+            gridTag = self.workDir+"grid-"
         if xml != None:                
             # TODO: Where should the EvaluateInteractionXML evaluator come from?
             EIXMLResult = EvaluateInteractionXML.run(self.edgeDetector.evaluator, xml, self.optData, self.parse)
             # Convert to ST-format
             if self.unmerging:
-                xml = self.unmergingDetector.classifyToXML(xml, self.model, None, self.workDir+"grid-", goldData=self.optData)
+                xml = self.unmergingDetector.classifyToXML(xml, self.model, None, gridTag, goldData=self.optData)
                 #self.structureAnalyzer.validate(xml)
-                if self.bioNLPSTParams["evaluate"]:
-                    Utils.STFormat.ConvertXML.toSTFormat(xml, self.workDir+"grid-unmerging-geniaformat", "a2")
-                    stFormatDir = self.workDir+"grid-unmerging-geniaformat"
-            elif self.bioNLPSTParams["evaluate"]:
-                #self.structureAnalyzer.validate(xml)
-                Utils.STFormat.ConvertXML.toSTFormat(xml, self.workDir+"grid-flat-geniaformat", "a2") #getA2FileTag(options.task, subTask))
-                stFormatDir = self.workDir+"grid-flat-geniaformat"
             # Evaluation
-            # Attempt shared task evaluation
+            # Attempt shared task evaluation on the in-memory ST-format documents
             stEvaluation = None
             if self.bioNLPSTParams["evaluate"]:
-                stEvaluation = self.stEvaluator.evaluate(stFormatDir, self.task)
+                #self.structureAnalyzer.validate(xml)
+                stDocuments = Utils.STFormat.ConvertXML.toSTFormat(xml)
+                for stDocument in stDocuments: # assign ids and remove duplicate events as when writing the files
+                    stDocument.prepareSave()
+                stEvaluation = self.stEvaluator.evaluate(stDocuments, self.task)
             if stEvaluation != None:
                 if bestResults == None or stEvaluation[0] > bestResults[1][0]:
                     bestResults = (params, stEvaluation, stEvaluation[0])
             else: # If shared task evaluation was not done (failed or not requested) fall back to internal evaluation
                 if bestResults == None or EIXMLResult.getData().fscore > bestResults[1].getData().fscore:
                     bestResults = (params, EIXMLResult, EIXMLResult.getData().fscore)
-            # Remove ST-format files
-            if os.path.exists(self.workDir+"grid-flat-geniaformat"):
-                shutil.rmtree(self.workDir+"grid-flat-geniaformat")
-            if os.path.exists(self.workDir+"grid-unmerging-geniaformat"):
-                shutil.rmtree(self.workDir+"grid-unmerging-geniaformat")
         else:
             print >> sys.stderr, "No predicted edges"
         return bestResults
@@ -34,7 +34,7 @@ from sklearn.metrics.classification import classification_report
 from keras.layers import Conv1D
 from keras.layers.pooling import MaxPooling1D, GlobalMaxPool1D
 from __builtin__ import isinstance
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from sklearn.utils.class_weight import compute_class_weight
 import Utils.Range as Range
 import Utils.STFormat
@@ -42,9 +42,33 @@ import Utils.KerasUtils as KerasUtils
 from keras.layers.normalization import BatchNormalization
 import random
 
+_kerasModels = OrderedDict() # model path -> ((modification time, size), Keras model), least recently used first
+KERAS_MODEL_CACHE_SIZE = 10
+
 def f1ScoreMetric(y_true, y_pred):
     return sklearn.metrics.f1_score(y_true, y_pred, average="micro")
 
+def loadKerasModel(kerasModelPath):
+    """
+    Load a Keras model, reusing an already loaded one if the model file has not changed
+    """
+    kerasModelPath = os.path.abspath(kerasModelPath)
+    stat = os.stat(kerasModelPath)
+    key = (stat.st_mtime, stat.st_size)
+    if kerasModelPath in _kerasModels:
+        cachedKey, kerasModel = _kerasModels.pop(kerasModelPath)
+        if cachedKey == key:
+            _kerasModels[kerasModelPath] = (cachedKey, kerasModel)
+            return kerasModel
+    kerasModel = load_model(kerasModelPath)
+    _kerasModels[kerasModelPath] = (key, kerasModel)
+    while len(_kerasModels) > KERAS_MODEL_CACHE_SIZE:
+        _kerasModels.popitem(last=False)
+    return kerasModel
+
+def clearKerasModelCache():
+    _kerasModels.clear()
+
 class KerasDetectorBase(Detector):
     """
     The KerasDetector replaces the default SVM-based learning with a pipeline where
@@ -142,6 +166,7 @@ class KerasDetectorBase(Detector):
         if xml != None:
             if (validate):
                 self.structureAnalyzer.load(model)
+                xml = ETUtils.ETFromObj(xml) # streamed output is returned as a file name
                 self.structureAnalyzer.validate(xml)
                 ETUtils.write(xml, output+"-pred.xml.gz")
             else:
@@ -905,8 +930,7 @@ class KerasDetectorBase(Detector):
                 break
             print >> sys.stderr, "Predicting with model", modelIndex + 1, models[modelIndex]["filename"]
             kerasModelPath = model.get(models[modelIndex]["filename"])
-            modelConfidences, _, _ = self.predictWithModel(labels, features, labelNames, kerasModelPath)
-            confidences = confidences + modelConfidences #numpy.sum([confidences, modelConfidences], axis=0)
+            self.predictWithModel(labels, features, labelNames, kerasModelPath, confidenceSum=confidences)
             if evalAll and modelIndex < numEnsemble - 1:
                 print >> sys.stderr, "Results for ensemble size", modelIndex + 1
                 self.getPredictions(confidences / float(modelIndex + 1), labels, labelNames)
@@ -916,27 +940,44 @@ class KerasDetectorBase(Detector):
         #print >> sys.stderr, confidences[0], predictions[0], (confidences.shape, predictions.shape)
         return predictions, confidences, scores
     
-    def predictWithModel(self, labels, features, labelNames, kerasModelPath, evaluation=False):
-        kerasModel = load_model(kerasModelPath)
-        confidences = kerasModel.predict(features, 64, 1)
+    def predictWithModel(self, labels, features, labelNames, kerasModelPath, evaluation=False, confidenceSum=None, batchSize=10000):
+        """
+        Predict the examples in batches of batchSize. If confidenceSum is defined, the confidences
+        are added to it in place (for ensemble averaging) instead of returning a new array.
+        """
+        kerasModel = loadKerasModel(kerasModelPath)
+        numExamples = len(labels)
+        confidences = confidenceSum
+        for start in range(0, numExamples, batchSize) or [0]: # an empty set is also predicted
+            batch = self.getFeatureBatch(features, start, start + batchSize)
+            batchConfidences = kerasModel.predict(batch, 64, 1)
+            if confidences is None:
+                confidences = numpy.zeros((numExamples,) + batchConfidences.shape[1:], dtype=batchConfidences.dtype)
+            if confidenceSum is not None:
+                confidences[start:start + len(batchConfidences)] += batchConfidences
+            else:
+                confidences[start:start + len(batchConfidences)] = batchConfidences
         print >> sys.stderr, ""
         predictions, scores = None, None
         if evaluation:
             predictions, scores = self.getPredictions(confidences, labels, labelNames)
         return confidences, predictions, scores
     
+    def getFeatureBatch(self, features, start, end):
+        if isinstance(features, dict):
+            return {x:features[x][start:end] for x in features}
+        elif isinstance(features, (list, tuple)):
+            return [x[start:end] for x in features]
+        return features[start:end]
+    
     def getPredictions(self, confidences, labels, labelNames):
-        predictions = numpy.copy(confidences)
+        predictions = numpy.zeros_like(confidences)
         if self.cmode == "multiclass":
-            for i in range(len(confidences)):
-                maxIndex = numpy.argmax(confidences[i])
-                for j in range(len(confidences[i])):
-                    predictions[i][j] = 1 if j == maxIndex else 0
-            scores = self.evaluate([numpy.argmax(x) for x in labels], [numpy.argmax(x) for x in predictions], labelNames) 
+            maxIndices = numpy.argmax(confidences, axis=1)
+            predictions[numpy.arange(len(confidences)), maxIndices] = 1
+            scores = self.evaluate(numpy.argmax(labels, axis=1).tolist(), maxIndices.tolist(), labelNames) 
         else:
-            for i in range(len(confidences)):
-                for j in range(len(confidences[i])):
-                    predictions[i][j] = 1 if confidences[i][j] > 0.5 else 0
+            predictions[confidences > 0.5] = 1
             scores = self.evaluate(labels, predictions, labelNames)
         return predictions, scores
     
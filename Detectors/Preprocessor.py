@@ -73,27 +73,27 @@ class Preprocessor(ToolChain):
         self.defStep("CONVERT", self.convert, {"dataSetNames":None, "corpusName":None, "extensions":None, "origIdType":None})
         self.defStep("MERGE_SETS", Utils.InteractionXML.MergeSets.mergeSets, {"corpusDir":None})
         self.defGroup("Pre-parsing")
-        self.defStep("MAP_ATTRIBUTES", Utils.InteractionXML.MapAttributes.processCorpus, {"rules":None})
-        self.defStep("REMOVE_HEADS", Utils.InteractionXML.DeleteAttributes.processCorpus, {"rules":{"entity":["headOffset"]}})
-        self.defStep("REMOVE_ANALYSES", Utils.InteractionXML.DeleteElements.processCorpus, {"rules":{"analyses":{}}, "reverse":False})
-        self.defStep("MERGE_SENTENCES", Utils.InteractionXML.MergeSentences.mergeSentences)
-        self.defStep("GENIA_SPLITTER", Tools.GeniaSentenceSplitter.makeSentences, {"debug":False, "postProcess":True})
-        self.defStep("BANNER", Tools.BANNER.run, {"elementName":"entity", "processElement":"sentence", "debug":False, "splitNewlines":True})
+        self.defStep("MAP_ATTRIBUTES", Utils.InteractionXML.MapAttributes.processCorpus, {"rules":None}, documentLocal=True)
+        self.defStep("REMOVE_HEADS", Utils.InteractionXML.DeleteAttributes.processCorpus, {"rules":{"entity":["headOffset"]}}, documentLocal=True)
+        self.defStep("REMOVE_ANALYSES", Utils.InteractionXML.DeleteElements.processCorpus, {"rules":{"analyses":{}}, "reverse":False}, documentLocal=True)
+        self.defStep("MERGE_SENTENCES", Utils.InteractionXML.MergeSentences.mergeSentences, documentLocal=True)
+        self.defStep("GENIA_SPLITTER", Tools.GeniaSentenceSplitter.makeSentences, {"debug":False, "postProcess":True}, documentLocal=True)
+        self.defStep("BANNER", Tools.BANNER.run, {"elementName":"entity", "processElement":"sentence", "debug":False, "splitNewlines":True}, documentLocal=True)
         self.defGroup("Constituency Parsing")
-        self.defStep("BLLIP_BIO", clsStep(BLLIPParser, "parse"), {"parseName":self.parseName, "requireEntities":self.requireEntities, "debug":False, "pathBioModel":"AUTO"})
-        self.defStep("BLLIP", clsStep(BLLIPParser, "parse"), {"parseName":self.parseName, "requireEntities":self.requireEntities, "debug":False, "pathBioModel":None})
-        self.defStep("STANFORD_CONST", clsStep(StanfordParser, "parse"), {"parserName":self.parseName, "debug":False, "action":"penn", "memory":None})
+        self.defStep("BLLIP_BIO", clsStep(BLLIPParser, "parse"), {"parseName":self.parseName, "requireEntities":self.requireEntities, "debug":False, "pathBioModel":"AUTO"}, documentLocal=True)
+        self.defStep("BLLIP", clsStep(BLLIPParser, "parse"), {"parseName":self.parseName, "requireEntities":self.requireEntities, "debug":False, "pathBioModel":None}, documentLocal=True)
+        self.defStep("STANFORD_CONST", clsStep(StanfordParser, "parse"), {"parserName":self.parseName, "debug":False, "action":"penn", "memory":None}, documentLocal=True)
         self.defGroup("Dependency Parsing")
-        self.defStep("STANFORD_DEP", clsStep(StanfordParser, "parse"), {"parserName":self.parseName, "debug":False, "action":"dep", "outputFormat":None, "memory":None})
-        self.defStep("STANFORD_CONVERT", clsStep(StanfordParser, "parse"), {"parserName":self.parseName, "debug":False, "action":"convert", "outputFormat":None, "memory":None})
-        self.defStep("SYNTAXNET", clsStep(SyntaxNetParser, "parse"), {"parserName":self.parseName, "debug":False, "modelDir":None})
+        self.defStep("STANFORD_DEP", clsStep(StanfordParser, "parse"), {"parserName":self.parseName, "debug":False, "action":"dep", "outputFormat":None, "memory":None}, documentLocal=True)
+        self.defStep("STANFORD_CONVERT", clsStep(StanfordParser, "parse"), {"parserName":self.parseName, "debug":False, "action":"convert", "outputFormat":None, "memory":None}, documentLocal=True)
+        self.defStep("SYNTAXNET", clsStep(SyntaxNetParser, "parse"), {"parserName":self.parseName, "debug":False, "modelDir":None}, documentLocal=True)
         self.defGroup("Alternative Parsing")
         self.defAlias("CLEAR_PARSE", ["REMOVE_ANALYSES", "REMOVE_HEADS", "MERGE_SENTENCES"])
         self.defStep("IMPORT_PARSE", clsStep(ParseConverter, "insertParses"), {"parseDir":None, "debug":False, "extensions":None, "subDirs":None, "docMatchKeys":None, "conllFormat":None, "splitting":True, "unescapeFormats":"AUTO", "origIdType":None, "posTags":None})
         self.defGroup("Post-parsing")
-        self.defStep("SPLIT_NAMES", ProteinNameSplitter.mainFunc, {"parseName":self.parseName, "removeOld":True})
-        self.defStep("FIND_HEADS", FindHeads.findHeads, {"parse":self.parseName, "removeExisting":True})
-        self.defStep("REMOVE_DOCUMENT_TEXTS", Utils.InteractionXML.DeleteAttributes.processCorpus, {"rules":{"document":["text"]}})
+        self.defStep("SPLIT_NAMES", ProteinNameSplitter.mainFunc, {"parseName":self.parseName, "removeOld":True}, documentLocal=True)
+        self.defStep("FIND_HEADS", FindHeads.findHeads, {"parse":self.parseName, "removeExisting":True}, documentLocal=True)
+        self.defStep("REMOVE_DOCUMENT_TEXTS", Utils.InteractionXML.DeleteAttributes.processCorpus, {"rules":{"document":["text"]}}, documentLocal=True)
         self.defStep("ANALYZE_STRUCTURE", clsStep(StructureAnalyzer, "analyze"), {"verbose":True}, {"input":"inputs"})
         self.defGroup("Miscellaneous")
         self.defStep("ADD_DDI_TEST_GOLD", DDITools.addTestGold, {"testGoldPath":None})
@@ -101,12 +101,12 @@ class Preprocessor(ToolChain):
         self.defStep("CONVERT_CHEMPROT", Utils.Convert.convertChemProt.convertChemProt, {"setNames":{"chemprot_training":"train", "chemprot_development":"devel", "chemprot_test":"test"}, "goldTestSet":True, "downloadDir":None, "extractDir":None, "redownload":False, "debug":False}, {"input":"inDirs", "output":"outPath"})
         self.defStep("EXPORT_CHEMPROT", Utils.Convert.convertChemProt.exportChemProtPredictions, {"fileTypes":"predictions", "setNames":{"train":"chemprot_training", "devel":"chemprot_development"}}, {"input":"xml", "output":"outPath"})
         self.defStep("MAKE_SETS", Utils.InteractionXML.MakeSets.processCorpus, {"sourceSet":None, "newSets":None, "seed":1}, {"input":"inPath", "output":"outPath"})
-        self.defStep("DELETE_ELEMENTS", Utils.InteractionXML.DeleteElements.processCorpus, {"rules":None, "reverse":False})
+        self.defStep("DELETE_ELEMENTS", Utils.InteractionXML.DeleteElements.processCorpus, {"rules":None, "reverse":False}, documentLocal=True)
         self.defStep("EVALUATE_BIONLP", Evaluators.BioNLP11GeniaTools.convertAndEvaluate, {"task":None, "a2Tag":"a2", "goldDir":None, "debug":False}, {"input":"xml"})
         self.defStep("STRATIFY", Utils.InteractionXML.Stratify.stratify, {"oldSetMatch":None, "newSetCutoffs":None, "rounds":100000, "seed":1})
         self.defGroup("Saving")
         self.defStep("DIVIDE_SETS", self.divideSets, {"saveCombined":False})
-        self.defStep("SAVE", self.save)
+        self.defStep("SAVE", self.save, documentLocal=True)
         self.defStep("EXPORT", self.export, {"formats":None, "exportIds":None, "useSetDirs":False})
         self.defStep("EXPORT_STFORMAT", Utils.STFormat.ConvertXML.toSTFormat, {"outputTag":"a2", "useOrigIds":False, "debug":False, "skipArgs":[], "validate":True, "writeExtra":False, "allAsRelations":False, "exportIds":None})
     
@@ -360,8 +360,13 @@ class Preprocessor(ToolChain):
     # Saving Steps
     ###########################################################################
     
+    def isStreamable(self, step, output):
+        if step.name == "SAVE" and "*" in output: # dividing or exporting needs the whole corpus
+            return False
+        return ToolChain.isStreamable(self, step, output)
+    
     def save(self, input, output=None):
-        if "*" in output:
+        if output != None and "*" in output:
             if output.endswith("*.xml"):
                 return self.divideSets(input, output.split("*")[0].rstrip("-"))
             else:
@@ -50,16 +50,23 @@ class SingleStageDetector(Detector):
                 if self.bioNLPSTParams != None and len(self.bioNLPSTParams) > 0:
                     model.addStr("BioNLPSTParams", Parameters.toString(self.bioNLPSTParams))
                 # Catenate example files
+                testExampleFile = self.getExampleFileName(testExampleFile)
                 if type(trainExampleFiles) in types.StringTypes:
-                    combinedTrainExamples = trainExampleFiles
+                    combinedTrainExamples = self.getExampleFileName(trainExampleFiles)
                 elif len(trainExampleFiles) == 1: 
-                    combinedTrainExamples = trainExampleFiles[0]
+                    combinedTrainExamples = self.getExampleFileName(trainExampleFiles[0])
                 else:
-                    combinedTrainExamples = self.workDir + os.path.normpath(model.path)+"-"+self.tag+"combined-examples.gz"
-                    combinedTrainExamplesFile = gzip.open(combinedTrainExamples, 'wb')
-                    for trainExampleFile in trainExampleFiles:
-                        print >> sys.stderr, "Catenating", trainExampleFile, "to", combinedTrainExamples
-                        shutil.copyfileobj(gzip.open(trainExampleFile, 'rb'), combinedTrainExamplesFile)
+                    combinedTrainExamples = self.getExampleFileName(self.workDir + os.path.normpath(model.path)+"-"+self.tag+"combined-examples.gz")
+                    if self.binaryExamples: # binary example files consist of blocks indexed at the end of the file
+                        combinedTrainExamplesFile = ExampleUtils.openExampleFile(combinedTrainExamples)
+                        for trainExampleFile in [self.getExampleFileName(x) for x in trainExampleFiles]:
+                            print >> sys.stderr, "Catenating", trainExampleFile, "to", combinedTrainExamples
+                            ExampleUtils.appendExamples(ExampleUtils.readExamples(trainExampleFile), combinedTrainExamplesFile)
+                    else:
+                        combinedTrainExamplesFile = gzip.open(combinedTrainExamples, 'wb')
+                        for trainExampleFile in trainExampleFiles:
+                            print >> sys.stderr, "Catenating", trainExampleFile, "to", combinedTrainExamples
+                            shutil.copyfileobj(gzip.open(trainExampleFile, 'rb'), combinedTrainExamplesFile)
                     combinedTrainExamplesFile.close()
                 # Upload training model
                 # The parameter grid is stored in the model as "*classifier-parameters-train" so that endModel can 
@@ -80,14 +87,14 @@ class SingleStageDetector(Detector):
                 assert model.mode in ["a", "w"]
                 classifierWorkDir = self.workDir + os.path.normpath(model.path) + "-" + self.tag+ "models"
                 classifier = self.getClassifier(model.getStr(self.tag+"classifier-parameters-train"))(self.connection)
-                optimized = classifier.optimize("DUMMY", classifierWorkDir, model.getStr(self.tag+"classifier-parameters-train"), testExampleFile, model.get(self.tag+"ids.classes"), step="RESULTS", evaluator=self.evaluator, 
+                optimized = classifier.optimize("DUMMY", classifierWorkDir, model.getStr(self.tag+"classifier-parameters-train"), self.getExampleFileName(testExampleFile), model.get(self.tag+"ids.classes"), step="RESULTS", evaluator=self.evaluator, 
                                                 determineThreshold=("TEES.threshold" in model.getStr(self.tag+"classifier-parameters-train")))
                 #self.addClassifierModel(model, optimized.model, optimized.parameters, optimized.threshold)
                 optimized.saveModel(model, self.tag)
                 model.save()
                 # Check for catenated example file
                 if self.deleteCombinedExamples:
-                    combinedTrainExamples = os.path.normpath(model.path)+"-"+self.tag+"combined-examples.gz"
+                    combinedTrainExamples = self.getExampleFileName(os.path.normpath(model.path)+"-"+self.tag+"combined-examples.gz")
                     if os.path.exists(combinedTrainExamples):
                         print >> sys.stderr, "Deleting catenated training example file", combinedTrainExamples
                         os.remove(combinedTrainExamples)
@@ -132,9 +139,10 @@ class SingleStageDetector(Detector):
         if parse == None: parse = self.getStr(self.tag+"parse", model)
         workOutputTag = os.path.join(self.workDir, os.path.basename(output) + "-")
         xml = self.classifyToXML(data, model, None, workOutputTag, 
-            model.get(self.tag+"classifier-model", defaultIfNotExist=None), goldData, parse, float(model.getStr("recallAdjustParameter", defaultIfNotExist=1.0)))
+            self.getClassifierModel(model), goldData, parse, float(model.getStr("recallAdjustParameter", defaultIfNotExist=1.0)))
         if (validate):
             self.structureAnalyzer.load(model)
+            xml = ETUtils.ETFromObj(xml) # streamed output is returned as a file name
             self.structureAnalyzer.validate(xml)
             ETUtils.write(xml, output+"-pred.xml.gz")
         else:
@@ -151,27 +159,52 @@ class SingleStageDetector(Detector):
         self.deleteTempWorkDir()
         self.exitState()
         
-    def classifyToXML(self, data, model, exampleFileName=None, tag="", classifierModel=None, goldData=None, parse=None, recallAdjust=None, compressExamples=True, exampleStyle=None, useExistingExamples=False):
+    def classifyExamples(self, model, exampleFileName, tag="", classifierModel=None):
+        """
+        Classify an existing example file and return the predictions without recall adjustment
+        or thresholding, so that they can be reused with classifyToXML. The predictions are
+        returned as a NumPy matrix when possible, so that they are parsed only once for all the
+        recall adjustment values.
+        """
+        model = self.openModel(model, "r")
+        if not os.path.exists(exampleFileName): # an existing file (e.g. one converted for the classifier) is used as is
+            exampleFileName = self.getExampleFileName(exampleFileName)
+        if classifierModel == None:
+            classifierModel = self.getClassifierModel(model)
+        classifier = self.getClassifier(model.getStr(self.tag+"classifier-parameter", defaultIfNotExist=None))()
+        classifier.classify(exampleFileName, tag+self.tag+"classifications", classifierModel, finishBeforeReturn=True)
+        if ExampleUtils.numpyAvailable:
+            try:
+                return ExampleUtils.loadPredictionMatrix(tag+self.tag+"classifications")
+            except ValueError: # true binary, multilabel or N/A predictions
+                pass
+        return list(ExampleUtils.loadPredictions(tag+self.tag+"classifications"))
+    
+    def classifyToXML(self, data, model, exampleFileName=None, tag="", classifierModel=None, goldData=None, parse=None, recallAdjust=None, compressExamples=True, exampleStyle=None, useExistingExamples=False, predictions=None):
         model = self.openModel(model, "r")
         if parse == None:
             parse = self.getStr(self.tag+"parse", model)
-        if useExistingExamples:
-            assert exampleFileName != None
-            assert os.path.exists(exampleFileName)
         if exampleFileName == None:
             exampleFileName = tag+self.tag+"examples"
             if compressExamples:
                 exampleFileName += ".gz"
+        exampleFileName = self.getExampleFileName(exampleFileName)
+        if useExistingExamples:
+            assert exampleFileName != None
+            assert os.path.exists(exampleFileName)
         if not useExistingExamples:
             self.buildExamples(model, [data], [exampleFileName], [goldData], parse=parse, exampleStyle=exampleStyle)
-        if classifierModel == None:
-            classifierModel = model.get(self.tag+"classifier-model", defaultIfNotExist=None)
-        #else:
-        #    assert os.path.exists(classifierModel), classifierModel
-        classifier = self.getClassifier(model.getStr(self.tag+"classifier-parameter", defaultIfNotExist=None))()
-        classifier.classify(exampleFileName, tag+self.tag+"classifications", classifierModel, finishBeforeReturn=True)
         threshold = model.getStr(self.tag+"threshold", defaultIfNotExist=None, asType=float)
-        predictions = ExampleUtils.loadPredictions(tag+self.tag+"classifications", recallAdjust, threshold=threshold)
+        if predictions is None: # a matrix from classifyExamples can't be compared with ==
+            if classifierModel == None:
+                classifierModel = self.getClassifierModel(model)
+            #else:
+            #    assert os.path.exists(classifierModel), classifierModel
+            classifier = self.getClassifier(model.getStr(self.tag+"classifier-parameter", defaultIfNotExist=None))()
+            classifier.classify(exampleFileName, tag+self.tag+"classifications", classifierModel, finishBeforeReturn=True)
+            predictions = ExampleUtils.loadPredictions(tag+self.tag+"classifications", recallAdjust, threshold=threshold)
+        else: # predictions from classifyExamples
+            predictions = ExampleUtils.adjustPredictions(predictions, recallAdjust, threshold)
         evaluator = self.evaluator.evaluate(exampleFileName, predictions, model.get(self.tag+"ids.classes"))
         #outputFileName = tag+"-"+self.tag+"pred.xml.gz"
         #exampleStyle = self.exampleBuilder.getParameters(model.getStr(self.tag+"example-style"))
@@ -640,9 +640,8 @@ class StructureAnalyzer():
         f.close()
     
     def loadTypeMap(self, model, filename):
-        filename = model.get(filename, defaultIfNotExist=None)
-        if filename:
-            f = open(filename, "rt")
+        if model.hasMember(filename):
+            f = model.openMember(filename)
             self.typeMap = json.load(f)
             f.close()
     
@@ -652,8 +651,9 @@ class StructureAnalyzer():
             filename = self.modelFileName
         if model != None:
             self.loadTypeMap(model, filename + "_type_map.json")
-            filename = model.get(filename)
-        f = open(filename, "rt")
+            f = model.openMember(filename)
+        else:
+            f = open(filename, "rt")
         lines = f.readlines()
         f.close()
         # initialize
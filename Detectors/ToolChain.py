@@ -5,11 +5,13 @@ import Utils.ElementTreeUtils as ETUtils
 #import Utils.Parameters as Parameters
 import itertools
 import copy
+import shutil
+from collections import defaultdict
 
 #NOTHING = object()
 
 class Step():
-    def __init__(self, name, func, argDict=None, ioArgNames=None, funcCls=None, argListKey=None, group=None):
+    def __init__(self, name, func, argDict=None, ioArgNames=None, funcCls=None, argListKey=None, group=None, documentLocal=False):
         self.name = name
         self.func = func
         self.funcCls = funcCls
@@ -21,6 +23,7 @@ class Step():
                 if self.ioArgNames[key] not in self.argDict:
                     self.argDict[self.ioArgNames[key]] = None
         self.group = group
+        self.documentLocal = documentLocal # the step processes each document independently of the others
     
     def isAlias(self):
         return isinstance(self.func, (list, tuple))
@@ -46,6 +49,9 @@ class Step():
     def run(self, *args, **kwargs):
         arguments = self.getArgs(*args, **kwargs)
         print >> sys.stderr, "Running step", self.name, "with arguments", arguments
+        return self.execute(arguments)
+    
+    def execute(self, arguments):
         if self.funcCls == None:
             return self.func(**arguments)
         else:
@@ -83,6 +89,8 @@ class ToolChain(Detector):
         self.compressIntermediateFiles = True
         self.intermediateFileTag = "temp"
         self.modelParameterStringName = None
+        self.streamWindow = None # if defined, document-local steps are run in windows of this many documents
+        self.resumeStream = False # if True, windows saved as checkpoints by an interrupted run are reused
     
     def getSteps(self, steps):
         print >> sys.stderr, "Initializing steps:", steps
@@ -104,9 +112,9 @@ class ToolChain(Detector):
     def defGroup(self, group):
         self.group = group
     
-    def defStep(self, name, func, argDict=None, ioArgNames=None, funcCls=None, argListKey=None):
+    def defStep(self, name, func, argDict=None, ioArgNames=None, funcCls=None, argListKey=None, documentLocal=False):
         assert name not in self.definedStepDict
-        step = Step(name, func, argDict, ioArgNames, funcCls, argListKey, self.group)
+        step = Step(name, func, argDict, ioArgNames, funcCls, argListKey, self.group, documentLocal)
         self.definedStepDict[name] = step
         self.definedSteps.append(step)
     
@@ -269,8 +277,19 @@ class ToolChain(Detector):
             print >> sys.stderr, "Removing existing preprocessor output file", output
             os.remove(output)
         savedIntermediate = None # Output from a previous step if "fromStep" is used
-        for step in self.steps:
-            if self.checkStep(step.name):
+        stepIndex = 0
+        while stepIndex < len(self.steps):
+            step = self.steps[stepIndex]
+            streamSteps = self.getStreamSteps(stepIndex, output)
+            stepIndex += max(1, len(streamSteps))
+            if len(streamSteps) > 0: # Consecutive document-local steps are fused into a per-document pipeline
+                streamSteps = [x for x in streamSteps if self.checkStep(x.name)]
+                if len(streamSteps) > 0:
+                    if savedIntermediate != None:
+                        source = savedIntermediate
+                        savedIntermediate = None
+                    source = self.processStream(streamSteps, source, self.getStreamOutput(streamSteps, output))
+            elif self.checkStep(step.name):
                 if savedIntermediate != None: # A previous run of the program saved an intermediate file
                     print >> sys.stderr, "Reading input from saved intermediate file", savedIntermediate
                     source = ETUtils.ETFromObj(savedIntermediate)
@@ -305,6 +324,151 @@ class ToolChain(Detector):
     
     def save(self, input, output=None):
         xml = ETUtils.ETFromObj(input)
-        print >> sys.stderr, "Writing output to", output
-        ETUtils.write(input, output)
-        return xml
\ No newline at end of file
+        if output != None:
+            print >> sys.stderr, "Writing output to", output
+            ETUtils.write(input, output)
+        return xml
+    
+    ###########################################################################
+    # Streaming
+    ###########################################################################
+    
+    def getStreamSteps(self, stepIndex, output):
+        """
+        Return the consecutive document-local steps starting from stepIndex, or an empty
+        list if streaming is not enabled for them.
+        """
+        if self.streamWindow == None or output == None:
+            return []
+        streamSteps = []
+        for step in self.steps[stepIndex:]:
+            if not self.isStreamable(step, output) or self.getStepStatus(step.name) not in ("PROCESS", "OMIT", "NOT_EXIST"):
+                break
+            streamSteps.append(step)
+        return streamSteps
+    
+    def isStreamable(self, step, output):
+        return step.documentLocal
+    
+    def getStreamOutput(self, steps, output):
+        if steps[-1] == self.steps[-1]: # The final step writes the final output
+            return output
+        rv = os.path.join(self.outDir, self.intermediateFileTag + "-" + steps[-1].name.lower() + ".xml")
+        if self.compressIntermediateFiles:
+            rv += ".gz"
+        return rv
+    
+    def getDocumentWindows(self, source, windowSize):
+        """
+        Read a corpus one document at a time, yielding windows of at most windowSize documents
+        as new corpus elements. Only the documents of the current window are kept in memory
+        when the source is a file.
+        """
+        if isinstance(source, ETUtils.ElementTree.ElementTree) or ETUtils.ElementTree.iselement(source):
+            root = ETUtils.ETFromObj(source).getroot()
+            events = itertools.chain([("start", root)], [("end", x) for x in root.findall("document")])
+        else:
+            events = ETUtils.ETIteratorFromObj(source, ("start", "end"))
+        corpus = None
+        documents = []
+        numWindows = 0
+        for event, element in events:
+            if corpus == None: # The root element, whose attributes are cleared by the iterator after the first element
+                corpus = (element.tag, dict(element.attrib))
+            elif event == "end" and element.tag == "document":
+                documents.append(element)
+                if len(documents) >= windowSize:
+                    yield self.makeWindow(corpus, documents)
+                    numWindows += 1
+                    documents = []
+        if len(documents) > 0 or numWindows == 0:
+            yield self.makeWindow(corpus, documents)
+    
+    def makeWindow(self, corpus, documents):
+        root = ETUtils.ElementTree.Element(corpus[0], corpus[1])
+        for document in documents:
+            root.append(document)
+        return root
+    
+    def processWindow(self, steps, root):
+        xml = ETUtils.ElementTree.ElementTree(root)
+        for step in steps:
+            stepArgs = {step.ioArgNames["input"]:xml}
+            if "output" in step.ioArgNames:
+                stepArgs[step.ioArgNames["output"]] = None
+            result = step.execute(step.getArgs(**stepArgs))
+            if result != None:
+                xml = result
+        return ETUtils.ETFromObj(xml).getroot()
+    
+    def getStepSignature(self, steps):
+        """
+        Describe the steps and their arguments, excluding the input and output which differ between windows.
+        """
+        signature = []
+        for step in steps:
+            ioArgs = step.ioArgNames.values()
+            args = ",".join([x + "=" + repr(step.argDict[x]) for x in sorted(step.argDict.keys()) if x not in ioArgs])
+            signature.append(step.name + "(" + args + ")")
+        return ";".join(signature)
+    
+    def loadCheckpoint(self, checkpoint, documentIds, signature):
+        """
+        Return the processed window from a previous run, if it was made by the same steps with the
+        same arguments and its documents match the current window.
+        """
+        if not os.path.exists(checkpoint):
+            return None
+        root = ETUtils.ETFromObj(checkpoint).getroot()
+        if root.get("checkpointSteps") != signature:
+            print >> sys.stderr, "Warning, ignoring checkpoint", checkpoint, "made with different steps or arguments"
+            return None
+        if [x.get("id") for x in root.findall("document")] != documentIds:
+            return None
+        del root.attrib["checkpointSteps"]
+        return root
+    
+    def processStream(self, steps, source, output):
+        """
+        Run a sequence of document-local steps as one pipeline over windows of documents. Each
+        processed window is saved as a checkpoint, so an interrupted run can be continued by
+        running the tool chain again with the same output and resumeStream enabled.
+        """
+        print >> sys.stderr, "Streaming steps", [x.name for x in steps], "in windows of", self.streamWindow, "documents to", output
+        checkpointDir = output + "-checkpoints"
+        if os.path.exists(checkpointDir) and not self.resumeStream:
+            print >> sys.stderr, "Removing checkpoints of a previous run", checkpointDir
+            shutil.rmtree(checkpointDir)
+        if not os.path.exists(checkpointDir):
+            os.makedirs(checkpointDir)
+        signature = self.getStepSignature(steps)
+        ext = ".xml.gz" if self.compressIntermediateFiles else ".xml"
+        counts = defaultdict(int)
+        writer = None
+        windowIndex = 0
+        for window in self.getDocumentWindows(source, int(self.streamWindow)):
+            checkpoint = os.path.join(checkpointDir, "window-" + str(windowIndex) + ext)
+            root = self.loadCheckpoint(checkpoint, [x.get("id") for x in window.findall("document")], signature)
+            if root == None:
+                root = self.processWindow(steps, window)
+                root.set("checkpointSteps", signature)
+                ETUtils.write(root, checkpoint + "-partial" + ext) # a checkpoint exists only for a completed window
+                os.rename(checkpoint + "-partial" + ext, checkpoint)
+                del root.attrib["checkpointSteps"]
+                counts["processed"] += 1
+            else:
+                counts["restored"] += 1
+            if writer == None:
+                writer = ETUtils.ETWriter(os.path.abspath(output))
+                writer.begin(root)
+            for document in root.findall("document"):
+                writer.write(document)
+                counts["documents"] += 1
+            windowIndex += 1
+        writer.end(root)
+        writer.close()
+        ETUtils.encodeNewlines(output)
+        print >> sys.stderr, "Streamed windows:", dict(counts)
+        if not self.debug:
+            shutil.rmtree(checkpointDir)
+        return output
\ No newline at end of file
@@ -35,7 +35,7 @@ class UnmergingDetector(SingleStageDetector):
                 if dataSet != None:
                     self.exampleBuilder.run(dataSet, output, parse, None, exampleStyle, model.get(self.tag+"ids.classes", 
                         True), model.get(self.tag+"ids.features", True), goldSet, append, saveIdsToModel,
-                        structureAnalyzer=self.structureAnalyzer)
+                        structureAnalyzer=self.structureAnalyzer, workers=self.workers)
                 append = True
         if saveIdsToModel:
             model.save()
\ No newline at end of file
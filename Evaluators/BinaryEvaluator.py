@@ -8,6 +8,100 @@ import types
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
 from Core.IdSet import IdSet
 import Core.ExampleUtils as ExampleUtils
+try:
+    import numpy
+    numpy.array([])
+    numpyAvailable = True
+except:
+    numpyAvailable = False
+
+def _getTieGroups(sortedScores):
+    """
+    Return the (begin, end) index ranges of equal values in a sorted score list
+    """
+    groups = []
+    begin = 0
+    for i in range(1, len(sortedScores) + 1):
+        if i == len(sortedScores) or sortedScores[i] != sortedScores[begin]:
+            groups.append((begin, i))
+            begin = i
+    return groups
+
+def getAUC(labels, scores):
+    """
+    Calculate the area under the ROC curve as the Mann-Whitney U statistic of the
+    positive example ranks. Tied scores get their average rank, i.e. a tied 
+    positive-negative pair counts as half a correct ordering.
+    
+    @param labels: True for positive examples
+    @param scores: confidence scores, higher is more positive
+    @return: the AUC, or 0 if there are no positive or no negative examples
+    """
+    numPositives = sum([1 for x in labels if x])
+    numNegatives = len(labels) - numPositives
+    if numPositives * numNegatives == 0:
+        return 0
+    if numpyAvailable:
+        labels = numpy.asarray(labels, dtype=bool)
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        order = numpy.argsort(scores, kind="mergesort")
+        sortedScores = scores[order]
+        isFirst = numpy.concatenate([[True], sortedScores[1:] != sortedScores[:-1]])
+        begins = numpy.flatnonzero(isFirst)
+        ends = numpy.concatenate([begins[1:], [len(scores)]])
+        ranks = ((begins + ends + 1) / 2.0)[numpy.cumsum(isFirst) - 1]
+        rankSum = ranks[labels[order]].sum()
+    else:
+        order = sorted(range(len(scores)), key=lambda i: scores[i])
+        rankSum = 0.0
+        for begin, end in _getTieGroups([scores[i] for i in order]):
+            rank = (begin + end + 1) / 2.0
+            rankSum += rank * sum([1 for i in order[begin:end] if labels[i]])
+    return (rankSum - numPositives * (numPositives + 1) / 2.0) / float(numPositives * numNegatives)
+
+def getPrecisionRecallCurve(labels, scores):
+    """
+    Calculate precision and recall when thresholding at each distinct score, from
+    the highest score down.
+    
+    @return: lists of precision, recall and the score threshold at each point
+    """
+    numPositives = sum([1 for x in labels if x])
+    if numPositives == 0:
+        return [], [], []
+    if numpyAvailable:
+        labels = numpy.asarray(labels, dtype=bool)
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        order = numpy.argsort(-scores, kind="mergesort")
+        sortedScores = scores[order]
+        isLast = numpy.concatenate([sortedScores[1:] != sortedScores[:-1], [True]])
+        truePositives = numpy.cumsum(labels[order])[isLast]
+        predicted = numpy.flatnonzero(isLast) + 1
+        precision = truePositives / predicted.astype(numpy.float64)
+        recall = truePositives / float(numPositives)
+        return precision.tolist(), recall.tolist(), sortedScores[isLast].tolist()
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    precision, recall, thresholds = [], [], []
+    truePositives = 0
+    for begin, end in _getTieGroups([scores[i] for i in order]):
+        truePositives += sum([1 for i in order[begin:end] if labels[i]])
+        precision.append(truePositives / float(end))
+        recall.append(truePositives / float(numPositives))
+        thresholds.append(scores[order[begin]])
+    return precision, recall, thresholds
+
+def getAveragePrecision(labels, scores):
+    """
+    Calculate the average precision, the precision at each threshold weighted by the
+    increase in recall from the previous threshold
+    """
+    precision, recall, thresholds = getPrecisionRecallCurve(labels, scores)
+    averagePrecision = 0.0
+    prevRecall = 0.0
+    for p, r in zip(precision, recall):
+        averagePrecision += (r - prevRecall) * p
+        prevRecall = r
+    return averagePrecision
 
 class BinaryEvaluator(Evaluator.Evaluator):
     def __init__(self, examples=None, predictions=None, classSet=None, mapClasses=None):
@@ -27,6 +121,9 @@ class BinaryEvaluator(Evaluator.Evaluator):
         self.recall = None
         self.fScore = None
         self.AUC = None
+        self.averagePrecision = None
+        self.labels = [] # the true classes as booleans
+        self.scores = [] # the confidence scores for the positive class
         self.type = "binary"
         if predictions != None:
             self._calculate(examples, predictions, mapClasses)
@@ -56,6 +153,7 @@ class BinaryEvaluator(Evaluator.Evaluator):
         averageEvaluator.recall = 0
         averageEvaluator.fScore = 0
         averageEvaluator.AUC = 0
+        averageEvaluator.averagePrecision = 0
         averageEvaluator.truePositives = "-"
         averageEvaluator.falsePositives = "-"
         averageEvaluator.trueNegatives = "-"
@@ -63,17 +161,23 @@ class BinaryEvaluator(Evaluator.Evaluator):
         sumWeight = 0.0
         for evaluator in evaluators:
             assert(isinstance(evaluator,BinaryEvaluator))
-            weight = float(len(evaluator.predictions))
+            weight = float(len(evaluator.labels))
             sumWeight += weight
             averageEvaluator.precision += weight * evaluator.precision
             averageEvaluator.recall += weight * evaluator.recall
             averageEvaluator.fScore += weight * evaluator.fScore
             if evaluator.AUC != None:
                 averageEvaluator.AUC += weight * evaluator.AUC
+            if evaluator.averagePrecision != None:
+                averageEvaluator.averagePrecision += weight * evaluator.averagePrecision
         if averageEvaluator.AUC > 0:
             averageEvaluator.AUC /= sumWeight
         else:
             averageEvaluator.AUC = None
+        if averageEvaluator.averagePrecision > 0:
+            averageEvaluator.averagePrecision /= sumWeight
+        else:
+            averageEvaluator.averagePrecision = None
         if sumWeight > 0:
             averageEvaluator.precision /= sumWeight
             averageEvaluator.recall /= sumWeight
@@ -82,45 +186,46 @@ class BinaryEvaluator(Evaluator.Evaluator):
     average = staticmethod(average)
     
     def pool(evaluators):
-        predictions = []
+        pooledEvaluator = BinaryEvaluator(None)
         for evaluator in evaluators:
             assert(isinstance(evaluator,BinaryEvaluator))
-            predictions.extend(evaluator.predictions)
-        return BinaryEvaluator(predictions)
-    pool = staticmethod(pool)      
+            pooledEvaluator.truePositives += evaluator.truePositives
+            pooledEvaluator.falsePositives += evaluator.falsePositives
+            pooledEvaluator.trueNegatives += evaluator.trueNegatives
+            pooledEvaluator.falseNegatives += evaluator.falseNegatives
+            pooledEvaluator.labels.extend(evaluator.labels)
+            pooledEvaluator.scores.extend(evaluator.scores)
+        pooledEvaluator._calculateStatistics()
+        return pooledEvaluator
+    pool = staticmethod(pool)
     
-    def __calculateAUC(self, examples, predictions, mapClasses):
-        numPositiveExamples = 0
-        numNegativeExamples = 0
-        predictionsForPositives = []
-        predictionsForNegatives = []
-        for example, prediction in itertools.izip(examples, predictions):
-            trueClass = self._getClass(example[1], mapClasses) #prediction[0][1]
-            predictedClass = self._getClass(prediction[0], mapClasses) #prediction[1]
-            if trueClass > 0:
-                numPositiveExamples += 1
-                if predictedClass > 0:
-                    predictionsForPositives.append(1)
-                else:
-                    predictionsForPositives.append(0)
-            else:
-                numNegativeExamples += 1
-                if predictedClass > 0:
-                    predictionsForNegatives.append(1)
+    def _getScore(self, prediction, predictedClass, mapClasses):
+        """
+        The confidence of a prediction for the positive class. For multiclass predictions this 
+        is the margin between the best positive and the best negative class. If no scores are
+        available, the predicted class is used as the score.
+        """
+        if len(prediction) == 1 and mapClasses == None: # true binary
+            return float(prediction[0])
+        elif len(prediction) > 2:
+            positives = []
+            negatives = []
+            for cls in range(1, len(prediction)):
+                if mapClasses != None and cls not in mapClasses:
+                    continue
+                if self._getClass(cls, mapClasses) > 0:
+                    positives.append(prediction[cls])
                 else:
-                    predictionsForNegatives.append(0)
-        auc = 0
-        for i in predictionsForPositives:
-           for j in predictionsForNegatives:
-               if i > j:
-                   auc += 1.
-               elif i == j:
-                   auc += 0.5
-        if numPositiveExamples * numNegativeExamples > 0:
-            auc /= float(numPositiveExamples * numNegativeExamples)
-        else:
-            auc = 0
-        return auc
+                    negatives.append(prediction[cls])
+            if len(positives) > 0 and len(negatives) > 0 and "N/A" not in positives + negatives:
+                return max(positives) - max(negatives)
+        return 1.0 if predictedClass > 0 else 0.0
+    
+    def getPrecisionRecallCurve(self):
+        """
+        Return the precision, recall and score threshold lists of the precision-recall curve
+        """
+        return getPrecisionRecallCurve(self.labels, self.scores)
     
     def _getClass(self, cls, mapClasses):
         if mapClasses == None:
@@ -136,6 +241,8 @@ class BinaryEvaluator(Evaluator.Evaluator):
         for example, prediction in itertools.izip(examples, predictions):
             trueClass = self._getClass(example[1], mapClasses) #prediction[0][1]
             predictedClass = self._getClass(prediction[0], mapClasses) #prediction[1]
+            self.labels.append(trueClass > 0)
+            self.scores.append(self._getScore(prediction, predictedClass, mapClasses))
             if trueClass > 0:
                 if predictedClass > 0: # 1,1
                     self.truePositives += 1
@@ -150,7 +257,9 @@ class BinaryEvaluator(Evaluator.Evaluator):
                 else: # -1,-1
                     self.trueNegatives += 1
                     self.classifications.append((prediction[0],"tn",self.type))
-        # Then calculate statistics
+        self._calculateStatistics()
+    
+    def _calculateStatistics(self):
         totalPositives = float(self.truePositives + self.falsePositives)
         if totalPositives > 0.0:
             self.precision = float(self.truePositives) / totalPositives
@@ -166,7 +275,8 @@ class BinaryEvaluator(Evaluator.Evaluator):
         else:
             self.fScore = 0.0
         
-        self.AUC = self.__calculateAUC(examples, predictions, mapClasses)
+        self.AUC = getAUC(self.labels, self.scores)
+        self.averagePrecision = getAveragePrecision(self.labels, self.scores)
     
     def toStringConcise(self, indent="", title=None):
         if title != None:
@@ -180,6 +290,8 @@ class BinaryEvaluator(Evaluator.Evaluator):
             string += " a:" + str(self.AUC)[0:6]
         else:
             string += " a:N/A"
+        if self.averagePrecision != None:
+            string += " ap:" + str(self.averagePrecision)[0:6]
         return string
     
 #    def saveCSV(self, filename, fold=None):
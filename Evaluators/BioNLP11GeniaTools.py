@@ -2,12 +2,14 @@ import sys, os, shutil
 import subprocess
 import tempfile
 import codecs
+import types
 thisPath = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(thisPath,".."))
 import Utils.Settings as Settings
 import Utils.Download as Download
 import Utils.STFormat
 import Utils.ElementTreeUtils as ETUtils
+import Evaluators.BioNLPEventEvaluator as BioNLPEventEvaluator
 
 # TODO: Move somewhere else
 #sys.path.append(os.path.abspath(os.path.join(thisPath, "../GeniaChallenge/evaluation")))
@@ -194,6 +196,12 @@ def evaluate(source, task, goldDir=None, debug=False):
     if "." in task:
         task, subTasks = task.split(".")
         subTasks = [int(x) for x in subTasks]
+    # Predictions given as documents are evaluated in memory or written to disk for the official tools
+    tempDir = None
+    if type(source) not in types.StringTypes and task not in Settings.NATIVE_EVALUATOR_TASKS:
+        tempDir = tempfile.mkdtemp()
+        Utils.STFormat.STTools.writeSet(source, os.path.join(tempDir, "events"))
+        source = os.path.join(tempDir, "events")
     # Do the evaluation
     if task in ["GE11", "GE09"]:
         for subTask in subTasks:
@@ -212,6 +220,8 @@ def evaluate(source, task, goldDir=None, debug=False):
     else:
         results = None
         print >> sys.stderr, "No official evaluator for task", task
+    if tempDir != None:
+        shutil.rmtree(tempDir)
     # Return results
     if results == None:
         return None
@@ -291,9 +301,13 @@ def checkEvaluator(corpus, sourceDir, goldDir = None):
         tempdir = os.path.abspath(tempdir)
     return evaluatorDir, sourceDir, goldDir, tempdir
 
-def evaluateGE(sourceDir, mainTask="GE11", task=1, goldDir=None, folds=-1, foldToRemove=-1, evaluations=["strict", "approximate", "decomposition"], verbose=True, silent=False, debug=False):
+def evaluateGE(sourceDir, mainTask="GE11", task=1, goldDir=None, folds=-1, foldToRemove=-1, evaluations=["strict", "approximate", "decomposition"], verbose=True, silent=False, debug=False, native=None):
     assert mainTask in ["GE11", "GE09"], mainTask
     assert task in [1, 2, 3], (task, type(task))
+    if native == None: # use the in-process evaluator for the tasks defined in the settings
+        native = mainTask in Settings.NATIVE_EVALUATOR_TASKS
+    if native and folds == -1:
+        return BioNLPEventEvaluator.evaluate(sourceDir, mainTask, task, goldDir, evaluations, silent)
     if not silent:
         print >> sys.stderr, mainTask, "task", task, "evaluation of", sourceDir, "against", goldDir
     if mainTask == "GE11":
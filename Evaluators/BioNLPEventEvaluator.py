@@ -0,0 +1,458 @@
+"""
+In-process evaluation of GENIA-style BioNLP Shared Task event predictions.
+
+Implements the strict, approximate span and recursive and event decomposition
+evaluation modes of the official a2-evaluate.pl script directly on STTools.Document
+objects, so that predictions can be evaluated in memory without writing the
+ST-format files or running the Perl tools.
+"""
+import sys, os
+import types
+thisPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(thisPath,".."))
+import Utils.Settings as Settings
+import Utils.STFormat.STTools as STTools
+
+# The GENIA event classes and the summary rows of the result table
+EVENT_CLASSES = [("SVT-TOTAL", ["Gene_expression", "Transcription", "Protein_catabolism", "Phosphorylation", "Localization"]),
+                 ("EVT-TOTAL", ["Binding"]), # EVT-TOTAL includes also the SVT events
+                 ("REG-TOTAL", ["Regulation", "Positive_regulation", "Negative_regulation"])]
+MODIFIER_TYPES = ["Negation", "Speculation"]
+EVALUATIONS = ["strict", "approximate", "decomposition"]
+# Characters that separate the words used for extending gold spans in the approximate span mode
+WORD_DELIMITERS = set(" \t\n\r.,;:!?\"'")
+
+_goldSets = {} # loaded gold documents by package path and a2 file tag
+
+def getGoldPath(corpus, goldDir=None):
+    """
+    Return the gold data directory or package for a corpus, using the evaluator
+    gold data settings if no gold directory is given.
+    """
+    if goldDir != None:
+        return goldDir if os.path.exists(goldDir) else None
+    if not hasattr(Settings, "BIONLP_EVALUATOR_GOLD_DIR"):
+        print >> sys.stderr, corpus, "BIONLP_EVALUATOR_GOLD_DIR setting not defined"
+        return None
+    for setName in ["DEVEL", "TEST"]:
+        if Settings.EVALUATOR.has_key(corpus + "_" + setName + "-gold"):
+            goldPath = os.path.join(Settings.BIONLP_EVALUATOR_GOLD_DIR, Settings.EVALUATOR[corpus + "_" + setName + "-gold"])
+            if os.path.exists(goldPath):
+                return goldPath
+            print >> sys.stderr, corpus, "Evaluator gold data", goldPath, "does not exist"
+    return None
+
+def loadGold(goldPath, a2Tag="a2"):
+    """
+    Load the gold documents from a directory or a tar.gz/zip package. The documents
+    are cached so that repeated evaluations (e.g. a parameter grid) parse them only once.
+
+    @return: a dictionary of gold documents by document id
+    """
+    key = (os.path.abspath(goldPath), a2Tag)
+    if key not in _goldSets:
+        print >> sys.stderr, "Loading evaluation gold from", goldPath
+        _goldSets[key] = dict([(x.id, x) for x in STTools.loadSet(goldPath, a2Tags=[a2Tag])])
+    return _goldSets[key]
+
+def getSpan(ann):
+    return (min([x[0] for x in ann.charOffsets]), max([x[1] for x in ann.charOffsets]))
+
+def extendSpan(text, span):
+    """
+    Extend a span by one word on both sides, as allowed in the approximate span mode
+    """
+    begin, end = span
+    while begin > 0 and text[begin - 1] in WORD_DELIMITERS:
+        begin -= 1
+    while begin > 0 and text[begin - 1] not in WORD_DELIMITERS:
+        begin -= 1
+    while end < len(text) and text[end] in WORD_DELIMITERS:
+        end += 1
+    while end < len(text) and text[end] not in WORD_DELIMITERS:
+        end += 1
+    return (begin, end)
+
+class DocumentMatcher:
+    """
+    Matches the events of a predicted document against the events of its gold document
+    """
+    def __init__(self, answerDoc, goldDoc, task=1, approximateSpan=False, approximateRecursive=False):
+        self.answerDoc = answerDoc
+        self.goldDoc = goldDoc
+        self.task = task
+        self.approximateSpan = approximateSpan
+        self.approximateRecursive = approximateRecursive
+        self.goldProteins = set([id(x) for x in goldDoc.proteins])
+        self.extendedSpans = {}
+        self.eventMatches = {}
+
+    def getEvents(self, document):
+        return [x for x in document.events if x.trigger != None]
+
+    def getArguments(self, event, nested=False):
+        """
+        The arguments evaluated for the task. Task 1 is evaluated only for the primary
+        arguments and in the approximate recursive mode only the themes of nested events matter.
+        """
+        arguments = []
+        for arg in event.arguments:
+            if arg.type == "CorefTarget":
+                continue
+            if self.task == 1 and arg.type not in ("Theme", "Cause"):
+                continue
+            if nested and self.approximateRecursive and arg.type != "Theme":
+                continue
+            arguments.append(arg)
+        return arguments
+
+    def matchSpan(self, answerAnn, goldAnn):
+        if not self.approximateSpan:
+            return getSpan(answerAnn) == getSpan(goldAnn)
+        if id(goldAnn) not in self.extendedSpans:
+            self.extendedSpans[id(goldAnn)] = extendSpan(self.goldDoc.text, getSpan(goldAnn))
+        answerSpan = getSpan(answerAnn)
+        goldSpan = self.extendedSpans[id(goldAnn)]
+        return goldSpan[0] <= answerSpan[0] and answerSpan[1] <= goldSpan[1]
+
+    def matchTarget(self, answerTarget, goldTarget):
+        if goldTarget.trigger != None: # nested event
+            return answerTarget.trigger != None and self.matchEvent(answerTarget, goldTarget, True)
+        elif answerTarget.trigger != None:
+            return False
+        elif id(goldTarget) in self.goldProteins: # proteins are given, so they match exactly or by equivalence
+            answerSpan = getSpan(answerTarget)
+            for protein in [goldTarget] + goldTarget.equiv:
+                if getSpan(protein) == answerSpan:
+                    return True
+            return False
+        else: # entities, such as sites and locations
+            return answerTarget.type == goldTarget.type and self.matchSpan(answerTarget, goldTarget)
+
+    def matchArgument(self, answerArg, goldArg):
+        if answerArg.type != goldArg.type or not self.matchTarget(answerArg.target, goldArg.target):
+            return False
+        if goldArg.siteOf != None:
+            return answerArg.siteOf != None and answerArg.siteOf.type == goldArg.siteOf.type and self.matchTarget(answerArg.siteOf.target, goldArg.siteOf.target)
+        return True
+
+    def matchArguments(self, answerArgs, goldArgs):
+        """
+        Match two argument lists as multisets, with backtracking for the cases where an
+        answer argument matches more than one gold argument.
+        """
+        if len(answerArgs) != len(goldArgs):
+            return False
+        used = [False] * len(answerArgs)
+        def assign(goldIndex):
+            if goldIndex == len(goldArgs):
+                return True
+            for i in range(len(answerArgs)):
+                if not used[i] and self.matchArgument(answerArgs[i], goldArgs[goldIndex]):
+                    used[i] = True
+                    if assign(goldIndex + 1):
+                        return True
+                    used[i] = False
+            return False
+        return assign(0)
+
+    def matchEvent(self, answerEvent, goldEvent, nested=False):
+        key = (id(answerEvent), id(goldEvent), nested)
+        if key not in self.eventMatches:
+            self.eventMatches[key] = False # guards against cyclic event references
+            self.eventMatches[key] = (answerEvent.type == goldEvent.type and self.matchSpan(answerEvent.trigger, goldEvent.trigger)
+                                      and self.matchArguments(self.getArguments(answerEvent, nested), self.getArguments(goldEvent, nested)))
+        return self.eventMatches[key]
+
+    def matchPart(self, answerPart, goldPart):
+        """
+        Match decomposed events (event and a single argument) or modifications (modifier type and event)
+        """
+        if type(answerPart[1]) in types.StringTypes: # modification
+            return answerPart[1] == goldPart[1] and self.matchEvent(answerPart[0], goldPart[0])
+        answerEvent, answerArg = answerPart
+        goldEvent, goldArg = goldPart
+        return (answerEvent.type == goldEvent.type and self.matchSpan(answerEvent.trigger, goldEvent.trigger)
+                and self.matchArgument(answerArg, goldArg))
+
+    def decompose(self, document):
+        parts = []
+        for event in self.getEvents(document):
+            for arg in self.getArguments(event):
+                parts.append((event, arg))
+        return parts
+
+    def getModifications(self, document):
+        parts = []
+        for event in self.getEvents(document):
+            if event.negation != None:
+                parts.append((event, "Negation"))
+            if event.speculation != None:
+                parts.append((event, "Speculation"))
+        return parts
+
+    def count(self, answerItems, goldItems, matchFunction, getClass, counts):
+        """
+        Count the gold and answer items as in a2-evaluate.pl, where the gold items and the answer
+        items are matched independently: an item is matched if any item on the other side matches it.
+        """
+        for goldItem in goldItems:
+            row = counts.setdefault(getClass(goldItem), [0, 0, 0, 0])
+            row[0] += 1
+            for answerItem in answerItems:
+                if matchFunction(answerItem, goldItem):
+                    row[1] += 1
+                    break
+        for answerItem in answerItems:
+            row = counts.setdefault(getClass(answerItem), [0, 0, 0, 0])
+            row[2] += 1
+            for goldItem in goldItems:
+                if matchFunction(answerItem, goldItem):
+                    row[3] += 1
+                    break
+
+    def countEvents(self, counts):
+        self.count(self.getEvents(self.answerDoc), self.getEvents(self.goldDoc), self.matchEvent, lambda x: x.type, counts)
+
+    def countDecomposed(self, counts):
+        self.count(self.decompose(self.answerDoc), self.decompose(self.goldDoc), self.matchPart, lambda x: x[0].type, counts)
+
+    def countModifications(self, counts):
+        self.count(self.getModifications(self.answerDoc), self.getModifications(self.goldDoc), self.matchPart, lambda x: x[1], counts)
+
+def getRow(counts):
+    gold, goldMatch, answer, answerMatch = counts
+    recall = 100.0 * goldMatch / gold if gold > 0 else 0.0
+    precision = 100.0 * answerMatch / answer if answer > 0 else 0.0
+    fscore = 2 * recall * precision / (recall + precision) if recall + precision > 0 else 0.0
+    # Values are rounded like in the result table of the official evaluator
+    return {"gold":gold, "gold_match":goldMatch, "answer":answer, "answer_match":answerMatch,
+            "recall":float("%.2f" % recall), "precision":float("%.2f" % precision), "fscore":float("%.2f" % fscore)}
+
+def sumCounts(rows):
+    total = [0, 0, 0, 0]
+    for row in rows:
+        for i in range(4):
+            total[i] += row[i]
+    return total
+
+def makeResults(eventCounts, modifierCounts=None):
+    """
+    Build the result dictionary, with the same rows as parsed from the a2-evaluate.pl output
+
+    @return: the results and the row names in the order of the result table
+    """
+    results = {}
+    rowNames = []
+    classified = set()
+    cumulative = []
+    for totalName, classNames in EVENT_CLASSES:
+        classCounts = []
+        for className in classNames:
+            classCounts.append(eventCounts.get(className, [0, 0, 0, 0]))
+            results[className] = getRow(classCounts[-1])
+            rowNames.append(className)
+            classified.add(className)
+        if totalName == "REG-TOTAL":
+            cumulative = classCounts
+        else:
+            cumulative += classCounts
+        results[totalName] = getRow(sumCounts(cumulative))
+        rowNames.append(totalName)
+    otherNames = sorted([x for x in eventCounts.keys() if x not in classified])
+    for className in otherNames:
+        results[className] = getRow(eventCounts[className])
+        rowNames.append(className)
+    results["ALL-TOTAL"] = getRow(sumCounts(eventCounts.values()))
+    rowNames.append("ALL-TOTAL")
+    if modifierCounts != None:
+        for modType in MODIFIER_TYPES:
+            results[modType] = getRow(modifierCounts.get(modType, [0, 0, 0, 0]))
+            rowNames.append(modType)
+        results["MOD-TOTAL"] = getRow(sumCounts(modifierCounts.values()))
+        rowNames.append("MOD-TOTAL")
+    return results, rowNames
+
+def getResultLines(results, rowNames):
+    """
+    Format the results as the a2-evaluate.pl result table
+    """
+    separator = "-" * 84
+    lines = [separator, "%20s %14s %16s %9s %8s %8s" % ("Event Class", "gold (match)", "answer (match)", "recall", "prec.", "fscore"), separator]
+    for name in rowNames:
+        row = results[name]
+        if name == "ALL-TOTAL" or name == "MOD-TOTAL":
+            label = "==[" + name + "]=="
+        elif name.endswith("-TOTAL"):
+            label = "=[" + name + "]="
+        else:
+            label = name
+        lines.append("%20s %6d ( %4d) %7d ( %4d) %8.2f %8.2f %8.2f" % (label, row["gold"], row["gold_match"], row["answer"], row["answer_match"], row["recall"], row["precision"], row["fscore"]))
+    lines.append(separator)
+    return lines
+
+def evaluateDocuments(answerDocs, goldDocs, task=1, evaluations=EVALUATIONS, silent=False):
+    """
+    Evaluate predicted documents against gold documents.
+
+    @param answerDocs: predicted STTools.Document objects
+    @param goldDocs: gold documents by document id
+    @param task: GENIA sub task (1, 2 or 3)
+    @return: the results by evaluation mode, or None if none of the documents has gold annotation
+    """
+    assert task in [1, 2, 3], (task, type(task))
+    pairs = []
+    for answerDoc in answerDocs:
+        if answerDoc.id in goldDocs:
+            pairs.append((answerDoc, goldDocs[answerDoc.id]))
+    if len(pairs) == 0:
+        print >> sys.stderr, "Evaluation input has no gold documents"
+        return None
+    if len(pairs) < len(answerDocs) and not silent:
+        print >> sys.stderr, "Warning,", len(answerDocs) - len(pairs), "documents have no gold annotation"
+    results = {}
+    for evaluation in evaluations:
+        assert evaluation in EVALUATIONS, evaluation
+        approximate = evaluation != "strict"
+        eventCounts = {}
+        modifierCounts = {} if task == 3 else None
+        for answerDoc, goldDoc in pairs:
+            matcher = DocumentMatcher(answerDoc, goldDoc, task, approximate, approximate)
+            if evaluation == "decomposition":
+                matcher.countDecomposed(eventCounts)
+            else:
+                matcher.countEvents(eventCounts)
+            if modifierCounts != None:
+                matcher.countModifications(modifierCounts)
+        results[evaluation], rowNames = makeResults(eventCounts, modifierCounts)
+        if not silent:
+            if evaluation == "strict":
+                print >> sys.stderr, "##### strict evaluation mode #####"
+            elif evaluation == "approximate":
+                print >> sys.stderr, "##### approximate span and recursive mode #####"
+            else:
+                print >> sys.stderr, "##### event decomposition in the approximate span mode #####"
+            for line in getResultLines(results[evaluation], rowNames):
+                print >> sys.stderr, line
+    return results
+
+def evaluate(source, mainTask="GE11", task=1, goldDir=None, evaluations=EVALUATIONS, silent=False):
+    """
+    Evaluate GENIA task predictions, given as a list of documents or as an ST-format directory or package.
+
+    @return: the results by evaluation mode, or None if no gold data was found for the predictions
+    """
+    assert mainTask in ["GE11", "GE09"], mainTask
+    goldPath = getGoldPath(mainTask, goldDir)
+    if goldPath == None:
+        return None
+    if not silent:
+        print >> sys.stderr, mainTask, "task", task, "in-process evaluation against", goldPath
+    # The GE09 gold files are separate for each task
+    a2Tag = "a2" if mainTask == "GE11" else {1:"a2.t1", 2:"a2.t12", 3:"a2.t123"}[task]
+    goldDocs = loadGold(goldPath, a2Tag)
+    if type(source) in types.StringTypes:
+        source = STTools.loadSet(source)
+    return evaluateDocuments(source, goldDocs, task, evaluations, silent)
+
+def compareResults(results, officialResults, evaluations=EVALUATIONS):
+    """
+    Compare in-process results with results parsed from the a2-evaluate.pl output
+    
+    @return: a list of (evaluation mode, row, column, in-process value, a2-evaluate.pl value) differences
+    """
+    differences = []
+    for evaluation in evaluations:
+        rows = results.get(evaluation, {})
+        officialRows = officialResults.get(evaluation, {})
+        for name in sorted(set(rows.keys() + officialRows.keys())):
+            for column in ["gold", "gold_match", "answer", "answer_match"]:
+                value = rows.get(name, {}).get(column)
+                officialValue = officialRows.get(name, {}).get(column)
+                if value != officialValue:
+                    differences.append((evaluation, name, column, value, officialValue))
+    return differences
+
+def checkParity(sourceDir, mainTask="GE11", task=1, goldDir=None, evaluations=EVALUATIONS):
+    """
+    Evaluate an ST-format prediction directory with both the official a2-evaluate.pl and
+    the in-process evaluator and report the differences. A task should be added to
+    Settings.NATIVE_EVALUATOR_TASKS only when no differences are found on its devel set.
+    
+    @return: the list of differences from compareResults, or None if the official tools could not be run
+    """
+    import BioNLP11GeniaTools
+    officialResults = BioNLP11GeniaTools.evaluateGE(sourceDir, mainTask, task, goldDir, evaluations=evaluations, silent=True, native=False)
+    if officialResults == None:
+        print >> sys.stderr, "Official", mainTask, "evaluation tools or gold data not available"
+        return None
+    results = evaluate(sourceDir, mainTask, task, goldDir, evaluations, silent=True)
+    differences = compareResults(results, officialResults, evaluations)
+    for difference in differences:
+        print >> sys.stderr, "Difference in %s mode, row %s, column %s: in-process %s, a2-evaluate.pl %s" % difference
+    print >> sys.stderr, mainTask, "task", task, "parity check:", len(differences), "differences"
+    return differences
+
+def test():
+    """
+    Check the counting of answer and gold events on a document with duplicate and overlapping
+    candidates. As in a2-evaluate.pl, gold and answer events are matched independently, so
+    one answer event can match several gold events and duplicate answer events all match.
+    """
+    def makeDocument(events):
+        doc = STTools.Document("D1")
+        doc.text = "IL-2 gene expression levels"
+        protein = STTools.Annotation("T1", "Protein", "IL-2")
+        protein.charOffsets = [[0, 4]]
+        protein.fileType = "a1"
+        doc.proteins = [protein]
+        for begin, end in events:
+            trigger = STTools.Annotation(None, "Gene_expression", doc.text[begin:end])
+            trigger.charOffsets = [[begin, end]]
+            event = STTools.Annotation(None, "Gene_expression", trigger=trigger)
+            event.addArgument("Theme", protein)
+            doc.triggers.append(trigger)
+            doc.events.append(event)
+        return doc
+    # Two gold events, one on "gene" and one on "levels"
+    goldDocs = {"D1":makeDocument([(5, 9), (21, 27)])}
+    # An answer event on "expression" falls within the extended spans of both gold events
+    results = evaluateDocuments([makeDocument([(10, 20)])], goldDocs, 1, ["strict", "approximate"], silent=True)
+    assert results["strict"]["ALL-TOTAL"]["gold_match"] == 0, results["strict"]
+    row = results["approximate"]["ALL-TOTAL"]
+    assert (row["gold"], row["gold_match"], row["answer"], row["answer_match"]) == (2, 2, 1, 1), row
+    # Duplicate answer events on "gene" both match the same gold event, the "levels" event stays unmatched
+    results = evaluateDocuments([makeDocument([(5, 9), (5, 9)])], goldDocs, 1, ["strict"], silent=True)
+    row = results["strict"]["ALL-TOTAL"]
+    assert (row["gold"], row["gold_match"], row["answer"], row["answer_match"]) == (2, 1, 2, 2), row
+    # The counts are independent of the order of the candidates
+    for order in [[(10, 20), (5, 9)], [(5, 9), (10, 20)]]:
+        results = evaluateDocuments([makeDocument(order)], goldDocs, 1, ["approximate"], silent=True)
+        row = results["approximate"]["ALL-TOTAL"]
+        assert (row["gold"], row["gold_match"], row["answer"], row["answer_match"]) == (2, 2, 2, 2), (order, row)
+    # Comparison with parsed a2-evaluate.pl results
+    official = {"approximate":dict([(x, dict(results["approximate"][x])) for x in results["approximate"]])}
+    assert compareResults(results, official, ["approximate"]) == []
+    official["approximate"]["ALL-TOTAL"]["answer_match"] = 1
+    assert compareResults(results, official, ["approximate"]) == [("approximate", "ALL-TOTAL", "answer_match", 2, 1)]
+    print >> sys.stderr, "BioNLPEventEvaluator test passed"
+
+if __name__=="__main__":
+    from optparse import OptionParser
+    optparser = OptionParser(description="In-process evaluation of BioNLP Shared Task GENIA event predictions")
+    optparser.add_option("-i", "--input", default=None, dest="input", help="predicted shared task files (directory or package)", metavar="FILE")
+    optparser.add_option("-g", "--gold", default=None, dest="gold", help="optional gold directory or package (default is the task development set)", metavar="FILE")
+    optparser.add_option("-c", "--corpus", default="GE11", dest="corpus", help="GE11 or GE09")
+    optparser.add_option("-t", "--task", default=1, type="int", dest="task", help="GENIA sub task (1, 2 or 3)")
+    optparser.add_option("-e", "--evaluations", default=",".join(EVALUATIONS), dest="evaluations", help="comma-separated evaluation modes")
+    optparser.add_option("--test", default=False, action="store_true", dest="test", help="run the evaluator self-test")
+    optparser.add_option("--parity", default=False, action="store_true", dest="parity", help="compare the input evaluation with the official a2-evaluate.pl")
+    (options, args) = optparser.parse_args()
+    if options.test:
+        test()
+        sys.exit()
+    assert options.input != None
+    if options.parity:
+        checkParity(options.input, options.corpus, options.task, options.gold, options.evaluations.split(","))
+        sys.exit()
+    evaluate(options.input, options.corpus, options.task, options.gold, options.evaluations.split(","))
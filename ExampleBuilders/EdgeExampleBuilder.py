@@ -36,6 +36,8 @@ class EdgeExampleBuilder(ExampleBuilder):
     This example builder makes edge examples, i.e. examples describing
     the event arguments.
     """
+    usesPredictedRange = True
+
     def __init__(self, style=None, types=[], featureSet=None, classSet=None):
         if featureSet == None:
             featureSet = IdSet()
@@ -120,6 +122,9 @@ class EdgeExampleBuilder(ExampleBuilder):
     def getPredictedValueRange(self):
         return self.multiEdgeFeatureBuilder.predictedRange
     
+    def setPredictedValueRange(self, predictedRange):
+        self.multiEdgeFeatureBuilder.predictedRange = list(predictedRange)
+    
     def filterEdgesByType(self, edges, typesToInclude):
         if len(typesToInclude) == 0:
             return edges
@@ -216,11 +221,11 @@ class EdgeExampleBuilder(ExampleBuilder):
 #                 break
 #         return categoryName
     
-    def processCorpus(self, input, output, gold=None, append=False, allowNewIds=True, structureAnalyzer=None):
+    def processCorpus(self, input, output, gold=None, append=False, allowNewIds=True, structureAnalyzer=None, calculateRange=True, predictedRange=None):
         if self.styles["sdb_merge"]:
             structureAnalyzer.determineNonOverlappingTypes()
             self.structureAnalyzer = structureAnalyzer
-        ExampleBuilder.processCorpus(self, input, output, gold, append, allowNewIds, structureAnalyzer)
+        ExampleBuilder.processCorpus(self, input, output, gold, append, allowNewIds, structureAnalyzer, calculateRange, predictedRange)
     
     def isValidInteraction(self, e1, e2, structureAnalyzer,forceUndirected=False):
         return len(structureAnalyzer.getValidEdgeTypes(e1.get("type"), e2.get("type"), forceUndirected=forceUndirected)) > 0
@@ -314,7 +319,7 @@ class EdgeExampleBuilder(ExampleBuilder):
             paths = undirected
             if self.styles["filter_shortest_path"] != None: # For DDI use filter_shortest_path=conj_and
                 paths.resetAnalyses() # just in case
-                paths.FloydWarshall(self.filterEdge, {"edgeTypes":self.styles["filter_shortest_path"]})
+                paths.initPaths(self.filterEdge, {"edgeTypes":self.styles["filter_shortest_path"]})
         
         # Generate examples based on interactions between entities or interactions between tokens
         if self.styles["token_nodes"]:
@@ -7,6 +7,10 @@ from Core.SentenceGraph import getCorpusIterator
 from Core.IdSet import IdSet
 import gzip
 import itertools
+import tempfile
+import shutil
+import multiprocessing
+import Utils.ElementTreeUtils as ETUtils
 from Utils.ProgressCounter import ProgressCounter
 import Utils.Parameters
 import Core.ExampleUtils as ExampleUtils
@@ -16,6 +20,8 @@ from Detectors.StructureAnalyzer import StructureAnalyzer
 
 class ExampleBuilder:
     structureAnalyzer = None
+    usesPredictedRange = False # the builder needs the range of the predicted entity values
+    _hashedVector = None # the feature vector of the hashed values set with setFeature
     """ 
     ExampleBuilder is the abstract base class for specialized example builders.
     Example builders take some data and convert it to examples usable by e.g. SVMs.
@@ -47,7 +53,7 @@ class ExampleBuilder:
         self.styles = {}
         self._defaultParameters = None
         self._parameterValueLimits = None
-        self._setDefaultParameters(["sentenceLimit"])
+        self._setDefaultParameters(["sentenceLimit", "feature_hashing", "binary_ids"])
         self.debug = False
     
     def hasStyle(self, style):
@@ -68,7 +74,13 @@ class ExampleBuilder:
         return Utils.Parameters.get(parameters, defaults=self._defaultParameters, valueLimits=self._parameterValueLimits)
     
     def setFeature(self, name, value):
-        self.features[self.featureSet.getId(self.featureTag+name)] = value
+        if self.featureSet.hashBits != None:
+            if self._hashedVector is not self.features: # a new feature vector
+                self._hashedVector = self.features
+                self._hashedValues = {}
+            self.featureSet.setHashedFeature(self.features, self.featureTag+name, value, self._hashedValues)
+        else:
+            self.features[self.featureSet.getId(self.featureTag+name)] = value
     
     def getElementCounts(self, filename):
         print >> sys.stderr, "Counting elements:",
@@ -98,24 +110,22 @@ class ExampleBuilder:
         else:
             print >> sys.stderr, "Feature names not saved"
 
-    def processCorpus(self, input, output, gold=None, append=False, allowNewIds=True, structureAnalyzer=None):
+    def processCorpus(self, input, output, gold=None, append=False, allowNewIds=True, structureAnalyzer=None, calculateRange=True, predictedRange=None):
         # Create intermediate paths if needed
         if os.path.dirname(output) != "" and not os.path.exists(os.path.dirname(output)):
             os.makedirs(os.path.dirname(output))
-        # Open output file
-        openStyle = "wt"
-        if append:
-            #print "Appending examples"
-            openStyle = "at"
-        if output.endswith(".gz"):
-            outfile = gzip.open(output, openStyle)
-        else:
-            outfile = open(output, openStyle)
+        # Open output file (binary format if the output ends with ExampleUtils.BINARY_SUFFIX)
+        outfile = ExampleUtils.openExampleFile(output, append)
         
         # Build examples
         self.exampleCount = 0
+        elementCounts = None
+        if predictedRange != None: # a range cached e.g. in the model
+            self.setPredictedValueRange(predictedRange)
+        elif calculateRange and self.usesPredictedRange:
+            elementCounts = self.calculatePredictedRange(input)
         if type(input) in types.StringTypes:
-            self.elementCounts = self.getElementCounts(input)
+            self.elementCounts = elementCounts if elementCounts != None else self.getElementCounts(input)
             if self.elementCounts["sentences"] > 0:
                 self.progress = ProgressCounter(self.elementCounts["sentences"], "Build examples")
             else:
@@ -125,8 +135,7 @@ class ExampleBuilder:
             self.elementCounts = None
             self.progress = ProgressCounter(None, "Build examples")
         
-        self.calculatePredictedRange(self.getSentences(input, self.parse, self.tokenization))
-        
+
         removeIntersentenceInteractions = True
         if "keep_intersentence" in self.styles and self.styles["keep_intersentence"]:
             print >> sys.stderr, "Keeping intersentence interactions for input corpus"
@@ -149,7 +158,9 @@ class ExampleBuilder:
                 self.processDocument(inputSentences, None, outfile, structureAnalyzer=structureAnalyzer)
         outfile.close()
         self.progress.endUpdate()
-        
+        self.finishCorpus(allowNewIds)
+    
+    def finishCorpus(self, allowNewIds=True):
         # Show statistics
         print >> sys.stderr, "Examples built:", self.exampleCount
         print >> sys.stderr, "Features:", len(self.featureSet.getNames())
@@ -199,8 +210,68 @@ class ExampleBuilder:
                 goldGraph = goldSentence.sentenceGraph
             self.exampleCount += self.buildExamplesFromGraph(sentence.sentenceGraph, outfile, goldGraph, structureAnalyzer=structureAnalyzer)
 
+    def processCorpusParallel(self, input, output, gold=None, append=False, allowNewIds=True, structureAnalyzer=None, workers=2, predictedRange=None):
+        """
+        Build examples in worker processes, each processing a shard of consecutive documents.
+        The workers define new class and feature ids in their own copies of the IdSets. After
+        all shards are done, the new names are defined in the shared IdSets in shard order, in the
+        order the workers first encountered them, and the shard examples are renumbered and
+        concatenated. The result is identical to the examples and ids of a single-process run.
+        """
+        global _parallelBuilder
+        workDir = tempfile.mkdtemp()
+        print >> sys.stderr, "Building examples with", workers, "workers in", workDir
+        # The predicted range is defined for the whole corpus before the builder is copied to the workers
+        elementCounts = None
+        if predictedRange != None:
+            self.setPredictedValueRange(predictedRange)
+        elif self.usesPredictedRange:
+            elementCounts = self.calculatePredictedRange(input)
+        if elementCounts == None:
+            elementCounts = self.getElementCounts(input)
+        numDocuments = elementCounts["documents"]
+        shardInputs = splitCorpus(input, workDir, "input", workers, numDocuments)
+        shardGolds = [None] * len(shardInputs)
+        if gold != None:
+            shardGolds = splitCorpus(gold, workDir, "gold", workers, numDocuments)
+        suffix = ExampleUtils.BINARY_SUFFIX if output.endswith(ExampleUtils.BINARY_SUFFIX) else ".gz"
+        shards = [(shardInputs[i], os.path.join(workDir, "shard" + str(i) + "-examples" + suffix), shardGolds[i]) for i in range(len(shardInputs))]
+        # Build the shards in forked processes, which inherit a copy of this builder
+        firstClassId, firstFeatureId = self.classSet.nextFreeId, self.featureSet.nextFreeId
+        _parallelBuilder = (self, allowNewIds, structureAnalyzer, firstClassId, firstFeatureId)
+        pool = multiprocessing.Pool(workers)
+        results = pool.map(_buildShard, shards)
+        pool.close()
+        pool.join()
+        _parallelBuilder = None
+        # Merge the shards
+        if os.path.dirname(output) != "" and not os.path.exists(os.path.dirname(output)):
+            os.makedirs(os.path.dirname(output))
+        outfile = ExampleUtils.openExampleFile(output, append)
+        self.exampleCount = 0
+        for shard, (classNames, featureNames, exampleCount, exampleStats) in zip(shards, results):
+            classMap = self._defineShardIds(self.classSet, classNames, firstClassId)
+            featureMap = self._defineShardIds(self.featureSet, featureNames, firstFeatureId)
+            mergeShardExamples(shard[1], outfile, classMap, featureMap)
+            self.exampleCount += exampleCount
+            self.exampleStats.merge(exampleStats)
+        outfile.close()
+        if not self.debug:
+            shutil.rmtree(workDir)
+        self.finishCorpus(allowNewIds)
+    
+    def _defineShardIds(self, idSet, names, firstLocalId):
+        """
+        Define the names a worker added to its copy of an IdSet and return the mapping 
+        from the worker's ids to the shared ids.
+        """
+        idMap = {}
+        for i in range(len(names)):
+            idMap[firstLocalId + i] = idSet.getId(names[i])
+        return idMap
+
     @classmethod
-    def run(cls, input, output, parse, tokenization, style, classIds=None, featureIds=None, gold=None, append=False, allowNewIds=True, structureAnalyzer=None, debug=False):
+    def run(cls, input, output, parse, tokenization, style, classIds=None, featureIds=None, gold=None, append=False, allowNewIds=True, structureAnalyzer=None, debug=False, workers=1, predictedRange=None):
         print >> sys.stderr, "Running", cls.__name__
         print >> sys.stderr, "  input:", input
         if gold != None:
@@ -216,12 +287,19 @@ class ExampleBuilder:
             print >> sys.stderr, "  parse:", parse + ", tokenization:", tokenization
         classSet, featureSet = cls.getIdSets(classIds, featureIds, allowNewIds) #cls.getIdSets(idFileTag)
         builder = cls(style=style, classSet=classSet, featureSet=featureSet)
+        if featureSet == None and builder.styles.get("feature_hashing") != None: # hashed ids, no feature names are stored
+            builder.featureSet.setHashing(int(builder.styles["feature_hashing"]))
+        if builder.styles.get("binary_ids"): # save the feature ids in the memory-mapped binary format
+            builder.featureSet.binary = True
         builder.debug = debug
         #builder.idFileTag = idFileTag
         builder.classIdFilename = classIds
         builder.featureIdFilename = featureIds
         builder.parse = parse ; builder.tokenization = tokenization
-        builder.processCorpus(input, output, gold, append=append, allowNewIds=allowNewIds, structureAnalyzer=structureAnalyzer)
+        if workers > 1 and type(input) in types.StringTypes:
+            builder.processCorpusParallel(input, output, gold, append=append, allowNewIds=allowNewIds, structureAnalyzer=structureAnalyzer, workers=workers, predictedRange=predictedRange)
+        else:
+            builder.processCorpus(input, output, gold, append=append, allowNewIds=allowNewIds, structureAnalyzer=structureAnalyzer, predictedRange=predictedRange)
         return builder
 
     def buildExamplesFromGraph(self, sentenceGraph, outfile, goldGraph=None):
@@ -233,6 +311,9 @@ class ExampleBuilder:
     def getPredictedValueRange(self):
         return None
     
+    def setPredictedValueRange(self, predictedRange):
+        pass
+    
     @classmethod
     def getIdSets(self, classIds=None, featureIds=None, allowNewIds=True):
         # Class ids
@@ -283,13 +364,100 @@ class ExampleBuilder:
             assert(removeNameInfo == False)
             return input
 
-    def calculatePredictedRange(self, sentences):
+    def calculatePredictedRange(self, input):
+        """
+        Define the predicted value range in a single streaming pass over the corpus, which
+        also counts the documents and sentences. Only one document is kept in memory.
+        Returns the element counts.
+        """
         print >> sys.stderr, "Defining predicted value range:",
-        sentenceElements = []
-        for sentence in sentences:
-            sentenceElements.append(sentence[0].sentenceElement)
-        self.definePredictedValueRange(sentenceElements, "entity")
-        print >> sys.stderr, self.getPredictedValueRange()
+        counts = {"documents":0, "sentences":0}
+        self.definePredictedValueRange(iterSentenceElements(input, counts), "entity")
+        print >> sys.stderr, self.getPredictedValueRange(), counts
+        return counts
+
+def iterSentenceElements(input, counts=None):
+    """
+    Yield the sentence elements of a corpus, counting the documents and sentences
+    """
+    if counts == None:
+        counts = {"documents":0, "sentences":0}
+    for event, element in ETUtils.ETIteratorFromObj(input, ("end",)):
+        if element.tag == "sentence":
+            counts["sentences"] += 1
+            yield element
+        elif element.tag == "document":
+            counts["documents"] += 1
+            if event == "end": # the sentences of the document have been processed
+                element.clear()
+
+# The builder and its settings, inherited by the worker processes of processCorpusParallel
+_parallelBuilder = None
+
+def _buildShard(shard):
+    builder, allowNewIds, structureAnalyzer, firstClassId, firstFeatureId = _parallelBuilder
+    input, output, gold = shard
+    builder.classIdFilename = builder.featureIdFilename = None # the ids are saved after merging
+    builder.processCorpus(input, output, gold, allowNewIds=allowNewIds, structureAnalyzer=structureAnalyzer, calculateRange=False)
+    # The new names, in the order of their ids
+    classNames = [builder.classSet.getName(i) for i in range(firstClassId, builder.classSet.nextFreeId)]
+    featureNames = [builder.featureSet.getName(i) for i in range(firstFeatureId, builder.featureSet.nextFreeId)]
+    return classNames, featureNames, builder.exampleCount, builder.exampleStats
+
+def splitCorpus(input, outDir, tag, numShards, numDocuments):
+    """
+    Split a corpus file into shards of consecutive documents.
+    """
+    numShards = max(1, min(numShards, numDocuments))
+    shardFiles = [os.path.join(outDir, tag + "-shard" + str(i) + ".xml.gz") for i in range(numShards)]
+    writer = None
+    corpusElement = None
+    documentIndex = 0
+    shardIndex = -1
+    for event, element in ETUtils.ETIteratorFromObj(input, ("start", "end")):
+        if event == "start" and element.tag == "corpus":
+            corpusElement = element
+        elif event == "end" and element.tag == "document":
+            # Shard i gets the documents from i * numDocuments / numShards onwards
+            while shardIndex + 1 < numShards and documentIndex >= ((shardIndex + 1) * numDocuments) / numShards:
+                if writer != None:
+                    writer.end(corpusElement)
+                    writer.close()
+                shardIndex += 1
+                writer = ETUtils.ETWriter(shardFiles[shardIndex])
+                writer.begin(corpusElement)
+            writer.write(element)
+            element.clear()
+            documentIndex += 1
+    if writer != None:
+        writer.end(corpusElement)
+        writer.close()
+    return shardFiles[:shardIndex + 1]
+
+def mergeShardExamples(shardFile, outfile, classMap, featureMap):
+    """
+    Append the examples of a shard to the output, replacing the worker's class and feature 
+    ids with the shared ones. Feature values in text files are copied as they are.
+    """
+    if ExampleUtils.isBinaryExampleFile(shardFile):
+        for example in ExampleUtils.readExamples(shardFile):
+            example[1] = classMap.get(example[1], example[1])
+            example[2] = dict([(featureMap.get(key, key), value) for key, value in example[2].iteritems()])
+            ExampleUtils.appendExamples([example], outfile)
+        return
+    f = gzip.open(shardFile, "rt")
+    for line in f:
+        featurePart, comment = line.split(" # ", 1)
+        splits = featurePart.split()
+        classId = int(splits[0])
+        features = []
+        for item in splits[1:]:
+            featureId, featureValue = item.split(":")
+            featureId = int(featureId)
+            features.append( (featureMap.get(featureId, featureId), featureValue) )
+        features.sort()
+        outfile.write(" ".join([str(classMap.get(classId, classId))] + [str(x[0]) + ":" + x[1] for x in features]) + " # " + comment)
+    f.close()
 
 def addBasicOptions(optparser):
     optparser.add_option("-i", "--input", default=None, dest="input", help="Corpus in analysis format", metavar="FILE")
@@ -303,6 +471,7 @@ def addBasicOptions(optparser):
     optparser.add_option("-a", "--addIds", default=False, action="store_true", dest="addIds", help="Add new features")
     optparser.add_option("-d", "--debug", default=False, action="store_true", dest="debug", help="Debug mode")
     optparser.add_option("--structure", default=None, dest="structure", help="Structure analyzer data file")
+    optparser.add_option("--workers", default=1, type="int", dest="workers", help="Number of processes for building examples in parallel")
 
 if __name__=="__main__":
     # Import Psyco if available
@@ -335,4 +504,4 @@ if __name__=="__main__":
     #input, output, parse, tokenization, style, classIds=None, featureIds=None, gold=None, append=False)
     ExampleBuilderClass.run(options.input, options.output, options.parse, None, options.parameters, 
                             options.classes, options.features, allowNewIds=options.addIds, 
-                            structureAnalyzer=structureAnalyzer, debug=options.debug, gold=options.gold)
+                            structureAnalyzer=structureAnalyzer, debug=options.debug, gold=options.gold, workers=options.workers)
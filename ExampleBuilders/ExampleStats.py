@@ -58,6 +58,23 @@ class ExampleStats:
             self.filteredByClassByFilter[self.className][filter] += 1
         self.className = None
 
+    def merge(self, other):
+        """
+        Add the counts from another ExampleStats object, e.g. one from a parallel worker.
+        """
+        for className, count in other.examplesByClass.iteritems():
+            self.examplesByClass[className] = self.examplesByClass.get(className, 0) + count
+        for className, count in other.filteredByClass.iteritems():
+            self.filteredByClass[className] = self.filteredByClass.get(className, 0) + count
+        for className, filters in other.filteredByClassByFilter.iteritems():
+            if not self.filteredByClassByFilter.has_key(className):
+                self.filteredByClassByFilter[className] = {}
+            for filter, count in filters.iteritems():
+                self.filteredByClassByFilter[className][filter] = self.filteredByClassByFilter[className].get(filter, 0) + count
+        for name, amount in other.values.iteritems():
+            self.addValue(name, amount)
+        self.variables.update(other.variables)
+
     def getExampleCount(self):
         return sum(self.examplesByClass.values())
     
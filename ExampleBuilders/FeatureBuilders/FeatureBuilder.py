@@ -30,6 +30,8 @@ class FeatureBuilder:
         
         self.maskNamedEntities = True # named entity text strings are replaced with NAMED_ENT
         self.tag = "" # a prefix that is added to each feature name
+        self._hashedVector = None # the feature vector of the hashed values in _hashedValues
+        self._hashedValues = None # signed values of the names set in the current hashed vector
     
     def setTag(self, tag=""):
         self.tag = tag
@@ -54,11 +56,19 @@ class FeatureBuilder:
         """
         Add a feature to the feature vector. If the feature already exists, its current
         value is replaced with the new value. All features are prefixed with FeatureBuilder.tag.
+        With a hashed feature set, the value is multiplied with the sign of the hashed name and
+        the values of different names sharing an id are summed.
         
         @type name: str
         @type value: float
         """
-        self.features[self.featureSet.getId(self.tag+name)] = value
+        if self.featureSet.hashBits != None:
+            if self._hashedVector is not self.features: # a new feature vector
+                self._hashedVector = self.features
+                self._hashedValues = {}
+            self.featureSet.setHashedFeature(self.features, self.tag+name, value, self._hashedValues)
+        else:
+            self.features[self.featureSet.getId(self.tag+name)] = value
         
     def normalizeFeatureVector(self):
         """
@@ -249,3 +259,32 @@ posSuperTypes["("] = "PUNCT"
 posSuperTypes[")"] = "PUNCT"
 posSuperTypes["&quot;"] = "PUNCT"
 posSuperTypes["\""] = "PUNCT"
+
+def test():
+    from Core.IdSet import IdSet
+    featureSet = IdSet()
+    featureSet.setHashing(1)
+    builder = FeatureBuilder(featureSet)
+    names = ["f" + str(i) for i in range(20)]
+    same = [(a, b) for a in names for b in names if a < b and featureSet.getId(a) == featureSet.getId(b) and featureSet.getSign(a) == featureSet.getSign(b)][0]
+    opposite = [(a, b) for a in names for b in names if a < b and featureSet.getId(a) == featureSet.getId(b) and featureSet.getSign(a) != featureSet.getSign(b)][0]
+    for a, b in (same, opposite):
+        id = featureSet.getId(a)
+        builder.setFeatureVector({})
+        builder.setFeature(a, 2)
+        builder.setFeature(b, 3)
+        assert builder.features[id] == featureSet.getSign(a) * 2 + featureSet.getSign(b) * 3, (a, b, builder.features)
+        builder.setFeature(a, 5) # setting a name again replaces its value
+        assert builder.features[id] == featureSet.getSign(a) * 5 + featureSet.getSign(b) * 3, (a, b, builder.features)
+        builder.setFeatureVector({}) # values don't carry over to a new vector
+        builder.setFeature(b, 3)
+        assert builder.features == {id:featureSet.getSign(b) * 3}, (a, b, builder.features)
+    print >> sys.stderr, "Colliding names", same, "and", opposite, "OK"
+
+if __name__=="__main__":
+    from optparse import OptionParser
+    optparser = OptionParser(description="Base class for FeatureBuilders")
+    optparser.add_option("--test", default=False, action="store_true", dest="test", help="Run the self-test")
+    (options, args) = optparser.parse_args()
+    if options.test:
+        test()
@@ -136,7 +136,7 @@ class KerasExampleBuilder(ExampleBuilder):
             depGraph = undirected
             if self.styles.get("filter_shortest_path") != None: # For DDI use filter_shortest_path=conj_and
                 depGraph.resetAnalyses() # just in case
-                depGraph.FloydWarshall(self.filterEdge, {"edgeTypes":self.styles["filter_shortest_path"]})
+                depGraph.initPaths(self.filterEdge, {"edgeTypes":self.styles["filter_shortest_path"]})
         
         # Generate the two matrices in the format [row_index][column_index][feature_name]
         numTokens = len(sentenceGraph.tokens)
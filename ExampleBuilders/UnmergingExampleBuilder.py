@@ -18,6 +18,7 @@ import Utils.Libraries.combine as combine
 import Utils.ElementTreeUtils as ETUtils
 import gzip
 import types
+import heapq
 from collections import defaultdict
 
 def combinations(iterable, r):
@@ -90,8 +91,11 @@ class UnmergingExampleBuilder(ExampleBuilder):
         defaultParameters["keep_intersentence"] = False
         defaultParameters["keep_intersentence_gold"] = True
         defaultParameters["no_arg_count_upper_limit"] = False
+        defaultParameters["max_combinations"] = None # maximum number of argument combinations per event
         self.styles = self._setDefaultParameters(defaultParameters)
         self.styles = self.getParameters(style)
+        if self.styles["max_combinations"] != None:
+            self.styles["max_combinations"] = int(self.styles["max_combinations"])
         self.multiEdgeFeatureBuilder = MultiEdgeFeatureBuilder(self.featureSet)
         self.multiEdgeFeatureBuilder.noAnnType = self.styles["noAnnType"]
         self.multiEdgeFeatureBuilder.maskNamedEntities = not self.styles["noMasking"]
@@ -222,6 +226,85 @@ class UnmergingExampleBuilder(ExampleBuilder):
         
         return isGold
     
+    def getArgumentSignature(self, arguments, entityById):
+        """
+        Return a hashable signature of the argument edges, or None if it can't
+        be used for exact matching (intersentence or duplicate arguments).
+        """
+        argKeys = []
+        for argument in arguments:
+            e2Id = argument.get("e2")
+            if e2Id not in entityById: # intersentence argument
+                return None
+            e2Entity = entityById[e2Id]
+            argKeys.append( (argument.get("type"), e2Entity.get("headOffset"), e2Entity.get("type")) )
+        if len(set(argKeys)) != len(argKeys):
+            return None
+        return tuple(sorted(argKeys))
+    
+    def buildGoldEventIndex(self, goldGraph):
+        """
+        Map the gold events of a sentence to (head offset, type, argument signature)
+        keys, so that most unmerging examples can be checked with a single lookup.
+        """
+        goldEventIndex = set()
+        if goldGraph == None:
+            return goldEventIndex
+        goldInteractionsByE1 = defaultdict(list)
+        for goldInteraction in goldGraph.interactions:
+            if goldInteraction.get("event") == "True":
+                goldInteractionsByE1[goldInteraction.get("e1")].append(goldInteraction)
+        for goldEntity in goldGraph.entities:
+            signature = self.getArgumentSignature(goldInteractionsByE1[goldEntity.get("id")], goldGraph.entitiesById)
+            if signature != None:
+                goldEventIndex.add( (goldEntity.get("headOffset"), goldEntity.get("type"), signature) )
+        return goldEventIndex
+    
+    def isGoldEvent(self, entity, arguments, sentenceGraph, goldGraph, goldEntitiesByOffset, goldEventIndex):
+        # Events whose arguments are all in the sentence and distinct are either in the
+        # index or not gold at all. The rest are matched with the full comparison.
+        signature = self.getArgumentSignature(arguments, sentenceGraph.entitiesById)
+        if signature != None:
+            return (entity.get("headOffset"), entity.get("type"), signature) in goldEventIndex
+        return self.eventIsGold(entity, arguments, sentenceGraph, goldGraph, goldEntitiesByOffset, goldGraph.interactions)
+    
+    def getEdgeConfidence(self, interaction):
+        """
+        The classifier confidence of a predicted edge for its own type, 0.0 for gold edges
+        """
+        conf = interaction.get("conf")
+        if conf == None:
+            return 0.0
+        intType = interaction.get("type")
+        for pair in conf.split(","):
+            cls, confidence = pair.rsplit(":", 1)
+            if cls == intType:
+                return float(confidence)
+        return 0.0
+    
+    def getArgumentCombinations(self, intCombinations, maxCombinations=None):
+        """
+        Combine the per-type argument combinations into event argument combinations. The
+        combinations are generated lazily. If there are more than maxCombinations of them,
+        only the ones with the highest total edge confidence are kept, in their original order.
+        Returns the combinations and the number of skipped combinations.
+        """
+        argCombinations = (sum(x, ()) for x in combine.xcombine(*intCombinations))
+        numCombinations = 1
+        for singleTypeCombinations in intCombinations:
+            numCombinations *= len(singleTypeCombinations)
+        if maxCombinations == None or numCombinations <= maxCombinations:
+            return argCombinations, 0
+        confidences = {}
+        for singleTypeCombinations in intCombinations:
+            for singleTypeArgCombination in singleTypeCombinations:
+                for interaction in singleTypeArgCombination:
+                    if interaction not in confidences:
+                        confidences[interaction] = self.getEdgeConfidence(interaction)
+        best = heapq.nlargest(maxCombinations, enumerate(argCombinations), key=lambda x: (sum([confidences[i] for i in x[1]]), -x[0]))
+        best.sort()
+        return [x[1] for x in best], numCombinations - len(best)
+    
     def sortInteractionsById(self, interactions):
         # The order of the interactions affects the order of the unmerging examples, and this 
         # affects performance. It's not clear whether this is what really happens, or whether
@@ -283,6 +366,7 @@ class UnmergingExampleBuilder(ExampleBuilder):
                 if not goldEntitiesByOffset.has_key(offset):
                     goldEntitiesByOffset[offset] = []
                 goldEntitiesByOffset[offset].append(entity)
+        goldEventIndex = self.buildGoldEventIndex(goldGraph)
         
         if self.styles["no_merge"]:
             mergeInput = False
@@ -340,19 +424,17 @@ class UnmergingExampleBuilder(ExampleBuilder):
             # of one argument type. Next, we'll make all valid combinations of multiple argument types
             if self.debug:
                 print >> sys.stderr, " ", "intCombinations", intCombinations
-            argCombinations = combine.combine(*intCombinations)
-            if self.debug:
-                print >> sys.stderr, " ", "argCombinations", argCombinations
-            for i in range(len(argCombinations)):
-                argCombinations[i] = sum(argCombinations[i], ())
-            #sum(argCombinations, []) # flatten nested list
-            if self.debug:
-                print >> sys.stderr, " ", "argCombinations flat", argCombinations
+            argCombinations, numSkipped = self.getArgumentCombinations(intCombinations, self.styles["max_combinations"])
+            if numSkipped > 0:
+                self.exampleStats.addValue("Argument combinations skipped (max_combinations)", numSkipped)
+                self.exampleStats.addValue("Events with capped argument combinations", 1)
             
             for argCombination in argCombinations:
+                if self.debug:
+                    print >> sys.stderr, " ", "argCombination", argCombination
                 # Originally binary classification
                 if goldGraph != None:
-                    isGoldEvent = self.eventIsGold(entity, argCombination, sentenceGraph, goldGraph, goldEntitiesByOffset, goldGraph.interactions)
+                    isGoldEvent = self.isGoldEvent(entity, argCombination, sentenceGraph, goldGraph, goldEntitiesByOffset, goldEventIndex)
                     #if eType == "Binding":
                     #    print argCombination[0].get("e1"), len(argCombination), isGoldEvent
                 else:
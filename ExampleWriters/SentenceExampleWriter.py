@@ -44,7 +44,78 @@ class SentenceExampleWriter:
             examples = ExampleUtils.readExamples(examples, False)
         return examples, predictions
     
+    def canStream(self, corpus, outputFile, goldCorpus=None):
+        """
+        The corpus can be streamed if it is read from a file other than the output file
+        """
+        if type(corpus) not in types.StringTypes or outputFile == None or goldCorpus != None:
+            return False
+        return os.path.abspath(corpus) != os.path.abspath(outputFile)
+    
+    def getSentenceExamples(self, examples, predictions):
+        """
+        Join the example and prediction streams and group them by sentence. Yields tuples
+        of (sentence id, examples, predictions by example id).
+        """
+        prevMajorIds = set()
+        pairs = itertools.izip_longest(examples, predictions)
+        for majorId, group in itertools.groupby(pairs, lambda x: x[0][0].rsplit(".x", 1)[0] if x[0] != None else None):
+            assert majorId not in prevMajorIds, majorId
+            prevMajorIds.add(majorId)
+            exampleQueue = []
+            predictionsByExample = {}
+            for example, prediction in group:
+                assert example != None
+                assert prediction != None
+                assert example[3]["xtype"] == self.xType, str(example[3]["xtype"]) + "/" + str(self.xType)
+                exampleQueue.append(example)
+                predictionsByExample[example[0]] = prediction
+            yield majorId, exampleQueue, predictionsByExample
+    
+    def writeXMLStream(self, examples, predictions, corpus, outputFile, classSet=None, parse=None, tokenization=None, exampleStyle=None, structureAnalyzer=None):
+        """
+        Write the predictions into the corpus one document at a time. The examples and
+        predictions must be in the order of the corpus, as produced by the example builders.
+        Each document is written to the output as soon as its sentences have been processed,
+        so only one document is kept in memory. Returns the output file name.
+        """
+        examples, predictions = self.loadExamples(examples, predictions)
+        if type(classSet) == types.StringType: # class names are in file
+            classSet = IdSet(filename=classSet)
+        classIds = None
+        if classSet != None:
+            classIds = classSet.getIds()
+        
+        print >> sys.stderr, "Writing corpus to", outputFile
+        progress = ProgressCounter(None, "Write Examples", step=10000)
+        sentenceExamples = self.getSentenceExamples(examples, predictions)
+        current = next(sentenceExamples, None)
+        for sentences in SentenceGraph.getCorpusIterator(corpus, os.path.abspath(outputFile), parse, tokenization):
+            for sentenceObject in sentences:
+                sentenceId = sentenceObject.sentence.get("id")
+                if current != None and current[0] == sentenceId:
+                    self.writeXMLSentence(current[1], current[2], sentenceObject, classSet, classIds, exampleStyle=exampleStyle, structureAnalyzer=structureAnalyzer)
+                    progress.update(len(current[1]), "Writing examples ("+current[1][-1][0]+"): ")
+                    current = next(sentenceExamples, None)
+                else: # sentences with no examples (e.g. to clear interactions)
+                    self.writeXMLSentence([], {}, sentenceObject, classSet, classIds, exampleStyle=exampleStyle, structureAnalyzer=structureAnalyzer)
+        progress.endUpdate()
+        assert current == None, ("Examples for a sentence not in the corpus or not in corpus order", current[0])
+        
+        # Print statistics
+        if len(self.counts) > 0:
+            print >> sys.stderr, self.counts
+            self.counts = defaultdict(int)
+        return outputFile
+    
     def writeXML(self, examples, predictions, corpus, outputFile, classSet=None, parse=None, tokenization=None, goldCorpus=None, exampleStyle=None, structureAnalyzer=None):
+        """
+        Write the predictions into the corpus. A corpus file is streamed to the output file
+        with writeXMLStream, and the output file name is returned. Otherwise the corpus is 
+        processed in memory and the resulting ElementTree is returned.
+        """
+        if self.canStream(corpus, outputFile, goldCorpus):
+            return self.writeXMLStream(examples, predictions, corpus, outputFile, classSet, parse, tokenization, exampleStyle=exampleStyle, structureAnalyzer=structureAnalyzer)
         #print >> sys.stderr, "Writing output to Interaction XML"
         corpus = self.loadCorpus(corpus, parse, tokenization)
         if goldCorpus != None:
@@ -1,4 +1,7 @@
 import sys, os, codecs, time, signal
+import select
+import struct
+import ctypes, ctypes.util
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
 from Utils.ProgressCounter import ProgressCounter
 
@@ -45,6 +48,98 @@ class ProcessWrapper:
                 return None
         return "FINISHED"
 
+class OutputTailer:
+    """
+    Counts the sentences in a growing output file. The byte offset, decoder state and
+    sentence count are kept between updates, so that only newly appended data is read.
+    """
+    def __init__(self, filename, measureByGap, encoding="utf-8", errors="strict"):
+        self.filename = filename
+        self.measureByGap = measureByGap
+        self.encoding = encoding
+        self.errors = errors
+        self.reset()
+    
+    def reset(self):
+        self.offset = 0 # bytes read so far
+        self.numSentences = 0 # sentences in the complete lines read so far
+        self.partialLine = u"" # decoded text after the last complete line
+        self.decoder = codecs.getincrementaldecoder(self.encoding)(self.errors)
+    
+    def isSentence(self, line):
+        if self.measureByGap:
+            return line.strip() == ""
+        return True
+    
+    def update(self):
+        """
+        Read the data appended since the previous update and return the number of sentences in the file
+        """
+        size = os.path.getsize(self.filename)
+        if size < self.offset: # file was truncated or replaced
+            self.reset()
+        if size > self.offset:
+            f = open(self.filename, "rb")
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+            f.close()
+            self.offset += len(data)
+            lines = (self.partialLine + self.decoder.decode(data)).splitlines(True)
+            self.partialLine = u""
+            # The last line is incomplete if it has no line break, or may continue as "\r\n"
+            if len(lines) > 0 and (lines[-1].splitlines()[0] == lines[-1] or lines[-1].endswith(u"\r")):
+                self.partialLine = lines.pop()
+            for line in lines:
+                if self.isSentence(line):
+                    self.numSentences += 1
+        # An incomplete last line is counted like the codecs reader would count it
+        if self.partialLine != u"" and self.isSentence(self.partialLine):
+            return self.numSentences + 1
+        return self.numSentences
+
+class FileWatcher:
+    """
+    Waits for files to be created or modified in a directory. Uses inotify where available,
+    otherwise the wait simply sleeps for the timeout.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    
+    def __init__(self, directory):
+        self.fd = None
+        fd = -1
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init()
+            if fd < 0:
+                return
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            if libc.inotify_add_watch(fd, directory, mask) >= 0:
+                self.fd = fd
+        except (OSError, AttributeError): # no inotify on this system
+            pass
+        finally:
+            if self.fd == None and fd >= 0: # the watch couldn't be added
+                os.close(fd)
+    
+    def wait(self, timeout):
+        """
+        Return when a file has changed or the timeout has passed
+        """
+        if self.fd == None:
+            time.sleep(timeout)
+            return
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if len(readable) > 0:
+            os.read(self.fd, 65536) # discard the events
+    
+    def close(self):
+        if self.fd != None:
+            os.close(self.fd)
+            self.fd = None
+
 def waitForProcess(process, numCorpusSentences, measureByGap, outputFile, counterName, updateMessage, timeout=None):
     """
     Waits for a process to finish, and tracks the number of entities it writes
@@ -52,6 +147,8 @@ def waitForProcess(process, numCorpusSentences, measureByGap, outputFile, counte
     the process is considered stalled and is killed.
     """
     maxStartupTime = 600 # Give extra time for the process to start up (even if it creates immediately an empty output file)
+    checkInterval = 1.0 # Maximum time between checks
+    minCheckInterval = 0.2 # Minimum time between checks when the output file changes
     counter = ProgressCounter(numCorpusSentences, counterName)
     counter.showMilliseconds = True
     prevNumSentences = 0 # Number of output sentences on previous check
@@ -59,40 +156,40 @@ def waitForProcess(process, numCorpusSentences, measureByGap, outputFile, counte
     processStatus = None # When None, process not finished
     prevTime = time.time()
     startTime = time.time()
-    # Wait until process is finished and periodically check it's progress.
-    while processStatus == None or finalCheckLeft:
-        if processStatus != None: # Extra loop to let counters finish
-            finalCheckLeft = False # Done only once
-        if os.path.exists(outputFile[0]): # Output file has already appeared on disk
-            # Measure number of sentences in output file
-            numSentences = 0
-            f = codecs.open(outputFile[0], "rt", **outputFile[1])
-            for line in f:
-                if measureByGap:
-                    if line.strip() == "":
-                        numSentences += 1
-                else:
-                    numSentences += 1
-            f.close()
-            # Update status
-            if numSentences - prevNumSentences != 0: # Process has progressed
-                counter.update(numSentences - prevNumSentences, updateMessage + ": ")
-            if finalCheckLeft: # This is a normal loop, not the final check
-                # Startuptime hasn't yet passed or process has made progress
-                if time.time() - startTime < maxStartupTime or numSentences - prevNumSentences != 0:
-                #if prevNumSentences == 0 or numSentences - prevNumSentences != 0:
-                    prevTime = time.time() # reset timeout
-                else: # Nothing happened on this update, check whether process hung
-                    elapsedTime = time.time() - prevTime
-                    if timeout != None and elapsedTime > timeout:
-                        print >> sys.stderr, "Process timed out (" + str(elapsedTime) + " vs. " + str(timeout) + ")"
-                        print >> sys.stderr, "Killing process"
-                        process.kill()
-                prevNumSentences = numSentences
-                time.sleep(1)
-        else: # Output file doesn't exist yet
-            prevTime = time.time() # reset counter if output file hasn't been created
-        processStatus = process.poll() # Get process status, None == still running
+    tailer = OutputTailer(outputFile[0], measureByGap, **outputFile[1])
+    watcher = FileWatcher(os.path.dirname(os.path.abspath(outputFile[0])))
+    numSentences = 0
+    try:
+        # Wait until process is finished and periodically check it's progress.
+        while processStatus == None or finalCheckLeft:
+            if processStatus != None: # Extra loop to let counters finish
+                finalCheckLeft = False # Done only once
+            if os.path.exists(outputFile[0]): # Output file has already appeared on disk
+                # Measure number of sentences in output file
+                numSentences = tailer.update()
+                # Update status
+                if numSentences - prevNumSentences != 0: # Process has progressed
+                    counter.update(numSentences - prevNumSentences, updateMessage + ": ")
+                if finalCheckLeft: # This is a normal loop, not the final check
+                    # Startuptime hasn't yet passed or process has made progress
+                    if time.time() - startTime < maxStartupTime or numSentences - prevNumSentences != 0:
+                    #if prevNumSentences == 0 or numSentences - prevNumSentences != 0:
+                        prevTime = time.time() # reset timeout
+                    else: # Nothing happened on this update, check whether process hung
+                        elapsedTime = time.time() - prevTime
+                        if timeout != None and elapsedTime > timeout:
+                            print >> sys.stderr, "Process timed out (" + str(elapsedTime) + " vs. " + str(timeout) + ")"
+                            print >> sys.stderr, "Killing process"
+                            process.kill()
+                    prevNumSentences = numSentences
+                    time.sleep(minCheckInterval)
+                    watcher.wait(checkInterval - minCheckInterval)
+            else: # Output file doesn't exist yet
+                prevTime = time.time() # reset counter if output file hasn't been created
+                watcher.wait(minCheckInterval)
+            processStatus = process.poll() # Get process status, None == still running
+    finally: # the inotify descriptor is closed also if the process is killed or interrupted
+        watcher.close()
     
     counter.markFinished() # If we get this far, don't show the error message even if process didn't finish
     return (numSentences, numCorpusSentences)
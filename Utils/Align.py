@@ -1,6 +1,12 @@
 import sys
 import operator
 import itertools
+try:
+    import numpy
+    numpy.array([])
+    numpyAvailable = True
+except:
+    numpyAvailable = False
 
 WEIGHTS = {"match":2, "mismatch":-2, "open":-1, "extend":-1}
 
@@ -71,9 +77,11 @@ def getTraversal(matrix):
     traversal = []
     # Find a path from the lower right corner to (0,0)
     while x != 0 or y != 0:
-        traversal = [(x, y)] + traversal 
+        traversal.append((x, y))
         x, y = move(matrix, x, y)
-    return [(0, 0)] + traversal # The returned path starts from (0,0)
+    traversal.append((0, 0))
+    traversal.reverse() # The returned path starts from (0,0)
+    return traversal
 
 def move(matrix, x, y):
     moves = [(x-1, y-1), (x-1, y), (x, y-1)] # move diagonally, up, or left
@@ -82,6 +90,100 @@ def move(matrix, x, y):
     maxIndex, maxValue = max(enumerate(values), key=operator.itemgetter(1)) # select the move with the highest value
     return moves[maxIndex]
 
+###############################################################################
+# NumPy Anti-Diagonal Scoring and Traversal
+###############################################################################
+
+def getDiagonalRange(k, columns, rows, band):
+    # The x-coordinates of the cells (x, k - x) on anti-diagonal k, limited to the band |y - x| <= band
+    lo = max(0, k - (rows - 1))
+    hi = min(columns - 1, k)
+    if band != None:
+        lo = max(lo, (k - band + 1) / 2)
+        hi = min(hi, (k + band) / 2)
+    return lo, hi
+
+def getTraversalNumPy(stringA, stringB, weights=None, band=None):
+    """
+    Calculate the same traversal as getTraversal(buildScoringMatrix(stringA, stringB, weights)).
+    The scores are computed one anti-diagonal at a time with array operations. Only the traceback
+    move of each cell is stored, as an int8 (0 = diagonal, 1 = up, 2 = left). If band is defined, 
+    only the cells where |y - x| <= band are calculated (band is widened to at least the length 
+    difference of the strings). 
+    """
+    global WEIGHTS
+    if weights == None:
+        weights = WEIGHTS
+    columns, rows = getDim(stringA, stringB)
+    if band != None:
+        band = max(band, abs(columns - rows), 1)
+    # Elements are compared as integer codes
+    codes = {}
+    codesA = numpy.array([codes.setdefault(x, len(codes)) for x in stringA] + [-1], dtype=numpy.int64)
+    codesB = numpy.array([codes.setdefault(x, len(codes)) for x in reversed(stringB)] + [-2], dtype=numpy.int64)
+    # Scores and gap states ("open" or "extend") of the three last anti-diagonals, indexed by x
+    scores = [numpy.full(columns + 1, -numpy.inf) for i in range(3)]
+    gaps = [numpy.zeros(columns + 1, dtype=bool) for i in range(3)]
+    moves = [] # the traceback moves of the inner cells of each anti-diagonal as (first x, moves)
+    for k in range(columns + rows - 1):
+        lo, hi = getDiagonalRange(k, columns, rows, band)
+        current, prev1, prev2 = scores[k % 3], scores[(k - 1) % 3], scores[(k - 2) % 3]
+        currentGaps, prevGaps = gaps[k % 3], gaps[(k - 1) % 3]
+        moves.append((lo, None))
+        if k == 0:
+            current[0] = 0
+            currentGaps[0] = False
+        else:
+            # The top row and left column continue the gap from the previous cell
+            if lo == 0:
+                current[0] = prev1[0] + (weights["extend"] if prevGaps[0] else weights["open"])
+                currentGaps[0] = True
+            if hi == k:
+                current[k] = prev1[k - 1] + (weights["extend"] if prevGaps[k - 1] else weights["open"])
+                currentGaps[k] = True
+            innerLo, innerHi = max(lo, 1), min(hi, k - 1)
+            if innerLo <= innerHi:
+                X = slice(innerLo, innerHi + 1)
+                prevX = slice(innerLo - 1, innerHi)
+                similar = codesA[prevX] == codesB[rows - 1 - k + innerLo:rows - k + innerHi]
+                scoreDiagonal = prev2[prevX] + numpy.where(similar, weights["match"], weights["mismatch"])
+                scoreUp = prev1[prevX] + numpy.where(prevGaps[prevX], weights["extend"], weights["open"])
+                scoreLeft = prev1[X] + numpy.where(prevGaps[X], weights["extend"], weights["open"])
+                # The same tie-breaking as in getBestMoveScore
+                diagonal = (scoreDiagonal > scoreUp) & (scoreDiagonal > scoreLeft)
+                up = ~diagonal & (scoreUp > scoreLeft) & (scoreUp > scoreDiagonal)
+                current[X] = numpy.where(diagonal, scoreDiagonal, numpy.where(up, scoreUp, scoreLeft))
+                currentGaps[X] = ~diagonal
+                # The same tie-breaking as in move
+                moveDiagonal = (prev2[prevX] >= prev1[prevX]) & (prev2[prevX] >= prev1[X])
+                moveUp = ~moveDiagonal & (prev1[prevX] >= prev1[X])
+                moves[k] = (innerLo, numpy.where(moveDiagonal, 0, numpy.where(moveUp, 1, 2)).astype(numpy.int8))
+        # Cells outside the range are unreachable for the next anti-diagonals
+        if lo > 0:
+            current[lo - 1] = -numpy.inf
+        current[hi + 1] = -numpy.inf
+    # Find a path from the lower right corner to (0,0)
+    x, y = columns - 1, rows - 1
+    traversal = []
+    while x != 0 or y != 0:
+        traversal.append((x, y))
+        if x == 0:
+            y -= 1
+        elif y == 0:
+            x -= 1
+        else:
+            first, diagonalMoves = moves[x + y]
+            step = diagonalMoves[x - first]
+            if step == 0:
+                x, y = x - 1, y - 1
+            elif step == 1:
+                x -= 1
+            else:
+                y -= 1
+    traversal.append((0, 0))
+    traversal.reverse()
+    return traversal
+
 ###############################################################################
 # Traversal to Alignment
 ###############################################################################
@@ -156,8 +258,13 @@ def fastAlign(target, source):
             j += 1
     return fa
 
-def align(stringA, stringB, weights=None, verbose=False):
-    alignedA = alignedB = diff = offsets = traversal = None
+def align(stringA, stringB, weights=None, verbose=False, band=None):
+    """
+    Align two strings or lists. The NumPy implementation is used when available. 
+    
+    @param band: Limit the alignment to a diagonal band of this width (None for the full matrix)
+    """
+    alignedA = alignedB = diff = offsets = traversal = matrix = None
     mode = None
     if stringA == stringB:
         alignedA = stringA
@@ -175,8 +282,11 @@ def align(stringA, stringB, weights=None, verbose=False):
             offsets = fa["offsets"]
     if mode == None:
         mode = "matrix"
-        matrix = buildScoringMatrix(stringA, stringB, weights)
-        traversal = getTraversal(matrix)
+        if numpyAvailable:
+            traversal = getTraversalNumPy(stringA, stringB, weights, band)
+        else:
+            matrix = buildScoringMatrix(stringA, stringB, weights)
+            traversal = getTraversal(matrix)
         alignedA, alignedB, diff, offsets = getAlignment(stringA, stringB, matrix, traversal)
     if verbose:
         print >> sys.stderr, "alignment mode:", mode
@@ -14,7 +14,17 @@ class ClusterConnection(UnixConnection):
         self.jobTemplate = None
     
     def getJobStatus(self, job):
-        jobAttr = self._readJobFile(job)
+        return self.getJobStatuses([job])[job]
+    
+    def getJobStatuses(self, jobs):
+        # All job files are read with a single command
+        jobAttrs = self._readJobFiles(jobs)
+        statuses = {}
+        for job in jobs:
+            statuses[job] = self._getJobStatusFromAttr(jobAttrs[job])
+        return statuses
+    
+    def _getJobStatusFromAttr(self, jobAttr):
         # Check whether job exists
         if jobAttr == None:
             return None
@@ -53,19 +53,33 @@ class SLURMConnection(ClusterConnection):
         return self._writeJobFile(jobDir, jobName, {"SLURMID":jobId}, append=True)
     
     def getJobStatus(self, job):
-        jobAttr = self._readJobFile(job)
+        return self.getJobStatuses([job])[job]
+    
+    def getJobStatuses(self, jobs):
+        # The job files are read and the SLURM job states queried with one command each
+        jobAttrs = self._readJobFiles(jobs)
+        slurmIds = [jobAttrs[x]["SLURMID"] for x in jobs if jobAttrs[x] != None and "SLURMID" in jobAttrs[x]]
+        sacctLines = []
+        if len(slurmIds) > 0:
+            sacctLines = self.run("sacct -u " + self.getUserName() + " -j " + ",".join(slurmIds))
+        statuses = {}
+        for job in jobs:
+            statuses[job] = self._getSLURMJobStatus(jobAttrs[job], sacctLines)
+        return statuses
+    
+    def _getSLURMJobStatus(self, jobAttr, sacctLines):
         # Check whether job exists
         if jobAttr == None:
             return None
         if "SLURMID" not in jobAttr:
             return "FAILED" # submitting the job failed
-        for line in self.run("sacct -u " + self.getUserName() + " -j " + jobAttr["SLURMID"]):
+        for line in sacctLines:
             line = line.strip()
             splits = line.split()
             #if self.debug:
             #    print >> sys.stderr, "sacct line:", line
             #print splits
-            if splits[0] == jobAttr["SLURMID"]:
+            if len(splits) > 0 and splits[0] == jobAttr["SLURMID"]:
                 if self.debug:
                     print >> sys.stderr, "sacct:", line
                 jobStatus = splits[5]
@@ -3,6 +3,7 @@ import subprocess
 import getpass
 import time
 import atexit, signal
+import threading, select, fcntl, errno
 sys.path.append(os.path.normpath(os.path.abspath(os.path.dirname(__file__))+"/../.."))
 from Utils.Timer import Timer
 import Utils.Settings as Settings
@@ -11,6 +12,9 @@ import tempfile
 
 class UnixConnection:
     #programGroupSet = False
+    _localProcesses = {} # job:threading.Event, set when the process of a local job submitted by this program exits
+    _exitPipe = None # (read, write) descriptors of a pipe written to whenever a local job process exits
+    _exitPipePid = None # the process that owns the exit pipe and the watched local processes
     
     def __init__(self, account=None, workdir=None, settings=None, memory=None, cores=None, jobLimit=None, killGroup=True, preamble=None, debug=False):
         self.account = account
@@ -309,22 +313,48 @@ class UnixConnection:
         return self._getJobPath(jobDir, jobName)
     
     def _readJobFile(self, job):
-        jobPath = self.getRemotePath(job)
-        if not self.exists(jobPath):
+        return self._readJobFiles([job])[job]
+    
+    def _readJobFiles(self, jobs):
+        """
+        Read the attributes of several job files. Local files are read directly and remote
+        files with a single command.
+        """
+        jobPaths = [self.getRemotePath(x) for x in jobs]
+        jobLines = {}
+        if self.account == None: # a local process
+            for job, jobPath in zip(jobs, jobPaths):
+                if os.path.exists(jobPath):
+                    f = open(jobPath, "rt")
+                    jobLines[job] = f.readlines()
+                    f.close()
+        else:
+            script = " ; ".join(["echo TEES_JOB_FILE " + x + " ; cat " + x + " 2> /dev/null || echo TEES_JOB_MISSING" for x in jobPaths])
+            jobIndex = None
+            for line in self.run(script):
+                if line.startswith("TEES_JOB_FILE "):
+                    jobIndex = jobPaths.index(line.strip().split(" ", 1)[1])
+                    jobLines[jobs[jobIndex]] = []
+                elif line.startswith("TEES_JOB_MISSING"):
+                    del jobLines[jobs[jobIndex]]
+                else:
+                    jobLines[jobs[jobIndex]].append(line)
+        jobAttrs = {}
+        for job, jobPath in zip(jobs, jobPaths):
+            if job not in jobLines:
+                if self.debug:
+                    print >> sys.stderr, "Job status file", jobPath, "does not exist"
+                jobAttrs[job] = None
+                continue
             if self.debug:
-                print >> sys.stderr, "Job status file", jobPath, "does not exist"
-            return None
-        jobLines = self.run("cat " + jobPath)
-        if self.debug:
-            print >> sys.stderr, "Job status file", jobPath, "=", jobLines
-        #localJobFile = open(self.download(job), "rt")
-        attrDict = {}
-        for line in jobLines: #localJobFile:
-            key, value = line.strip().split("=", 1)
-            assert key not in attrDict, (key, value, attrDict, jobLines)
-            attrDict[key] = value
-        #localJobFile.close()
-        return attrDict
+                print >> sys.stderr, "Job status file", jobPath, "=", jobLines[job]
+            attrDict = {}
+            for line in jobLines[job]:
+                key, value = line.strip().split("=", 1)
+                assert key not in attrDict, (key, value, attrDict, jobLines[job])
+                attrDict[key] = value
+            jobAttrs[job] = attrDict
+        return jobAttrs
     
     def submit(self, script=None, jobDir=None, jobName=None, stdout=None, stderr=None):
         """
@@ -360,6 +390,8 @@ class UnixConnection:
         # only those programs whose STIME < 'time' are considered.
         jobArgs = {"PID":jobPopen.pid, "time":time.time() + 10}
         job = self._writeJobFile(jobDir, jobName, jobArgs, append=True)
+        if self.account == None: # the process is used for following the job
+            UnixConnection._watchLocalProcess(job, jobPopen)
         # Keep track of log files so they can be closed
         if logFiles != [None, None]:
             assert job not in self._logs
@@ -391,6 +423,12 @@ class UnixConnection:
             return getpass.getuser() #os.getlogin()
             
     def getNumJobs(self, includeQueued=True):
+        if self.account == None: # count the running local jobs
+            localProcesses = UnixConnection._getLocalProcesses()
+            for job in localProcesses.keys():
+                if localProcesses[job].isSet():
+                    del localProcesses[job]
+            return len(localProcesses)
         #stdoutLines = self.run("ps -u " + self.getUserName())
         stdoutLines = self.run("ps -u " + self.getUserName() + " -o ppid")
         groupId = str(os.getpgrp())
@@ -415,6 +453,10 @@ class UnixConnection:
             if verbose:
                 sleepString = " [          ]     "
                 print >> sys.stderr, "\rWaiting for " + str(numJobs) + " on " + accountName + " (limit=" + str(targetCount) + ")", waitTimer.elapsedTimeToString() + sleepString,
+            if self.account == None: # the local jobs are counted from their processes
+                self._waitForLocalProcesses(UnixConnection._getLocalProcesses().keys()) # blocks until a process exits
+                numJobs = self.getNumJobs()
+                continue
             while sleepTimer.getElapsedTime() < pollIntervalSeconds:
                 if verbose:
                     steps = int(10 * sleepTimer.getElapsedTime() / pollIntervalSeconds) + 1
@@ -424,47 +466,139 @@ class UnixConnection:
             numJobs = self.getNumJobs()
         print >> sys.stderr, "\nAll jobs done"
     
+    @classmethod
+    def _watchLocalProcess(cls, job, process):
+        """
+        Follow the process of a local job in a thread, which marks the exit of the process
+        with the job's event and a byte written to the exit pipe.
+        """
+        exitPipe = cls._getExitPipe()
+        exited = threading.Event()
+        cls._getLocalProcesses()[job] = exited
+        def watch():
+            process.wait()
+            exited.set()
+            os.write(exitPipe[1], "x")
+        watcher = threading.Thread(target=watch)
+        watcher.daemon = True
+        watcher.start()
+    
+    @classmethod
+    def _getExitPipe(cls):
+        """
+        Return the exit pipe of the current process. A forked process (e.g. a multiprocessing
+        worker) gets a new pipe, and does not follow the jobs of its parent, whose watcher 
+        threads do not exist in the fork.
+        """
+        if UnixConnection._exitPipePid != os.getpid():
+            if UnixConnection._exitPipe != None: # inherited from the parent process
+                os.close(UnixConnection._exitPipe[0])
+                os.close(UnixConnection._exitPipe[1])
+            UnixConnection._exitPipe = os.pipe()
+            readEnd = UnixConnection._exitPipe[0]
+            fcntl.fcntl(readEnd, fcntl.F_SETFL, fcntl.fcntl(readEnd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            UnixConnection._exitPipePid = os.getpid()
+            UnixConnection._localProcesses = {}
+        return UnixConnection._exitPipe
+    
+    @classmethod
+    def _getLocalProcesses(cls):
+        """
+        Return the job:threading.Event dictionary of the local jobs submitted by the current process
+        """
+        cls._getExitPipe()
+        return UnixConnection._localProcesses
+    
+    def _waitForLocalProcesses(self, jobs, timeout=None):
+        """
+        Block until a local process exits or the timeout (in seconds, None for no timeout) is reached.
+        Returns False if none of the jobs has a running local process to wait for.
+        """
+        exitPipe = UnixConnection._getExitPipe()
+        localProcesses = UnixConnection._getLocalProcesses()
+        running = [x for x in jobs if x in localProcesses and not localProcesses[x].isSet()]
+        if len(running) == 0:
+            return False
+        readable = select.select([exitPipe[0]], [], [], timeout)[0]
+        if len(readable) > 0:
+            try:
+                os.read(exitPipe[0], 4096) # consume the exit notifications
+            except OSError, e: # the read end is non-blocking
+                if e.errno != errno.EAGAIN:
+                    raise
+        return True
+    
     def waitForJob(self, job, pollIntervalSeconds=10):
+        while self._waitForLocalProcesses([job]): # the local process writes the return code before exiting
+            pass
+        sleepTime = 1
         while self.getJobStatus(job) not in ["FINISHED", "FAILED"]:
-            time.sleep(pollIntervalSeconds)
+            time.sleep(sleepTime)
+            sleepTime = min(2 * sleepTime, pollIntervalSeconds)
     
     def waitForJobs(self, jobs, pollIntervalSeconds=60, timeout=None, verbose=True):
+        """
+        Wait for the jobs to finish. If only local jobs are left, waiting blocks until one
+        of their processes exits. Other jobs are polled at intervals that grow up to 
+        pollIntervalSeconds while the job statuses don't change.
+        """
         print >> sys.stderr, "Waiting for results"
         waitTimer = Timer()
+        sleepTime = 1
+        prevStatuses = None
         while(True):
+            statuses = self.getJobStatuses(jobs)
             jobStatus = {"FINISHED":0, "QUEUED":0, "FAILED":0, "RUNNING":0}
             for job in jobs:
-                jobStatus[self.getJobStatus(job)] += 1
+                jobStatus[statuses[job]] += 1
             jobStatusString = str(jobStatus["QUEUED"]) + " queued, " + str(jobStatus["RUNNING"]) + " running, " + str(jobStatus["FINISHED"]) + " finished, " + str(jobStatus["FAILED"]) + " failed"
             if jobStatus["QUEUED"] + jobStatus["RUNNING"] == 0:
                 if verbose:
                     print >> sys.stderr, "\nAll runs done (" + jobStatusString + ")"
                 break
             # decide what to do
-            if timeout == None or timeoutTimer.getElapsedTime() < timeout:
-                sleepTimer = Timer()
+            if timeout == None or waitTimer.getElapsedTime() < timeout:
+                if statuses != prevStatuses: # poll again soon after a change
+                    sleepTime = 1
+                else:
+                    sleepTime = min(2 * sleepTime, pollIntervalSeconds)
+                prevStatuses = statuses
                 accountName = self.account
                 if self.account == None:
                     accountName = "local"
                 if verbose:
-                    sleepString = " [          ]     "
-                    print >> sys.stderr, "\rWaiting for " + str(len(jobs)) + " on " + accountName + "(" + jobStatusString + "),", waitTimer.elapsedTimeToString() + sleepString,
-                while sleepTimer.getElapsedTime() < pollIntervalSeconds:
-                    if verbose:
-                        steps = int(10 * sleepTimer.getElapsedTime() / pollIntervalSeconds) + 1
-                        sleepString = " [" + steps * "." + (10-steps) * " " + "]     "
-                        print >> sys.stderr, "\rWaiting for " + str(len(jobs)) + " on " + accountName + "(" + jobStatusString + "),", waitTimer.elapsedTimeToString() + sleepString,
-                    time.sleep(5)                
+                    print >> sys.stderr, "\rWaiting for " + str(len(jobs)) + " on " + accountName + "(" + jobStatusString + "),", waitTimer.elapsedTimeToString() + "     ",
+                unfinished = [x for x in jobs if statuses[x] in ("QUEUED", "RUNNING")]
+                if all([x in UnixConnection._getLocalProcesses() for x in unfinished]): # no polling needed
+                    waitTime = None if timeout == None else max(0, timeout - waitTimer.getElapsedTime())
+                    self._waitForLocalProcesses(unfinished, waitTime)
+                elif not self._waitForLocalProcesses(unfinished, sleepTime):
+                    time.sleep(sleepTime)
             else:
                 if verbose:
-                    print >> sys.stderr, "\nTimed out, ", trainTimer.elapsedTimeToString()
+                    print >> sys.stderr, "\nTimed out, ", waitTimer.elapsedTimeToString()
                 break
         return jobStatus
     
+    def getJobStatuses(self, jobs):
+        """
+        Get the status for several jobs at once, as a dictionary of job:status
+        """
+        statuses = {}
+        for job in jobs:
+            statuses[job] = self.getJobStatus(job)
+        return statuses
+    
     def getJobStatusByName(self, jobDir, jobName):
         return self.getJobStatus(self._getJobPath(jobDir, jobName))
     
     def getJobStatus(self, job):
+        # Check a local process
+        localProcesses = UnixConnection._getLocalProcesses()
+        if job in localProcesses:
+            if not localProcesses[job].isSet():
+                return "RUNNING"
+            del localProcesses[job] # the job has written its return code
         # Get jobfile
         jobAttr = self._readJobFile(job)
         # Check whether job exists
@@ -25,6 +25,10 @@ EVALUATOR["REN11_DEVEL-gold"] = "BioNLP-ST_2011_bacteria_rename_dev_data.tar.gz"
 EVALUATOR["CO11_DEVEL-gold"] = "BioNLP-ST_2011_coreference_development_data.tar.gz"
 EVALUATOR["GE09_DEVEL-gold"] = "bionlp09_shared_task_development_data_rev1_for_evaluator.tar.gz"
 EVALUATOR["GRN13_DEVEL-gold"] = "BioNLP-ST-2013_Gene_Regulation_Network_dev.tar.gz"
+# Tasks evaluated with the in-process evaluator (Evaluators/BioNLPEventEvaluator.py) instead of the official tools.
+# Opt-in (e.g. ["GE11", "GE09"]): add a task only after "Evaluators/BioNLPEventEvaluator.py --parity" reports
+# no differences from a2-evaluate.pl on its devel set.
+NATIVE_EVALUATOR_TASKS = []
 
 
 # A dictionary for installation URLs. If there is a problem with a 
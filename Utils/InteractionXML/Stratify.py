@@ -9,6 +9,13 @@ except ImportError:
 import Utils.ElementTreeUtils as ETUtils
 import re
 from random import Random
+import multiprocessing
+try:
+    import numpy
+    numpy.array([])
+    numpyAvailable = True
+except:
+    numpyAvailable = False
 
 def getCounts(document):
     counts = {}
@@ -40,7 +47,113 @@ def getDistance(fractionsA, fractionsB, allKeys):
         distances.append(abs(fractionsA.get(key, 0) - fractionsB.get(key, 0)))
     return sum(distances) / len(distances)
 
-def stratify(input, output, oldSetMatch=None, newSetCutoffs=None, rounds=100000, seed=1):
+def getCountMatrix(documents, docCounts, allKeys):
+    """
+    Build a documents x interaction types count matrix (a list of rows if NumPy is not available)
+    """
+    rows = [[docCounts[document].get(key, 0) for key in allKeys] for document in documents]
+    if numpyAvailable:
+        return numpy.array(rows, dtype=numpy.int64).reshape((len(documents), len(allKeys)))
+    return rows
+
+def addRows(totals, plus, minus):
+    if numpyAvailable:
+        return totals + plus - minus
+    return [x + y - z for x, y, z in zip(totals, plus, minus)]
+
+def getSetDistance(totals, fullFractions):
+    """
+    The average distance of a set's type fractions from the full corpus fractions, computed 
+    from its type totals. The distances are summed in key order, so the result equals that
+    of getDistance for the same totals.
+    """
+    if numpyAvailable:
+        total = float(totals.sum())
+        fractions = totals / total if total > 0 else numpy.zeros(len(fullFractions))
+        return numpy.cumsum(numpy.abs(fractions - fullFractions))[-1] / len(fullFractions)
+    total = float(sum(totals))
+    fractions = [x / total for x in totals] if total > 0 else [0] * len(fullFractions)
+    return sum([abs(x - y) for x, y in zip(fractions, fullFractions)]) / len(fullFractions)
+
+def stratifyCounts(counts, fullFractions, cutoffs, rounds, seed, verbose=False):
+    """
+    Randomly divide the documents into sets and swap documents between the sets when the swap 
+    brings the type distributions of the two sets closer to that of the full corpus. A swap 
+    only updates the type totals of the two sets, and the sets are lists of document indices
+    where the swapped documents are removed by position.
+    
+    @param counts: the documents x types count matrix
+    @param cutoffs: the cumulative fractions of the sets, ordered by fraction
+    @return: the document indices of each set, the set type totals, the pairwise set distances and the swap statistics
+    """
+    random = Random(seed)
+    numSets = len(cutoffs)
+    setNames = sorted([x["name"] for x in cutoffs])
+    cutoffSets = [setNames.index(x["name"]) for x in cutoffs]
+    sets = [[] for x in setNames]
+    for docIndex in range(len(counts)):
+        cutoff = random.random()
+        for i in range(len(cutoffs)):
+            if cutoff <= cutoffs[i]["cutoff"]:
+                sets[cutoffSets[i]].append(docIndex)
+                break
+            if i == len(cutoffs) - 1:
+                raise Exception("No set " + str(cutoff))
+    if numpyAvailable:
+        setTotals = [counts[setIndices].sum(axis=0) for setIndices in sets]
+    else:
+        setTotals = [[sum(x) for x in zip(*[counts[i] for i in setIndices])] or [0] * len(fullFractions) for setIndices in sets]
+    setDistances = [[None] * numSets for x in range(numSets)]
+    for a in range(numSets - 1):
+        for b in range(a + 1, numSets):
+            setDistances[a][b] = 0.5 * (getSetDistance(setTotals[a], fullFractions) + getSetDistance(setTotals[b], fullFractions))
+    if verbose:
+        print "Initial document counts", {setNames[x]:len(sets[x]) for x in range(numSets)}
+        print "Initial distances", {setNames[a]:{setNames[b]:setDistances[a][b] for b in range(a + 1, numSets)} for a in range(numSets - 1)}
+    
+    isEmpty = [sum(row) == 0 for row in counts]
+    setOrder = range(numSets)
+    stats = defaultdict(int)
+    for i in range(0, rounds):
+        random.shuffle(setOrder)
+        a = setOrder[0]
+        b = setOrder[1]
+        if a > b:
+            a, b = b, a
+        setA = sets[a]
+        setB = sets[b]
+        posA = random.randrange(0, len(setA))
+        posB = random.randrange(0, len(setB))
+        docA = setA[posA]
+        docB = setB[posB]
+        if isEmpty[docA] and isEmpty[docB]:
+            stats["empty-pair"] += 1
+            continue
+        newTotalsA = addRows(setTotals[a], counts[docB], counts[docA])
+        newTotalsB = addRows(setTotals[b], counts[docA], counts[docB])
+        avgDistance = 0.5 * (getSetDistance(newTotalsA, fullFractions) + getSetDistance(newTotalsB, fullFractions))
+        if setDistances[a][b] > avgDistance:
+            setTotals[a] = newTotalsA
+            setTotals[b] = newTotalsB
+            setDistances[a][b] = avgDistance
+            del setA[posA]
+            del setB[posB]
+            setA.append(docB)
+            setB.append(docA)
+            stats["swaps"] += 1
+            stats["last-swap-round"] = i
+        stats["rounds"] += 1
+    return sets, setTotals, setDistances, dict(stats)
+
+def _stratifyCounts(args):
+    return stratifyCounts(*args)
+
+def stratify(input, output, oldSetMatch=None, newSetCutoffs=None, rounds=100000, seed=1, restarts=1, workers=1):
+    """
+    Divide the documents into new sets with interaction type distributions close to that of 
+    the whole corpus. With restarts > 1 the stratification is repeated with consecutive seeds
+    (in a process pool if workers > 1) and the sets closest to the corpus distribution are used.
+    """
     print >> sys.stderr, "##### Stratify Sets #####"
     print >> sys.stderr, "Loading corpus file", input
     corpusTree = ETUtils.ETFromObj(input)
@@ -85,84 +198,41 @@ def stratify(input, output, oldSetMatch=None, newSetCutoffs=None, rounds=100000,
     for document in documents:
         docCounts[document] = getCounts(document)
     
-    print >> sys.stderr, "Using random seed", seed
-    random = Random(seed)
-    
-    newSets = {x:[] for x in newSetNames}
-    for document in documents:
-        cutoff = random.random()
-        for i in range(len(cutoffs)):
-            if cutoff <= cutoffs[i]["cutoff"]:
-                newSets[cutoffs[i]["name"]].append(document)
-                break
-            if i == len(cutoffs) - 1:
-                raise Exception("No set " + str(cutoff))
-    print "Initial document counts", {x:len(newSets[x]) for x in newSets}
     fullFractions = getFractions(getTotals(documents, docCounts))
     print "Full fractions", fullFractions
     allKeys = sorted(fullFractions.keys())
-    setTotals = {x:getTotals(newSets[x], docCounts) for x in newSetNames}
-    print "Initial set totals", setTotals
-    setFractions = {x:getFractions(setTotals[x]) for x in newSetNames}
-    print "Initial set fractions", setFractions
-    setDistances = {}
-    for i in range(len(newSetNames) - 1):
-        for j in range(i + 1, len(newSetNames)):
-            a = newSetNames[i]
-            b = newSetNames[j]
-            distanceA = getDistance(setFractions[a], fullFractions, allKeys)
-            distanceB = getDistance(setFractions[b], fullFractions, allKeys)
-            avgDistance = 0.5 * (distanceA + distanceB)
-            if a > b:
-                a, b = b, a
-            if a not in setDistances:
-                setDistances[a] = {}
-            setDistances[a][b] = avgDistance
-    print "Initial distances", setDistances
+    counts = getCountMatrix(documents, docCounts, allKeys)
+    fullFractionRow = [fullFractions[key] for key in allKeys]
+    if numpyAvailable:
+        fullFractionRow = numpy.array(fullFractionRow)
     
+    print >> sys.stderr, "Using random seed", seed, "with", restarts, "restart(s)"
     print >> sys.stderr, "Swapping documents for", rounds, "rounds"
-    counts = defaultdict(int)
-    for i in range(0, rounds):
-        random.shuffle(newSetNames)
-        a = newSetNames[0]
-        b = newSetNames[1]
-        if a > b:
-            a, b = b, a
-        setA = newSets[a]
-        setB = newSets[b]
-        docA = setA[random.randrange(0, len(setA))]
-        docB = setB[random.randrange(0, len(setB))]
-        if len(docCounts[docA]) == 0 and len(docCounts[docB]) == 0:
-            counts["empty-pair"] += 1
-            continue 
-        newTotalsA = {x:setTotals[a].get(x, 0) - docCounts[docA].get(x, 0) + docCounts[docB].get(x, 0) for x in allKeys}
-        newTotalsB = {x:setTotals[b].get(x, 0) + docCounts[docA].get(x, 0) - docCounts[docB].get(x, 0) for x in allKeys}
-        newFractionsA = getFractions(newTotalsA)
-        newFractionsB = getFractions(newTotalsB)
-        distanceA = getDistance(newFractionsA, fullFractions, allKeys)
-        distanceB = getDistance(newFractionsB, fullFractions, allKeys)
-        avgDistance = 0.5 * (distanceA + distanceB)
-        if setDistances[a][b] > avgDistance:
-            setTotals[a] = newTotalsA
-            setTotals[b] = newTotalsB
-            setDistances[a][b] = avgDistance
-            setA.remove(docA)
-            setB.remove(docB)
-            setA.append(docB)
-            setB.append(docA)
-            counts["swaps"] += 1
-            counts["last-swap-round"] = i
-        counts["rounds"] += 1
+    tasks = [(counts, fullFractionRow, cutoffs, rounds, seed + i, restarts == 1) for i in range(restarts)]
+    if workers > 1 and restarts > 1:
+        pool = multiprocessing.Pool(min(workers, restarts))
+        results = pool.map(_stratifyCounts, tasks)
+        pool.close()
+        pool.join()
+    else:
+        results = [_stratifyCounts(x) for x in tasks]
+    # Use the restart whose sets are on average closest to the corpus distribution
+    restartDistances = [sum([getSetDistance(x, fullFractionRow) for x in result[1]]) / len(newSetNames) for result in results]
+    best = restartDistances.index(min(restartDistances))
+    if restarts > 1:
+        print >> sys.stderr, "Restart distances", restartDistances, "using seed", seed + best
+    sets, setTotals, setDistances, stats = results[best]
     
-    print dict(counts)
-    print "New document counts", {x:len(newSets[x]) for x in newSets}
-    print "New totals", setTotals
-    print "New fractions", {x:getFractions(setTotals[x]) for x in newSetNames}
-    print "New distances", setDistances
+    print stats
+    print "New document counts", {newSetNames[x]:len(sets[x]) for x in range(len(newSetNames))}
+    newTotals = {newSetNames[x]:{allKeys[i]:int(setTotals[x][i]) for i in range(len(allKeys))} for x in range(len(newSetNames))}
+    print "New totals", newTotals
+    print "New fractions", {x:getFractions(newTotals[x]) for x in newSetNames}
+    print "New distances", {newSetNames[a]:{newSetNames[b]:setDistances[a][b] for b in range(a + 1, len(newSetNames))} for a in range(len(newSetNames) - 1)}
     
-    for newSetName in newSetNames:
-        for document in newSets[newSetName]:
-            document.set("set", newSetName)
+    for i in range(len(newSetNames)):
+        for docIndex in sets[i]:
+            documents[docIndex].set("set", newSetNames[i])
     
     if output != None:
         print >> sys.stderr, "Writing output to", output
@@ -177,6 +247,9 @@ if __name__=="__main__":
     optparser.add_option("-s", "--sourceSets", default=None, help="")
     optparser.add_option("-n", "--newSets", default=None, help="")
     optparser.add_option("-r", "--rounds", default=100000, type=int, help="")
+    optparser.add_option("--seed", default=1, type=int, help="Random seed")
+    optparser.add_option("--restarts", default=1, type=int, help="Number of stratification runs with consecutive seeds")
+    optparser.add_option("-w", "--workers", default=1, type=int, help="Number of processes for the restarts")
     (options, args) = optparser.parse_args()
 
-    stratify(options.input, options.output, options.sourceSets, options.newSets, options.rounds)
\ No newline at end of file
+    stratify(options.input, options.output, options.sourceSets, options.newSets, options.rounds, options.seed, options.restarts, options.workers)
\ No newline at end of file
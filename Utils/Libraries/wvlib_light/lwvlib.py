@@ -6,6 +6,9 @@ from __future__ import print_function
 wv=lwvlib.load("somefile.bin",10000,500000)
 wv=lwvlib.WV.load("somefile.bin",10000,500000)
 
+#Same, but build (on the first load) and use the index "somefile.bin.index.npz" to skip scanning the file
+wv=lwvlib.load("somefile.bin",10000,500000,use_index=True)
+
 wv.max_rank_mem
 wv.max_rank
 
@@ -65,27 +68,115 @@ class WV(object):
                 raise ValueError("preliminary end of file")
             chars.append(c)
         wrd=b''.join(chars).strip()
+        return WV.decode_word(wrd)
+        
+    
+    @staticmethod
+    def decode_word(wrd):
         try:
             return wrd.decode("utf-8")
         except UnicodeDecodeError:
             #Not a utf-8, shoots, what now?
             #maybe I should warn here TODO
             return wrd.decode("utf-8","replace")
-        
-    
+
+    @classmethod
+    def decode_words(cls,raw_words):
+        """
+        Decodes a list of words, all at once if they are valid utf-8
+        """
+        try:
+            return b"\n".join(raw_words).decode("utf-8").split(u"\n") if len(raw_words)>0 else []
+        except UnicodeDecodeError:
+            return [cls.decode_word(w) for w in raw_words]
+
+    @staticmethod
+    def scan_words(mm,pos,count,vsize):
+        """
+        Scans `count` words starting at byte `pos` of the memory-mapped file
+        Returns the raw words, the offsets of their vectors and the position after the last vector
+        """
+        words=[]
+        offsets=[]
+        find=mm.find
+        vbytes=vsize*4 #4 is the size of float32
+        for idx in range(count):
+            end=find(b' ',pos)
+            if end==-1:
+                raise ValueError("preliminary end of file")
+            words.append(mm[pos:end].strip())
+            pos=end+1
+            offsets.append(pos)
+            pos+=vbytes
+        return words,offsets,pos
+
+    @staticmethod
+    def read_vectors(mm,offsets,vsize,float_type=numpy.float32,chunk=10000):
+        """
+        Reads the vectors starting at `offsets` into a matrix. If the vectors are evenly spaced
+        in the file, a strided view to the memory-mapped file is returned without copying.
+        """
+        if len(offsets)==0:
+            return numpy.zeros((0,vsize),float_type)
+        offsets=numpy.asarray(offsets,numpy.int64)
+        strides=numpy.unique(numpy.diff(offsets))
+        if float_type==numpy.float32 and len(strides)<=1:
+            stride=int(strides[0]) if len(strides)==1 else vsize*4
+            return numpy.ndarray((len(offsets),vsize),numpy.float32,mm,int(offsets[0]),(stride,4))
+        data=numpy.zeros((len(offsets),vsize),float_type)
+        columns=numpy.arange(vsize,dtype=numpy.int64)
+        for shift in range(4): #view the file as floats starting from each byte alignment
+            selected=numpy.nonzero(offsets%4==shift)[0]
+            if len(selected)==0:
+                continue
+            floats=numpy.frombuffer(mm,numpy.float32,(len(mm)-shift)//4,shift)
+            for start in range(0,len(selected),chunk): #gather the rows in chunks to limit the size of the index array
+                rows=selected[start:start+chunk]
+                data[rows]=floats[((offsets[rows]-shift)//4)[:,None]+columns]
+        return data
+
+    @classmethod
+    def read_index(cls,file_name,index_name):
+        """
+        Reads a sidecar index written by write_index, or returns None if it doesn't match the file
+        """
+        if not os.path.exists(index_name):
+            return None
+        stat=os.stat(file_name)
+        index=numpy.load(index_name)
+        if int(index["file_size"])!=stat.st_size or float(index["file_mtime"])!=stat.st_mtime:
+            return None
+        words=index["words"].tobytes().split(b"\n") if len(index["offsets"])>0 else []
+        return words,index["offsets"],index["norms"],int(index["vsize"])
+
     @classmethod
-    def load(cls,file_name,max_rank_mem=None,max_rank=None,float_type=numpy.float32):
+    def write_index(cls,file_name,index_name,words,offsets,norms,vsize):
+        """
+        Writes the vocabulary, the vector offsets and the vector norms of a w2v bin file into a sidecar index
+        """
+        stat=os.stat(file_name)
+        temp_name=index_name+".tmp.npz" #numpy.savez adds the .npz suffix if missing
+        numpy.savez(temp_name,words=numpy.frombuffer(b"\n".join(words),numpy.uint8),offsets=numpy.asarray(offsets,numpy.int64),
+                    norms=norms,vsize=vsize,file_size=stat.st_size,file_mtime=stat.st_mtime)
+        os.rename(temp_name,index_name)
+
+    @classmethod
+    def load(cls,file_name,max_rank_mem=None,max_rank=None,float_type=numpy.float32,use_index=False):
         """
         Loads a w2v bin file. 
         `inp` an open file or a file name
         `max_rank_mem` read up to this many vectors into an internal matrix, the rest is memory-mapped
         `max_rank` read up to this many vectors, memory-mapping whatever above max_rank_mem
         `float_type` the type of the vector matrix
+        `use_index` use (and if needed, build) a sidecar index file_name+".index.npz" with the vocabulary, offsets and norms of all vectors
         """
-        f=open(file_name,"r+b")
+        f=open(file_name,"rb")
+        fm=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        f.close()
         #Read the size line
         try:
-            l=f.readline().strip()
+            header_end=fm.find(b"\n")
+            l=fm[0:header_end].strip()
             wcount,vsize=l.split()
             wcount,vsize=int(wcount),int(vsize)
         except ValueError:
@@ -97,31 +188,38 @@ class WV(object):
         if max_rank_mem is None or max_rank_mem>max_rank:
             max_rank_mem=max_rank
 
-        #offsets: byte offsets at which the vectors start
-        offsets=[]
+        norms=None
+        index=None
+        if use_index:
+            index_name=file_name+".index.npz"
+            index=cls.read_index(file_name,index_name)
+            if index is None: #scan all the words once to build the index
+                raw_words,offsets,pos=cls.scan_words(fm,header_end+1,wcount,vsize)
+                all_norms=numpy.zeros(wcount,numpy.float32)
+                for start in range(0,wcount,100000):
+                    all_norms[start:start+100000]=numpy.linalg.norm(x=cls.read_vectors(fm,offsets[start:start+100000],vsize),ord=None,axis=1)
+                cls.write_index(file_name,index_name,raw_words,offsets,all_norms,vsize)
+                index=(raw_words,numpy.asarray(offsets,numpy.int64),all_norms,vsize)
+            raw_words,offsets,all_norms,_=index
+            raw_words,offsets=raw_words[:max_rank],offsets[:max_rank].tolist()
+            if float_type==numpy.float32:
+                norms=all_norms[:max_rank_mem]
+        else:
+            #offsets: byte offsets at which the vectors start
+            raw_words,offsets,pos=cls.scan_words(fm,header_end+1,max_rank,vsize)
         #words: the words themselves
-        words=[]
+        words=cls.decode_words(raw_words)
         #data: the vector matrix for the first max_rank vectors
-        data=numpy.zeros((max_rank_mem,vsize),float_type)
-        #Now read one word at a time, fill into the matrix
-        for idx in range(max_rank_mem):
-            words.append(cls.read_word(f))
-            offsets.append(f.tell())
-            data[idx,:]=numpy.fromfile(f,numpy.float32,vsize)
-        #Keep reading, but only remember the offsets
-        for idx in range(max_rank_mem,max_rank):
-            words.append(cls.read_word(f))
-            offsets.append(f.tell())
-            f.seek(vsize*4,os.SEEK_CUR) #seek over the vector (4 is the size of float32)
-        fm=mmap.mmap(f.fileno(),0)
-        return cls(words,data,fm,offsets)
+        data=cls.read_vectors(fm,offsets[:max_rank_mem],vsize,float_type)
+        return cls(words,data,fm,offsets,norms)
     
-    def __init__(self,words,vector_matrix,mm_file,offsets):
+    def __init__(self,words,vector_matrix,mm_file,offsets,norm_constants=None):
         """
         `words`: list of words
         `vector_matrix`: numpy matrix
         `mm_file`: memory-mapped .bin file with the vectors
         `offsets`: for every word, the offset at which its vector starts
+        `norm_constants`: the norms of the rows of vector_matrix, calculated if not given
         """
         self.vectors=vector_matrix #Numpy matrix
         self.words=words #The words to go with them
@@ -130,7 +228,9 @@ class WV(object):
         self.offsets=offsets
         self.max_rank_mem,self.vsize=self.vectors.shape
         #normalization constants for every row
-        self.norm_constants=numpy.linalg.norm(x=self.vectors,ord=None,axis=1)#.reshape(self.max_rank,1) #Column vector of norms
+        if norm_constants is None:
+            norm_constants=numpy.linalg.norm(x=self.vectors,ord=None,axis=1)#.reshape(self.max_rank,1) #Column vector of norms
+        self.norm_constants=norm_constants
         self.size = self.vectors[0].size
     
     def __contains__(self,wrd):
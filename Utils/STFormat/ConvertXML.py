@@ -511,7 +511,7 @@ def mapSTArgumentTargets(stDoc, siteParents, siteOfTypes, tMap, eMap):
                     argsToKeep.append(arg1)
             event.arguments = argsToKeep            
 
-def toSTFormat(input, output=None, outputTag="a2", useOrigIds=False, debug=False, skipArgs=[], validate=True, writeExtra=False, allAsRelations=False, files=None, exportIds=None, clear=True, skipModifiers=False):
+def toSTFormat(input, output=None, outputTag="a2", useOrigIds=False, debug=False, skipArgs=[], validate=True, writeExtra=False, allAsRelations=False, files=None, exportIds=None, clear=True, skipModifiers=False, workers=1):
     print >> sys.stderr, "Loading corpus", input
     corpusTree = ETUtils.ETFromObj(input)
     print >> sys.stderr, "Corpus file loaded"
@@ -535,7 +535,7 @@ def toSTFormat(input, output=None, outputTag="a2", useOrigIds=False, debug=False
     
     if output != None:
         print >> sys.stderr, "Writing output to", output
-        writeSet(documents, output, resultFileTag=outputTag, debug=debug, writeExtra=writeExtra, files=files, clear=clear)
+        writeSet(documents, output, resultFileTag=outputTag, debug=debug, writeExtra=writeExtra, files=files, clear=clear, workers=workers)
     return documents
 
 if __name__=="__main__":
@@ -562,6 +562,7 @@ if __name__=="__main__":
     optparser.add_option("-a", "--task", default=2, type="int", dest="task", help="1 or 2")
     optparser.add_option("-d", "--debug", default=False, action="store_true", dest="debug", help="Verbose output.")
     optparser.add_option("-x", "--extra", default=False, action="store_true", dest="extra", help="Verbose output.")
+    optparser.add_option("-w", "--workers", default=1, type="int", dest="workers", help="Number of processes for loading and writing ST format")
     (options, args) = optparser.parse_args()
     
     options.inputTags = options.inputTags.split(",")
@@ -570,21 +571,21 @@ if __name__=="__main__":
         print >> sys.stderr, "Loading XML"
         xml = ETUtils.ETFromObj(options.input)
         print >> sys.stderr, "Converting to ST Format"
-        toSTFormat(xml, options.output, options.outputTag, options.origIds, debug=options.debug, allAsRelations=options.conversion=="TO-ST-RELATIONS", writeExtra=options.extra)
+        toSTFormat(xml, options.output, options.outputTag, options.origIds, debug=options.debug, allAsRelations=options.conversion=="TO-ST-RELATIONS", writeExtra=options.extra, workers=options.workers)
     elif options.conversion == "TO-XML":
         import STTools
         print >> sys.stderr, "Loading ST format"
-        documents = STTools.loadSet(options.input, "GE", level="a2", sitesAreArguments=options.stSitesAreArguments, a2Tags=options.inputTags, readScores=False, debug=options.debug)
+        documents = STTools.loadSet(options.input, "GE", level="a2", sitesAreArguments=options.stSitesAreArguments, a2Tags=options.inputTags, readScores=False, debug=options.debug, workers=options.workers)
         print >> sys.stderr, "Converting to XML"
         toInteractionXML(documents, options.xmlCorpusName, options.output)
     elif options.conversion == "ROUNDTRIP":
         import STTools
         print >> sys.stderr, "Loading ST format"
-        documents = STTools.loadSet(options.input, "GE", level="a2", sitesAreArguments=options.stSitesAreArguments, a2Tags=options.inputTags, readScores=False, debug=options.debug)
+        documents = STTools.loadSet(options.input, "GE", level="a2", sitesAreArguments=options.stSitesAreArguments, a2Tags=options.inputTags, readScores=False, debug=options.debug, workers=options.workers)
         print >> sys.stderr, "Converting to XML"
         xml = toInteractionXML(documents)
         print >> sys.stderr, "Converting to ST Format"
-        toSTFormat(xml, options.output, options.outputTag, options.origIds, debug=options.debug, writeExtra=options.extra)
+        toSTFormat(xml, options.output, options.outputTag, options.origIds, debug=options.debug, writeExtra=options.extra, workers=options.workers)
     else:
         print >> sys.stderr, "Unknown conversion option", options.conversion
         
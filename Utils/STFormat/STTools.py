@@ -2,12 +2,15 @@ import sys, os, types
 import codecs
 from RemoveDuplicates import removeDuplicateEvents
 import atexit
+import itertools
+import multiprocessing
+from collections import defaultdict
 sysPath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(sysPath)
 import Utils.InteractionXML.InteractionXMLUtils as IXMLUtils
 
 class Document:
-    def __init__(self, id=None, loadFromDir=None, a2Tags=["a2", "rel"], readExtra=False, debug=False, origId=None):
+    def __init__(self, id=None, loadFromDir=None, a2Tags=["a2", "rel"], readExtra=False, debug=False, origId=None, contents=None):
         self.id = id
         self.origId = id if origId == None else origId
         self.text = None
@@ -22,7 +25,7 @@ class Document:
         self.debug = debug
         if loadFromDir != None:
             atexit.register(self._printId)
-            self.load(loadFromDir, a2Tags, readExtra=readExtra)
+            self.load(loadFromDir, a2Tags, readExtra=readExtra, contents=contents)
             atexit._exithandlers.remove((self._printId, (), {}))
         
         if id != None:
@@ -59,68 +62,68 @@ class Document:
         for event in self.events:
             event.connectSites()
 
-    def load(self, dir, a2Tags=["a2", "rel"], readExtra=False):
+    def load(self, dir, a2Tags=["a2", "rel"], readExtra=False, contents=None):
+        """
+        Load the document files from dir, or from contents, a dictionary of
+        file names and their data read from a package
+        """
         if self.debug:
             print >> sys.stderr, "Loading document", self.id
-        a1Path = os.path.join(dir, self.id + ".a1")
-        if os.path.exists(a1Path):
-            self.loadA1(a1Path, readExtra)
+        a1 = self.readFile(dir, self.id + ".a1", contents)
+        if a1 != None:
+            self.loadA1(a1.splitlines(True), readExtra)
         if a2Tags == None:
             return proteins, [], [], [], [], []
         for a2Tag in a2Tags:
-            a2Path = os.path.join(dir, self.id + "." + a2Tag)
-            if os.path.exists(a2Path):
-                self.loadA2(a2Path, readExtra)
-        self.text = None
-        txtPath = os.path.join(dir, self.id + ".txt")
-        if os.path.exists(txtPath):
-            self.loadText(txtPath)
-    
-    def loadA1(self, filename, readExtraLines=False):
-        #f = open(filename)
-        f = codecs.open(filename, "rt", "utf-8")
-        lines = f.readlines()
+            a2 = self.readFile(dir, self.id + "." + a2Tag, contents)
+            if a2 != None:
+                self.loadA2(a2.splitlines(True), readExtra)
+        self.text = self.readFile(dir, self.id + ".txt", contents)
+    
+    def readFile(self, dir, filename, contents=None):
+        if contents != None:
+            if filename not in contents:
+                return None
+            return contents[filename].decode("utf-8")
+        path = os.path.join(dir, filename)
+        if not os.path.exists(path):
+            return None
+        f = codecs.open(path, "rt", "utf-8")
+        text = f.read()
+        f.close()
+        return text
+    
+    def loadA1(self, lines, readExtraLines=False):
+        groups = groupLines(lines)
         count = 0
         protMap = {}
-        for line in lines:
-            if line[0] == "T":
-                protein = readTAnnotation(line, self.debug)
-                self.proteins.append(protein)
-                assert protein.id not in protMap
-                protMap[protein.id] = protein
-                count += 1
-        for line in lines:
-            if line[0] == "*":
-                readStarAnnotation(line, proteins)
-                count += 1
-        for line in lines:
-            if line[0] == "W":
-                self.words.append(readTAnnotation(line))
-                count += 1
-        for line in lines:
-            if line[0] == "R": # in a1-files, "R" refers to dependencies
-                self.dependencies.append(readDependencyAnnotation(line))
-                count += 1
-        for line in lines:
-            if line[0] == "N": # normalization
-                normTarget, normReferent = readNAnnotation(line)
-                protein = protMap[normTarget]
-                assert protein.normalization == None, lines # each entity can have one normalization
-                protein.normalization = normReferent
-                count += 1
-        for line in lines:
-            if line[0] == "X":
-                if readExtraLines:
-                    readExtra(line, self)
-                count += 1
-        #for line in lines:
-        #    if line[0] == "X":
-        #        count += 1
-        for line in lines:
-            if line[0] == "#": # comment line
-                count += 1
+        for i in groups["T"]:
+            protein = readTAnnotation(lines[i], self.debug)
+            self.proteins.append(protein)
+            assert protein.id not in protMap
+            protMap[protein.id] = protein
+            count += 1
+        for i in groups["*"]:
+            readStarAnnotation(lines[i], self.proteins)
+            count += 1
+        for i in groups["W"]:
+            self.words.append(readTAnnotation(lines[i]))
+            count += 1
+        for i in groups["R"]: # in a1-files, "R" refers to dependencies
+            self.dependencies.append(readDependencyAnnotation(lines[i]))
+            count += 1
+        for i in groups["N"]: # normalization
+            normTarget, normReferent = readNAnnotation(lines[i])
+            protein = protMap[normTarget]
+            assert protein.normalization == None, lines # each entity can have one normalization
+            protein.normalization = normReferent
+            count += 1
+        for i in groups["X"]:
+            if readExtraLines:
+                readExtra(lines[i], self)
+            count += 1
+        count += len(groups["#"]) # comment lines
         assert count == len(lines), lines # check that all lines were processed
-        f.close()
         # Mark source file type
         for ann in self.proteins + self.words + self.dependencies:
             ann.fileType = "a1"
@@ -134,119 +137,105 @@ class Document:
                 if not processedLines[i]:
                     print >> sys.stderr, lines[i].strip()
 
-    def loadA2(self, filename, readExtraLines=False):
-        f = codecs.open(filename, "rt", "utf-8")
-        lines = f.readlines()
-        f.close()
+    def loadA2(self, lines, readExtraLines=False):
+        groups = groupLines(lines)
         count = 0
         eventMap = {}
         processedLines = [False] * len(lines)
-        for i in range(len(lines)):
-            line = lines[i]
-            if line[0] == "T":
-                self.triggers.append( readTAnnotation(line, self.debug) )
-                self.triggers[-1].fileType = "a2"
-                processedLines[i] = True
-                count += 1
-        for i in range(len(lines)):
-            line = lines[i]
-            if line[0] == "E" or line[0] == "R":
-                event = readEvent(line, self.debug)
-                self.events.append(event)
-                if event.id in eventMap:
-                    raise Exception("Duplicate event id " + str(event.id) + " in document " + str(self.id))
-                eventMap[self.events[-1].id] = self.events[-1]
-                self.events[-1].fileType = "a2"
-                processedLines[i] = True
-                count += 1
-        for i in range(len(lines)):
-            line = lines[i]
-            if line[0] == "M":
-                mId, rest = line.strip().split("\t")
-                mType, eventId = rest.split()
-                assert mType in ["Speculation", "Negation"], line
-                if ":" in eventId: # BioNLP'16 SeeDev
-                    eventId = eventId.split(":")[-1]
-                if mType == "Speculation":
-                    eventMap[eventId].speculation = mId
-                elif mType == "Negation":
-                    eventMap[eventId].negation = mId
-                processedLines[i] = True
-                count += 1
-        for i in range(len(lines)):
-            line = lines[i]
-            if line[0] == "*":
-                readStarAnnotation(line, self.proteins + self.triggers)
-                processedLines[i] = True
-                count += 1
-        for i in range(len(lines)):
+        for i in groups["T"]:
+            self.triggers.append( readTAnnotation(lines[i], self.debug) )
+            self.triggers[-1].fileType = "a2"
+            processedLines[i] = True
+            count += 1
+        for i in sorted(groups["E"] + groups["R"]):
+            event = readEvent(lines[i], self.debug)
+            self.events.append(event)
+            if event.id in eventMap:
+                raise Exception("Duplicate event id " + str(event.id) + " in document " + str(self.id))
+            eventMap[self.events[-1].id] = self.events[-1]
+            self.events[-1].fileType = "a2"
+            processedLines[i] = True
+            count += 1
+        for i in groups["M"]:
             line = lines[i]
-            if line[0] == "X":
-                if readExtraLines:
-                    readExtra(line, self)
-                processedLines[i] = True
-                count += 1
-        #for i in range(len(lines)):
-        #    line = lines[i]
-        #    if line[0] == "X":
-        #        processedLines[i] = True
-        #        count += 1
-        for i in range(len(lines)):
-            line = lines[i]
-            if line[0] == "#":
-                processedLines[i] = True
-                count += 1
+            mId, rest = line.strip().split("\t")
+            mType, eventId = rest.split()
+            assert mType in ["Speculation", "Negation"], line
+            if ":" in eventId: # BioNLP'16 SeeDev
+                eventId = eventId.split(":")[-1]
+            if mType == "Speculation":
+                eventMap[eventId].speculation = mId
+            elif mType == "Negation":
+                eventMap[eventId].negation = mId
+            processedLines[i] = True
+            count += 1
+        for i in groups["*"]:
+            readStarAnnotation(lines[i], self.proteins + self.triggers)
+            processedLines[i] = True
+            count += 1
+        for i in groups["X"]:
+            if readExtraLines:
+                readExtra(lines[i], self)
+            processedLines[i] = True
+            count += 1
+        for i in groups["#"]:
+            processedLines[i] = True
+            count += 1
         self.showUnprocessedLines(lines, processedLines)
         assert count == len(lines), lines # check that all lines were processed
         self.connectObjects()
         self.connectSites()
     
-    def loadText(self, filename):
-        f = codecs.open(filename, "rt", "utf-8")
-        self.text = f.read()
-        f.close()
-
     def save(self, dir, resultFileTag="a2", debug=False, writeExtra=False, files=["txt", "a1", "a2", "rel"]):
-        id = self.id
-        if not isinstance(id, basestring):
-            id = str(self.id)
         if debug:
-            print id
+            print self.id
         if not os.path.exists(dir):
             os.makedirs(dir)
-        
+        self.prepareSave()
+        for filename, content in self.getFileContents(resultFileTag, debug, writeExtra, files):
+            out = codecs.open(os.path.join(dir, filename), "wt", "utf-8")
+            out.write(content)
+            out.close()
+    
+    def prepareSave(self):
+        """
+        Assign the missing annotation ids and remove duplicate events before writing the document
+        """
         updateIds(self.proteins)
         updateIds(self.triggers, getMaxId(self.proteins) + 1)
         updateIds(self.events)
         
         # Remove duplicate events
         removeDuplicateEvents(self)
-        
+    
+    def getFileContents(self, resultFileTag="a2", debug=False, writeExtra=False, files=["txt", "a1", "a2", "rel"]):
+        """
+        Return the files of a document prepared with prepareSave as a list of (filename, unicode content) pairs
+        """
+        id = self.id
+        if not isinstance(id, basestring):
+            id = str(self.id)
         # id counters
         self._mCounter = 1
         self._xCounter = 1
         
-        # write a1 file
+        contents = []
+        # a1 file
         if self.proteins != None and "a1" in files:
-            out = codecs.open(os.path.join(dir, id + ".a1"), "wt", "utf-8")
-            out.write(self.entitiesToString(self.proteins, writeExtra))
-            out.close()
-        # write a2 (or rel) file
+            contents.append((id + ".a1", self.entitiesToString(self.proteins, writeExtra)))
+        # a2 (or rel) file
         if resultFileTag in files:
-            resultFile = codecs.open(os.path.join(dir, id + "." + resultFileTag), "wt", "utf-8")
-            resultFile.write(self.entitiesToString(self.triggers, writeExtra, getMaxId(self.proteins) + 1))
+            content = self.entitiesToString(self.triggers, writeExtra, getMaxId(self.proteins) + 1)
             if debug: print >> sys.stderr, "Writing events"
-            resultFile.write(self.eventsToString(writeExtra))
-            resultFile.close()
-        # Write txt file
+            contents.append((id + "." + resultFileTag, content + self.eventsToString(writeExtra)))
+        # txt file
         if "txt" in files:
-            out = codecs.open(os.path.join(dir, id + ".txt"), "wt", "utf-8")
-            out.write(self.text)
-            out.close()
+            contents.append((id + ".txt", self.text))
         
         # remove id counters
         del self._mCounter
         del self._xCounter
+        return contents
 
     def entitiesToString(self, entities, writeExtra=False, idStart=0):
         updateIds(entities, idStart)
@@ -539,6 +528,15 @@ def getStatistics(documents, printStats=True, statSeparator="\n"):
         print >> sys.stderr, statSeparator.join([str(key)+":"+str(stats[key]) for key in sorted(stats.keys())])
     return stats
 
+def groupLines(lines):
+    """
+    Group the indices of annotation lines by their first character in a single pass
+    """
+    groups = defaultdict(list)
+    for i in range(len(lines)):
+        groups[lines[i][0]].append(i)
+    return groups
+
 def readCharOffsets(string):
     offsets = []
     splits = string.split(";")
@@ -676,69 +674,126 @@ def readExtra(string, document):
             annotation.extra[key] = value
         prevAnnotation = annotation
 
-def loadSet(path, setName=None, level="a2", sitesAreArguments=False, a2Tags=["a2", "rel"], readScores=False, debug=False, subPath=None, origIdType=None):
+def getPackageFiles(path, subPath=None):
+    """
+    Read the files of the document set directory inside a tar.gz or zip package
+    directly from its members, without extracting the package.
+    
+    @return: the document set directory within the package and a dictionary of file names and their data
+    """
+    if path.endswith(".zip"):
+        import zipfile
+        f = zipfile.ZipFile(path, "r")
+        members = [(x.filename, x) for x in f.infolist() if not x.filename.endswith("/")]
+        readMember = f.read
+    else:
+        import tarfile
+        f = tarfile.open(path, "r")
+        members = [(x.name, x) for x in f.getmembers() if x.isfile()]
+        readMember = lambda x: f.extractfile(x).read()
+    members = [(os.path.normpath(x[0]), x[1]) for x in members]
+    dirs = set()
+    for name, member in members:
+        name = os.path.dirname(name)
+        while name != "":
+            dirs.add(name)
+            name = os.path.dirname(name)
+    # Check if compressed directory is included in the package, like in the ST'11 corpus files
+    dir = ""
+    compressedFilePath = os.path.basename(path)[:-len(".tar.gz")]
+    if compressedFilePath not in dirs:
+        compressedFilePath = os.path.basename(path)[:-len(".tgz")]
+    if compressedFilePath not in dirs: # at least CO training set has a different dirname inside the tarfile
+        compressedFilePath = compressedFilePath.rsplit("_", 1)[0]
+        print >> sys.stderr, "Package name directory does not exist, trying", compressedFilePath
+    if compressedFilePath in dirs:
+        print >> sys.stderr, "Reading document set from compressed filename directory", compressedFilePath
+        dir = compressedFilePath
+    if subPath != None:
+        dir = os.path.normpath(os.path.join(compressedFilePath, subPath))
+    contents = {}
+    for name, member in members:
+        if os.path.dirname(name) == dir:
+            contents[os.path.basename(name)] = readMember(member)
+    f.close()
+    return dir, contents
+
+def _loadDocument(args):
+    id, dir, contents, a2Tags, readScores, debug, origId, setName, license = args
+    doc = Document(id, dir, a2Tags, readScores, debug, origId=origId, contents=contents)
+    doc.dataSet = setName
+    doc.license = license
+    return doc
+
+def _getWorkerChunkSize(numTasks, workers):
+    return max(1, min(100, numTasks / (workers * 4)))
+
+def loadSet(path, setName=None, level="a2", sitesAreArguments=False, a2Tags=["a2", "rel"], readScores=False, debug=False, subPath=None, origIdType=None, workers=1):
+    """
+    Load a set of ST-format documents from a directory, a single txt file or a tar.gz/zip package.
+    With workers > 1 the documents are parsed in a process pool, keeping the order of the documents.
+    """
     assert level in ["txt", "a1", "a2"]
+    contents = None # the file data, if the files are not read from the directory
     if path.endswith(".tar.gz") or path.endswith(".tgz") or path.endswith(".zip"):
-        import tempfile
-        import zipfile
-        import shutil
-        dir = tempfile.mkdtemp()
-        if path.endswith(".zip"):
-            with zipfile.ZipFile(path, "r") as f:
-                f.extractall(dir)
-        else:
-            import tarfile
-            f = tarfile.open(path, "r")
-            f.extractall(dir)
-        # Check if compressed directory is included in the package, like in the ST'11 corpus files
-        compressedFilePath = os.path.join(dir, os.path.basename(path)[:-len(".tar.gz")])
-        if not os.path.exists(compressedFilePath):
-            compressedFilePath = os.path.join(dir, os.path.basename(path)[:-len(".tgz")])
-        if not os.path.exists(compressedFilePath): # at least CO training set has a different dirname inside the tarfile
-            compressedFilePath = compressedFilePath.rsplit("_", 1)[0]
-            print >> sys.stderr, "Package name directory does not exist, trying", compressedFilePath
-        if os.path.exists(compressedFilePath):
-            print >> sys.stderr, "Reading document set from compressed filename directory", compressedFilePath
-            dir = compressedFilePath
-        if subPath != None:
-            dir = os.path.join(compressedFilePath, subPath)
-        f.close()
+        dir, contents = getPackageFiles(path, subPath)
+        origIdDir = os.path.join(path, dir)
     elif path.endswith(".txt"):
-        import tempfile
-        import shutil
-        dir = tempfile.mkdtemp()
-        shutil.copy2(path, os.path.join(dir, os.path.basename(path)))
+        dir = os.path.dirname(path)
+        with open(path, "rb") as f:
+            contents = {os.path.basename(path):f.read()}
+        origIdDir = dir
     else:
         dir = path
+        origIdDir = dir
+    filenames = contents.keys() if contents != None else os.listdir(dir)
     
     ids = set()
-    documents = []
     license = None
-    if os.path.exists(os.path.join(dir, "LICENSE")):
-        licenseFile = open(os.path.join(dir, "LICENSE"), "rt")
-        license = "".join(licenseFile.readlines())
-        licenseFile.close()
+    if "LICENSE" in filenames:
+        if contents != None:
+            license = contents["LICENSE"]
+        else:
+            licenseFile = open(os.path.join(dir, "LICENSE"), "rt")
+            license = "".join(licenseFile.readlines())
+            licenseFile.close()
     origIds = {}
-    for filename in os.listdir(dir):
+    for filename in filenames:
         if filename.endswith(".txt"):
             if filename.startswith("._"): # a hack to skip the broken files in the GRO13 data packages
                 continue
             id = filename.rsplit(".", 1)[0]
             ids.add(id)
-            origIds[id] = IXMLUtils.getOrigId(os.path.join(dir, filename), origIdType)
+            origIds[id] = IXMLUtils.getOrigId(os.path.join(origIdDir, filename), origIdType)
+    tasks = []
     for id in sorted(list(ids)):
-        #print "Loading", id
-        doc = Document(id, dir, a2Tags, readScores, debug, origId=origIds[id])
-        doc.dataSet = setName
-        doc.license = license
-        documents.append(doc)
-    
-    if dir != path:
-        shutil.rmtree(dir)
+        docContents = None
+        if contents != None:
+            docContents = {}
+            for ext in ["a1", "txt"] + (a2Tags if a2Tags != None else []):
+                if id + "." + ext in contents:
+                    docContents[id + "." + ext] = contents[id + "." + ext]
+        tasks.append((id, dir, docContents, a2Tags, readScores, debug, origIds[id], setName, license))
+    contents = None
+    
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(workers)
+        documents = pool.map(_loadDocument, tasks, _getWorkerChunkSize(len(tasks), workers))
+        pool.close()
+        pool.join()
+    else:
+        documents = [_loadDocument(x) for x in tasks]
     return documents
 
-def writeSet(documents, output, resultFileTag="a2", debug=False, writeExtra=False, files=None, clear=True):
-    from collections import defaultdict
+def _getFileContents(args):
+    doc, resultFileTag, writeExtra, files = args
+    return [(x[0], x[1].encode("utf-8")) for x in doc.getFileContents(resultFileTag, False, writeExtra, files)]
+
+def writeSet(documents, output, resultFileTag="a2", debug=False, writeExtra=False, files=None, clear=True, workers=1):
+    """
+    Write a set of ST-format documents into a directory or directly into a tar.gz/zip package. 
+    With workers > 1 the files are formatted in a process pool, keeping the order of the documents.
+    """
     import shutil
     counts = defaultdict(int)
     
@@ -750,13 +805,15 @@ def writeSet(documents, output, resultFileTag="a2", debug=False, writeExtra=Fals
     
     while output.endswith("/"):
         output = output[:-1]
+    packageFile = None
     if output.endswith(".tar.gz") or output.endswith(".zip"):
         assert clear
-        outdir = output + "-temp"
+        packageFile = openPackage(output)
     else:
-        outdir = output
-    if os.path.exists(outdir) and clear:
-        shutil.rmtree(outdir)
+        if os.path.exists(output) and clear:
+            shutil.rmtree(output)
+        if not os.path.exists(output):
+            os.makedirs(output)
 
 #    if not validate:
 #        print "Warning! No validation."
@@ -764,15 +821,49 @@ def writeSet(documents, output, resultFileTag="a2", debug=False, writeExtra=Fals
 #        if validate:
 #            if debug: print >> sys.stderr, "Validating", doc.id
 #            Validate.allValidate(doc, counts, task, verbose=debug)
+        doc.prepareSave()
+    tasks = [(doc, resultFileTag, writeExtra, files) for doc in documents]
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(workers)
+        docFiles = pool.imap(_getFileContents, tasks, _getWorkerChunkSize(len(tasks), workers))
+    else:
+        docFiles = itertools.imap(_getFileContents, tasks)
+    for doc, fileContents in itertools.izip(documents, docFiles):
         if debug: print >> sys.stderr, "Writing", doc.id
-        doc.save(outdir, resultFileTag, writeExtra=writeExtra, files=files)
-        
-    if output.endswith(".tar.gz") or output.endswith(".zip"):
-        assert clear
-        package(outdir, output, ["a1", "txt", resultFileTag, resultFileTag+".scores"])
-        shutil.rmtree(outdir)
+        for filename, content in fileContents:
+            if packageFile != None:
+                addToPackage(packageFile, filename, content)
+            else:
+                with open(os.path.join(output, filename), "wb") as f:
+                    f.write(content)
+    if pool != None:
+        pool.close()
+        pool.join()
+    if packageFile != None:
+        packageFile.close()
 #    print counts
 
+def openPackage(outputFile):
+    if outputFile.endswith(".zip"):
+        import zipfile
+        return zipfile.ZipFile(outputFile, "w")
+    else:
+        import tarfile
+        return tarfile.open(outputFile, "w:gz")
+
+def addToPackage(packageFile, filename, content):
+    if hasattr(packageFile, "writestr"): # zip
+        packageFile.writestr(filename, content)
+    else:
+        import tarfile, time
+        from StringIO import StringIO
+        info = tarfile.TarInfo(filename)
+        info.size = len(content)
+        info.mtime = time.time()
+        info.mode = 0644
+        packageFile.addfile(info, StringIO(content))
+
 # Convenience functions  
 
 def getMaxId(annotations):
@@ -826,6 +917,22 @@ def package(sourceDir, outputFile, includeTags=["a2", "a2.scores"]):
     os.chdir(tempCwd)
     packageFile.close()
 
+def benchmark(input, output, workers, a2Tags=["a2", "rel"]):
+    """
+    Compare the time taken to load and write a document set sequentially and in a process pool
+    """
+    import time
+    results = {}
+    for numWorkers in sorted(set([1, workers])):
+        startTime = time.time()
+        documents = loadSet(input, a2Tags=a2Tags, workers=numWorkers)
+        results[(numWorkers, "load")] = time.time() - startTime
+        startTime = time.time()
+        writeSet(documents, output, workers=numWorkers)
+        results[(numWorkers, "write")] = time.time() - startTime
+        print >> sys.stderr, "Workers", numWorkers, "loaded", len(documents), "documents in", "%.2f" % results[(numWorkers, "load")], "s, wrote them in", "%.2f" % results[(numWorkers, "write")], "s"
+    return results
+
 if __name__=="__main__":
     import sys
     from optparse import OptionParser
@@ -844,9 +951,14 @@ if __name__=="__main__":
     optparser.add_option("-s", "--sentences", default=False, action="store_true", dest="sentences", help="Write each sentence to its own document")
     optparser.add_option("-r", "--origIds", default=False, action="store_true", dest="origIds", help="Use stored original ids (can cause problems with duplicates).")
     optparser.add_option("-a", "--task", default=2, type="int", dest="task", help="1 or 2")
+    optparser.add_option("-w", "--workers", default=1, type="int", dest="workers", help="Number of processes for loading and writing")
+    optparser.add_option("-b", "--benchmark", default=False, action="store_true", dest="benchmark", help="Compare sequential and parallel loading and writing")
     optparser.add_option("-d", "--debug", default=False, action="store_true", dest="debug", help="Verbose output.")
     (options, args) = optparser.parse_args()
     
     assert options.input != options.output
-    documents = loadSet(options.input, "GE", level="a2", sitesAreArguments=False, a2Tag="a2", readScores=False, debug=options.debug)
-    writeSet(documents, options.output, resultFileTag=options.outputTag, debug=options.debug, task=options.task, validate=True, writeScores=False)
+    if options.benchmark:
+        benchmark(options.input, options.output, options.workers)
+    else:
+        documents = loadSet(options.input, "GE", level="a2", sitesAreArguments=False, readScores=False, debug=options.debug, workers=options.workers)
+        writeSet(documents, options.output, resultFileTag=options.outputTag, debug=options.debug, workers=options.workers)
@@ -15,7 +15,7 @@ from Detectors.Preprocessor import Preprocessor
 
 def classify(input, model, output, workDir=None, step=None, omitSteps=None, 
              goldInput=None, detector=None, debug=False, clear=False, 
-             preprocessorTag="-preprocessed.xml.gz", preprocessorParams=None, bioNLPSTParams=None):
+             preprocessorTag="-preprocessed.xml.gz", preprocessorParams=None, bioNLPSTParams=None, binaryExamples=False):
     """
     Detect events or relations from text.
     
@@ -32,6 +32,7 @@ def classify(input, model, output, workDir=None, step=None, omitSteps=None,
     @param preprocessorTag: preprocessor output file will be output + preprocessorTag
     @param preprocessorParams: Optional parameters controlling preprocessing. If None, will be read from model.
     @param bioNLPSTParams: Optional parameters controlling BioNLP ST format output. If None, will be read from model.
+    @param binaryExamples: Write the example files in the binary format of Core.ExampleUtils instead of SVM-light text
     """
     input = os.path.abspath(input)
     if goldInput != None: goldInput = os.path.abspath(goldInput)
@@ -75,6 +76,7 @@ def classify(input, model, output, workDir=None, step=None, omitSteps=None,
     if selector.check("CLASSIFY"):
         detector = getDetector(detector, model)[0]() # initialize detector object
         detector.debug = debug
+        detector.setBinaryExamples(binaryExamples)
         detector.bioNLPSTParams = detector.getBioNLPSharedTaskParams(bioNLPSTParams, model)
         detector.classify(classifyInput, model, output, goldData=goldInput, fromStep=detectorSteps["CLASSIFY"], omitSteps=omitDetectorSteps["CLASSIFY"], workDir=workDir)
 
@@ -155,9 +157,10 @@ if __name__=="__main__":
     optparser.add_option("--omitSteps", default=None, dest="omitSteps", help="")
     optparser.add_option("--clearAll", default=False, action="store_true", dest="clearAll", help="Delete all files")
     optparser.add_option("--debug", default=False, action="store_true", dest="debug", help="More verbose output")
+    optparser.add_option("--binaryExamples", default=False, action="store_true", dest="binaryExamples", help="Write example files in the binary format")
     (options, args) = optparser.parse_args()
     
     assert options.output != None
     classify(options.input, options.model, options.output, options.workdir, options.step, options.omitSteps, 
              options.gold, options.detector, options.debug, options.clearAll,
-             preprocessorParams=options.preprocessorParams, bioNLPSTParams=options.bioNLPSTParams)
+             preprocessorParams=options.preprocessorParams, bioNLPSTParams=options.bioNLPSTParams, binaryExamples=options.binaryExamples)
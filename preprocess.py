@@ -24,6 +24,8 @@ if __name__=="__main__":
 #    debug.add_option("-t", "--toStep", default=None, dest="toStep", help="Stop at after this step")
 #    debug.add_option("--omitSteps", default=None, dest="omitSteps", help="Skip these steps")
     debug.add_option("--logPath", default="AUTO", dest="logPath", help="AUTO, None, or a path")
+    debug.add_option("--streamWindow", default=None, type="int", dest="streamWindow", help="Run consecutive document-local steps as a pipeline over windows of this many documents")
+    debug.add_option("--resumeStream", default=False, action="store_true", dest="resumeStream", help="Reuse the window checkpoints of an interrupted --streamWindow run with the same output")
     #debug.add_option("--intermediateFiles", default=False, action="store_true", dest="intermediateFiles", help="Save an intermediate file for each step")
     debug.add_option("--debug", default=False, action="store_true", dest="debug", help="Set debug mode for all steps")
     optparser.add_option_group(debug)
@@ -39,6 +41,8 @@ if __name__=="__main__":
         print >> sys.stderr, preprocessor.getHelpString()
     else:
         preprocessor.setArgForAllSteps("debug", options.debug)
+        preprocessor.streamWindow = options.streamWindow
+        preprocessor.resumeStream = options.resumeStream
         if preprocessor.hasStep("CONVERT"):
             if options.corpus != None:
                 preprocessor.getStep("CONVERT").setArg("corpusName", options.corpus)
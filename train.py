@@ -29,7 +29,7 @@ def train(output, task=None, detector=None, inputFiles=None, models=None, parse=
           bioNLPSTParams=None, preprocessorParams=None, exampleStyles=None, 
           classifierParams=None,  doFullGrid=False, deleteOutput=False, copyFrom=None, 
           log="log.txt", step=None, omitSteps=None, debug=False, connection=None, subset=None, 
-          folds=None, corpusDir=None, corpusPreprocessing=None, evaluator=None):
+          folds=None, corpusDir=None, corpusPreprocessing=None, evaluator=None, workers=1, binaryExamples=False):
     """
     Train a new model for event or relation detection.
     
@@ -54,6 +54,8 @@ def train(output, task=None, detector=None, inputFiles=None, models=None, parse=
     @param debug: In debug mode, more output is shown, and some temporary intermediate files are saved
     @param connection: A parameter set defining a local or remote connection for training the classifier
     @param subset: A parameter set for making subsets of input files
+    @param workers: The number of processes used for building examples and for the parameter grid
+    @param binaryExamples: Write the example files in the binary format of Core.ExampleUtils instead of SVM-light text
     """
     # Insert default arguments where needed
     inputFiles = setDictDefaults(inputFiles, {"train":None, "devel":None, "test":None})
@@ -109,6 +111,8 @@ def train(output, task=None, detector=None, inputFiles=None, models=None, parse=
         print >> sys.stderr, "Using evaluator", evaluator.__name__
         detector.evaluator = evaluator
     detector.debug = debug
+    detector.setWorkers(workers)
+    detector.setBinaryExamples(binaryExamples)
     detector.bioNLPSTParams = detector.getBioNLPSharedTaskParams(bioNLPSTParams)
     #detector.useBioNLPSTFormat = useBioNLPSTFormat # classify-output and grid evaluation in ST-format
     #detector.stWriteScores = True # write confidence scores into additional st-format files
@@ -672,6 +676,8 @@ if __name__=="__main__":
     debug.add_option("--noLog", default=False, action="store_true", dest="noLog", help="Do not keep a log file")
     debug.add_option("--clearAll", default=False, action="store_true", dest="clearAll", help="Delete all files")
     debug.add_option("--debug", default=False, action="store_true", dest="debug", help="More verbose output")
+    debug.add_option("--workers", default=1, type="int", dest="workers", help="Number of processes for building examples and for the parameter grid")
+    debug.add_option("--binaryExamples", default=False, action="store_true", dest="binaryExamples", help="Write example files in the binary format")
     event.add_option("--subset", default=None, dest="subset", help="")
     event.add_option("--folds", default=None, dest="folds", help="")
     optparser.add_option_group(debug)
@@ -692,4 +698,4 @@ if __name__=="__main__":
           doFullGrid=options.fullGrid, deleteOutput=options.clearAll, copyFrom=options.copyFrom, 
           log=options.log, step=options.step, omitSteps=options.omitSteps, debug=options.debug, 
           connection=options.connection, subset=options.subset, folds=options.folds, corpusDir=options.corpusDir, corpusPreprocessing=options.corpusPreprocess,
-          evaluator=options.evaluator)
+          evaluator=options.evaluator, workers=options.workers, binaryExamples=options.binaryExamples)